@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Provides rolling-origin backtesting of the seasonal ARIMA model, to measure
+how accurate and how fast forecasts with given hyperparameters are. The
+monthly sales series of every recipe is cut off at many points in time
+(origins); for each cutoff, the model is fitted to the months before it and
+forecasts the next horizon months, which are compared with the actual sales.
+All cutoffs of all recipes and hyperparameters are fitted in parallel worker
+processes. The mean absolute percentage error (MAPE), root mean squared error
+(RMSE), and fit time are reported per recipe and hyperparameters, so seasonal
+orders can be compared by their accuracy and their CPU cost, e.g.:
+python backtesting_brewing.py sales.csv --seasonal-order 0,1,0,12
+--seasonal-order 1,1,1,12 --horizon 3
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import argparse
+import math
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from sales_forecast_brewing import aggregate_daily_partials
+from sales_forecast_brewing import define_and_fit_model
+from sales_forecast_brewing import load_csv_daily_partials
+
+def get_cutoffs(num_periods: int, min_train_periods: int, horizon: int,
+                step: int = 1, max_cutoffs: Optional[int] = None) -> List[int]:
+    """Gets cutoffs of a series, i.e. the number of periods fitted to
+
+    Args:
+        num_periods (int): An int representing num of periods of the series
+        min_train_periods (int): An int representing min num of periods the
+            model is fitted to
+        horizon (int): An int representing num of periods forecasted
+        step (int): An int representing num of periods between cutoffs
+        max_cutoffs (int): An int representing max num of cutoffs; the latest
+            are kept; None keeps all
+
+    Returns:
+        (list): A list of ints representing the cutoffs in ascending order;
+            each leaves horizon periods to compare the forecast with
+    """
+    cutoffs = list(range(min_train_periods, num_periods - horizon + 1, step))
+    if max_cutoffs is not None:
+        cutoffs = cutoffs[max(len(cutoffs) - max_cutoffs, 0):]
+    return cutoffs
+
+def backtest_cutoff(series: pd.Series, cutoff: int, order: List[int],
+                    seasonal_order: List[int], horizon: int,
+                    maxiter: Optional[int] = None) -> Dict[str, Any]:
+    """Fits model to the periods before cutoff and forecasts the next ones
+
+    Args:
+        series (pd.Series): A pd.Series representing past monthly sales
+        cutoff (int): An int representing num of periods fitted to
+        order (list): A list representing hyperparameters for the ARIMA model
+        seasonal_order (list): A list repres. hyperparam. of seasonal component
+        horizon (int): An int representing num of periods forecasted
+        maxiter (int): An int representing max num of optimizer iterations;
+            None uses the default of statsmodels
+
+    Returns:
+        (dict): A dict with the arrays "actual" and "predicted", the float
+            "fit_seconds", and the bool "failed"; the arrays are empty if the
+            model can't be fitted
+    """
+    actual = series.iloc[cutoff:cutoff + horizon].to_numpy(dtype=np.float64)
+    start = time.perf_counter()
+    try:
+        # Warnings about non-convergence are expected for short series.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fitted_model = define_and_fit_model(series.iloc[:cutoff], False,
+                                                order, seasonal_order, maxiter)
+            fit_seconds = time.perf_counter() - start
+            predicted = np.asarray(fitted_model.forecast(steps=len(actual)),
+                                   dtype=np.float64)
+    # Fitting fails if e.g. there are too few periods for the orders.
+    except (ValueError, IndexError, np.linalg.LinAlgError):
+        return {"actual": np.empty(0), "predicted": np.empty(0),
+                "fit_seconds": time.perf_counter() - start, "failed": True}
+    return {"actual": actual, "predicted": predicted,
+            "fit_seconds": fit_seconds,
+            "failed": not np.all(np.isfinite(predicted))}
+
+def score_forecasts(actual: np.ndarray, predicted: np.ndarray
+                    ) -> Tuple[float, float]:
+    """Calculates MAPE and RMSE of forecasts
+
+    Args:
+        actual (np.ndarray): An array representing actual sales
+        predicted (np.ndarray): An array representing forecasted sales
+
+    Returns:
+        (tuple): A float representing the MAPE in percent, which leaves out
+            periods without sales, and a float representing the RMSE; both
+            are NaN if there are no periods to score
+    """
+    errors = predicted - actual
+    rmse = float(np.sqrt(np.mean(errors ** 2))) if len(errors) else math.nan
+    # Percentage errors of periods without sales are undefined.
+    sold = actual != 0
+    mape = (float(np.mean(np.abs(errors[sold] / actual[sold]))) * 100
+            if np.any(sold) else math.nan)
+    return mape, rmse
+
+def backtest(series_by_recipe: Dict[str, pd.Series],
+             model_orders: List[Tuple[List[int], List[int]]],
+             min_train_periods: int = 24, horizon: int = 3, step: int = 1,
+             max_cutoffs: Optional[int] = None,
+             maxiter: Optional[int] = None,
+             max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Backtests each order and seasonal order on the series of each recipe
+
+    The cutoffs of all recipes and hyperparameters are fitted in parallel.
+
+    Args:
+        series_by_recipe (dict): A dict mapping recipes to pd.Series
+            representing past monthly sales
+        model_orders (list): A list of tuples (order, seasonal order)
+        min_train_periods (int): An int representing min num of periods the
+            model is fitted to
+        horizon (int): An int representing num of periods forecasted
+        step (int): An int representing num of periods between cutoffs
+        max_cutoffs (int): An int representing max num of cutoffs per series;
+            the latest are kept; None keeps all
+        maxiter (int): An int representing max num of optimizer iterations;
+            None uses the default of statsmodels
+        max_workers (int): An int representing max num of worker processes;
+            None uses the number of processors
+
+    Returns:
+        (list): A list of dicts, one per recipe and hyperparameters, with
+            "recipe", "order", "seasonal_order", "cutoffs", "failed", "mape",
+            "rmse", "mean_fit_seconds", and "total_fit_seconds"
+
+    Raises:
+        ValueError: If horizon, step, or min_train_periods is below 1
+    """
+    if horizon < 1 or step < 1 or min_train_periods < 1:
+        raise ValueError("Horizon, step, and min. training periods must be "
+                         "at least 1")
+    futures = {}
+    with ProcessPoolExecutor(max_workers) as executor:
+        for recipe, series in series_by_recipe.items():
+            cutoffs = get_cutoffs(len(series), min_train_periods, horizon,
+                                  step, max_cutoffs)
+            for index, (order, seasonal_order) in enumerate(model_orders):
+                futures[(recipe, index)] = [
+                    executor.submit(backtest_cutoff, series, cutoff, order,
+                                    seasonal_order, horizon, maxiter)
+                    for cutoff in cutoffs]
+        outcomes = {job: [future.result() for future in job_futures]
+                    for job, job_futures in futures.items()}
+    results = []
+    for (recipe, index), cutoff_outcomes in outcomes.items():
+        order, seasonal_order = model_orders[index]
+        scored = [outcome for outcome in cutoff_outcomes
+                  if not outcome["failed"]]
+        # Errors of all cutoffs are pooled, so every forecast counts equally.
+        mape, rmse = score_forecasts(
+            np.concatenate([outcome["actual"] for outcome in scored]
+                           or [np.empty(0)]),
+            np.concatenate([outcome["predicted"] for outcome in scored]
+                           or [np.empty(0)]))
+        fit_seconds = [outcome["fit_seconds"] for outcome in cutoff_outcomes]
+        results.append({
+            "recipe": recipe, "order": list(order),
+            "seasonal_order": list(seasonal_order),
+            "cutoffs": len(cutoff_outcomes),
+            "failed": len(cutoff_outcomes) - len(scored),
+            "mape": mape, "rmse": rmse,
+            "mean_fit_seconds": (sum(fit_seconds) / len(fit_seconds)
+                                 if fit_seconds else math.nan),
+            "total_fit_seconds": sum(fit_seconds)})
+    return results
+
+def format_backtest_report(results: List[Dict[str, Any]]) -> str:
+    """Formats backtest results as a text table
+
+    Args:
+        results (list): A list of dicts as returned by backtest
+
+    Returns:
+        (str): A string representing the table, one row per recipe and
+            hyperparameters, followed by the total fit time of each
+    """
+    header = "{:<24} {:<10} {:<14} {:>7} {:>6} {:>8} {:>10} {:>11}".format(
+        "Recipe", "Order", "Seasonal order", "Cutoffs", "Failed", "MAPE %",
+        "RMSE", "Fit s/model")
+    lines = [header, "-" * len(header)]
+    total_seconds = {}
+    for result in results:
+        order = ",".join(str(value) for value in result["order"])
+        seasonal_order = ",".join(str(value)
+                                  for value in result["seasonal_order"])
+        lines.append(
+            "{:<24} {:<10} {:<14} {:>7} {:>6} {:>8.1f} {:>10.1f} "
+            "{:>11.3f}".format(result["recipe"][:24], order, seasonal_order,
+                               result["cutoffs"], result["failed"],
+                               result["mape"], result["rmse"],
+                               result["mean_fit_seconds"]))
+        hyperparameters = (order, seasonal_order)
+        total_seconds[hyperparameters] = (total_seconds.get(hyperparameters, 0)
+                                          + result["total_fit_seconds"])
+    lines.append("")
+    for (order, seasonal_order), seconds in total_seconds.items():
+        lines.append("Total fit time of order {} and seasonal order {}: "
+                     "{:.2f} s".format(order, seasonal_order, seconds))
+    return "\n".join(lines)
+
+def parse_order(text: str) -> List[int]:
+    """Parses comma-separated hyperparameters, e.g. "0,1,0,12"
+
+    Args:
+        text (str): A string representing comma-separated ints
+
+    Returns:
+        (list): A list of ints representing the hyperparameters
+    """
+    return [int(value) for value in text.split(",")]
+
+def main() -> None:
+    """Backtests hyperparameters on the monthly sales of a CSV file
+
+    Args:
+        No arguments
+
+    Returns:
+        No returns
+    """
+    parser = argparse.ArgumentParser(
+        description="Backtests seasonal ARIMA hyperparameters")
+    parser.add_argument("csv_file", help="CSV file with past sales")
+    parser.add_argument("--order", type=parse_order, default=[0, 0, 0],
+                        help="order p,d,q (default 0,0,0)")
+    parser.add_argument("--seasonal-order", type=parse_order, action="append",
+                        help="seasonal order P,D,Q,s; can be given several "
+                        "times (default 0,1,0,12)")
+    parser.add_argument("--min-train-periods", type=int, default=24)
+    parser.add_argument("--horizon", type=int, default=3)
+    parser.add_argument("--step", type=int, default=1)
+    parser.add_argument("--max-cutoffs", type=int, default=None)
+    parser.add_argument("--maxiter", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    arguments = parser.parse_args()
+    seasonal_orders = arguments.seasonal_order or [[0, 1, 0, 12]]
+    # Monthly Quantity ordered sums per recipe, as forecasted by the server.
+    aggregates = aggregate_daily_partials(load_csv_daily_partials(
+        arguments.csv_file, "Quantity ordered", "Recipe"))
+    results = backtest(aggregates["monthly_sums"],
+                       [(arguments.order, seasonal_order)
+                        for seasonal_order in seasonal_orders],
+                       arguments.min_train_periods, arguments.horizon,
+                       arguments.step, arguments.max_cutoffs,
+                       arguments.maxiter, arguments.workers)
+    print(format_backtest_report(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a discrete-event simulation of the brewery, to test capacity plans
+before real tanks are committed. Batches are created as instances of Batch
+with the real Tanks and an Inventory, and go through hot brewing, ferm, cond,
+bottling, and finished. Instead of datetime.now, the batches read a virtual
+clock, which jumps from one event (a batch arrives or a phase ends) to the
+next, so years of production are simulated in seconds. A batch whose phase has
+ended waits until a tank with the right capability and volume, or the bottling
+line, is free. The simulation measures tank utilisation, queueing delay, and
+bottles produced. Monte Carlo runs with randomised phase durations are run in
+parallel worker processes, e.g.:
+python brewery_simulation_brew_tracking.py --weeks 104 --batches-per-week 2
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import argparse
+import heapq
+import itertools
+import random
+import statistics
+from data_structure_brew_tracking import Batch
+from data_structure_brew_tracking import Inventory
+from data_structure_brew_tracking import PhaseRegistry
+from data_structure_brew_tracking import TankOccupancy
+from data_structure_brew_tracking import Tanks
+from data_structure_brew_tracking import find_free_tank
+from phase_scheduler_brew_tracking import get_next_phase
+from phase_scheduler_brew_tracking import get_phase_end
+
+# Phases a batch has to wait for a resource (tank or bottling line) to enter.
+QUEUED_PHASES = ["ferm", "cond", "bottling"]
+
+class VirtualClock:
+    """Holds the simulated time; batches call it instead of datetime.now
+
+    Attributes:
+        now (datetime): The current simulated datetime
+    """
+    def __init__(self, start: datetime) -> None:
+        """Initialises all instance variables of VirtualClock
+
+        Args:
+            start (datetime): The datetime the simulation starts at
+
+        Returns:
+            No returns
+        """
+        self.now = start
+
+    def __call__(self) -> datetime:
+        """Gets the current simulated datetime
+
+        Args:
+            No arguments
+
+        Returns:
+            (datetime): The current simulated datetime
+        """
+        return self.now
+
+def make_weekly_arrivals(start: datetime, num_weeks: int,
+                         batches_per_week: int, volume: int,
+                         beer_types: List[str]
+                         ) -> List[Tuple[datetime, str, int]]:
+    """Creates a capacity plan that starts batches evenly spread over weeks
+
+    Args:
+        start (datetime): The datetime the first batch starts at
+        num_weeks (int): An int representing the number of weeks
+        batches_per_week (int): An int representing num of batches per week
+        volume (int): An int representing the volume of a batch in litres
+        beer_types (list): A list representing beer types, used in turn
+
+    Returns:
+        (list): A list of tuples (start, beer type, volume) of the batches
+    """
+    interval = timedelta(weeks=1) / batches_per_week
+    beer_type_cycle = itertools.cycle(beer_types)
+    return [(start + number * interval, next(beer_type_cycle), volume)
+            for number in range(num_weeks * batches_per_week)]
+
+class BrewerySimulation:
+    """Simulates batches going through all phases with real tank constraints
+
+    Attributes:
+        clock (VirtualClock): The simulated time read by all batches
+        tanks (Tanks): An instance of class Tanks representing the tanks
+        tank_names (list): A list representing all tank names
+        inventory (Inventory): Inventory the produced bottles are put into
+        occupancy (TankOccupancy): Index of which batch occupies which tank
+        phases (PhaseRegistry): Registry of batches grouped by current phase
+        bottling_lines (int): An int representing num of batches that can be
+            bottled at the same time
+        duration_spread (float): A float representing the max relative
+            deviation of a randomised phase duration, e.g. 0.2 for +-20 %
+        rng (random.Random): Random number generator of phase durations
+        batches (dict): A dict mapping batch IDs to the simulated batches
+        events (list): A list representing a min-heap of (datetime,
+            sequence number, kind, batch ID or arrival)
+        sequence (itertools.count): Numbers events in order of creation
+        queues (dict): A dict mapping queued phases to lists of IDs of
+            batches waiting to enter them, in order of arrival
+        queued_since (dict): A dict mapping IDs of waiting batches to the
+            datetime they started to wait
+        tank_busy_since (dict): A dict mapping occupied tanks to the datetime
+            they were occupied
+        tank_busy_hours (dict): A dict mapping tanks to their hours occupied
+        queue_hours (dict): A dict mapping batch IDs to their hours waited
+    """
+    def __init__(self, start: datetime, tanks: Optional[Tanks] = None,
+                 bottling_lines: int = 1, duration_spread: float = 0.0,
+                 seed: Optional[int] = None) -> None:
+        """Initialises all instance variables of BrewerySimulation
+
+        Args:
+            start (datetime): The datetime the simulation starts at
+            tanks (Tanks): An instance of class Tanks; None uses the real
+                tank fleet
+            bottling_lines (int): An int repres. num of batches that can be
+                bottled at the same time
+            duration_spread (float): A float representing the max relative
+                deviation of a randomised phase duration; 0 keeps them fixed
+            seed (int): An int seeding the random phase durations
+
+        Returns:
+            No returns
+        """
+        self.clock = VirtualClock(start)
+        self.tanks = tanks if tanks is not None else Tanks()
+        self.tank_names = self.tanks.get_tank_names()
+        self.inventory = Inventory()
+        self.occupancy = TankOccupancy()
+        self.phases = PhaseRegistry()
+        self.bottling_lines = bottling_lines
+        self.duration_spread = duration_spread
+        self.rng = random.Random(seed)
+        self.batches = {}
+        self.events = []
+        self.sequence = itertools.count()
+        self.queues = {phase: [] for phase in QUEUED_PHASES}
+        self.queued_since = {}
+        self.tank_busy_since = {}
+        self.tank_busy_hours = {tank_name: 0.0 for tank_name
+                                in self.tanks.get_tank_names()}
+        self.queue_hours = {}
+
+    def add_arrivals(self, arrivals: List[Tuple[datetime, str, int]]) -> None:
+        """Schedules batches to start hot brewing at the given datetimes
+
+        Args:
+            arrivals (list): A list of tuples (start, beer type, volume)
+
+        Returns:
+            No returns
+        """
+        for arrival in arrivals:
+            self.push_event(arrival[0], "arrive", arrival)
+
+    def push_event(self, when: datetime, kind: str, data: Any) -> None:
+        """Adds an event to the event heap
+
+        Args:
+            when (datetime): The datetime the event happens at
+            kind (str): A string representing the kind, "arrive" or "end"
+            data (Any): The arrival tuple or the ID of the batch
+
+        Returns:
+            No returns
+        """
+        heapq.heappush(self.events, (when, next(self.sequence), kind, data))
+
+    def randomise_durations(self, batch: Batch) -> None:
+        """Scales the batch's phase durations by random factors
+
+        Args:
+            batch (Batch): An instance of class Batch
+
+        Returns:
+            No returns
+        """
+        if self.duration_spread <= 0:
+            return
+        for name in ["duration_phase1", "duration_phase2", "duration_phase3",
+                     "duration_phase4"]:
+            factor = self.rng.triangular(1 - self.duration_spread,
+                                         1 + self.duration_spread, 1)
+            setattr(batch, name, getattr(batch, name) * factor)
+
+    def change_phase(self, batch: Batch, phase: str, tank_name: str) -> None:
+        """Changes batch's phase and tank, and schedules the end of the phase
+
+        Args:
+            batch (Batch): An instance of class Batch
+            phase (str): A string representing the new phase of the batch
+            tank_name (str): A string representing the new tank of the batch or
+                "not applicable"
+
+        Returns:
+            No returns
+        """
+        previous_tank = batch.phase_current_tank
+        if previous_tank != tank_name:
+            # Adds the time the previous tank was occupied by the batch.
+            if previous_tank in self.tank_busy_since:
+                busy_since = self.tank_busy_since.pop(previous_tank)
+                self.tank_busy_hours[previous_tank] += (
+                    (self.clock.now - busy_since).total_seconds() / 3600)
+            if tank_name != "not applicable":
+                self.tank_busy_since[tank_name] = self.clock.now
+        batch.phase_current = phase
+        batch.phase_current_tank = tank_name
+        # Sets start and end datetimes from the virtual clock; finishing puts
+        # the bottles into the inventory.
+        batch.set_phase_start_end_datetimes()
+        phase_end = get_phase_end(batch)
+        if phase_end is not None:
+            self.push_event(phase_end, "end", batch.id)
+
+    def dispatch(self) -> None:
+        """Moves waiting batches into free tanks and onto the bottling line
+
+        Batches are served in order of arrival; a batch that doesn't fit into
+        any free tank doesn't block smaller batches behind it. Queues of
+        phases without free places aren't scanned.
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        for phase in QUEUED_PHASES:
+            queue = self.queues[phase]
+            if phase == "bottling":
+                free_places = (self.bottling_lines
+                               - len(self.phases.get_batches("bottling")))
+            else:
+                free_places = len([
+                    tank_name for tank_name
+                    in self.occupancy.get_free_tanks(self.tank_names)
+                    if phase in self.tanks.get_tank_value(tank_name)[
+                        "capability"]])
+            still_waiting = []
+            for position, batch_id in enumerate(queue):
+                # Without free places, no batch behind can enter either.
+                if free_places <= 0:
+                    still_waiting.extend(queue[position:])
+                    break
+                batch = self.batches[batch_id]
+                tank_name = "not applicable"
+                if phase != "bottling":
+                    tank_name = find_free_tank(self.tanks, self.occupancy,
+                                               batch, phase)
+                if tank_name == "":
+                    still_waiting.append(batch_id)
+                    continue
+                self.enter_phase(batch, phase, tank_name)
+                free_places -= 1
+            self.queues[phase] = still_waiting
+
+    def enter_phase(self, batch: Batch, phase: str, tank_name: str) -> None:
+        """Moves waiting batch into phase and adds the time it waited
+
+        Args:
+            batch (Batch): An instance of class Batch
+            phase (str): A string representing the phase the batch enters
+            tank_name (str): A string representing the tank of the phase or
+                "not applicable"
+
+        Returns:
+            No returns
+        """
+        waited = self.clock.now - self.queued_since.pop(batch.id)
+        self.queue_hours[batch.id] += waited.total_seconds() / 3600
+        self.change_phase(batch, phase, tank_name)
+
+    def run(self, until: datetime) -> Dict[str, Any]:
+        """Processes all events up to until and measures the production
+
+        Args:
+            until (datetime): The datetime the simulation ends at
+
+        Returns:
+            (dict): A dict representing the metrics, see get_metrics
+        """
+        start = self.clock.now
+        while self.events and self.events[0][0] <= until:
+            when, _, kind, data = heapq.heappop(self.events)
+            self.clock.now = when
+            if kind == "arrive":
+                _, beer_type, volume = data
+                batch_id = "sim{}".format(len(self.batches) + 1)
+                handle = {"tanks": self.tanks, "inventory": self.inventory,
+                          "occupancy": self.occupancy, "phases": self.phases,
+                          "clock": self.clock}
+                batch = Batch(batch_id, beer_type, volume, handle)
+                self.randomise_durations(batch)
+                self.batches[batch_id] = batch
+                self.queue_hours[batch_id] = 0.0
+                self.change_phase(batch, "hot brewing", "not applicable")
+                continue
+            batch = self.batches[data]
+            next_phase = get_next_phase(batch.phase_current)
+            # Bottled batches are finished at once; else the batch waits.
+            if next_phase == "finished":
+                self.change_phase(batch, next_phase, "not applicable")
+                continue
+            self.queues[next_phase].append(batch.id)
+            self.queued_since[batch.id] = when
+            # Batch can remain in its tank if it has the next capability.
+            tank_name = batch.phase_current_tank
+            if (tank_name != "not applicable" and next_phase
+                    in self.tanks.get_tank_value(tank_name)["capability"]):
+                self.queues[next_phase].pop()
+                self.enter_phase(batch, next_phase, tank_name)
+            # A phase change may have freed a tank or the bottling line.
+            self.dispatch()
+        self.clock.now = max(self.clock.now, until)
+        return self.get_metrics(start)
+
+    def get_metrics(self, start: datetime) -> Dict[str, Any]:
+        """Measures utilisation, queueing delay, and bottles produced
+
+        Args:
+            start (datetime): The datetime the measured period starts at
+
+        Returns:
+            (dict): A dict with "tank_utilisation" (dict mapping tanks to
+                the share of time occupied), "mean_queue_hours",
+                "max_queue_hours", "batches_started", "batches_finished",
+                "batches_waiting", and "bottles" (dict mapping beer types to
+                bottles produced)
+        """
+        hours = max((self.clock.now - start).total_seconds() / 3600, 1e-9)
+        busy_hours = dict(self.tank_busy_hours)
+        # Tanks that are still occupied count until the end of the period.
+        for tank_name, busy_since in self.tank_busy_since.items():
+            busy_hours[tank_name] += ((self.clock.now - busy_since)
+                                      .total_seconds() / 3600)
+        # Batches that are still waiting count until the end of the period.
+        queue_hours = dict(self.queue_hours)
+        for batch_id, queued_since in self.queued_since.items():
+            queue_hours[batch_id] += ((self.clock.now - queued_since)
+                                      .total_seconds() / 3600)
+        waits = list(queue_hours.values()) or [0.0]
+        return {"tank_utilisation": {tank_name: busy / hours for tank_name,
+                                     busy in busy_hours.items()},
+                "mean_queue_hours": statistics.mean(waits),
+                "max_queue_hours": max(waits),
+                "batches_started": len(self.batches),
+                "batches_finished": len(self.phases.get_batches("finished")),
+                "batches_waiting": len(self.queued_since),
+                "bottles": {name: self.inventory.get_inv_items_quantity(
+                    name)["num"] for name
+                            in self.inventory.get_inv_items_names()}}
+
+def simulate(arrivals: List[Tuple[datetime, str, int]], until: datetime,
+             bottling_lines: int = 1, duration_spread: float = 0.0,
+             seed: Optional[int] = None) -> Dict[str, Any]:
+    """Runs one simulation of the arrivals with the real tank fleet
+
+    Args:
+        arrivals (list): A list of tuples (start, beer type, volume)
+        until (datetime): The datetime the simulation ends at
+        bottling_lines (int): An int repres. num of batches that can be
+            bottled at the same time
+        duration_spread (float): A float representing the max relative
+            deviation of a randomised phase duration
+        seed (int): An int seeding the random phase durations
+
+    Returns:
+        (dict): A dict representing the metrics of the simulation
+    """
+    start = min(arrival[0] for arrival in arrivals) if arrivals else until
+    simulation = BrewerySimulation(start, None, bottling_lines,
+                                   duration_spread, seed)
+    simulation.add_arrivals(arrivals)
+    return simulation.run(until)
+
+def run_monte_carlo(arrivals: List[Tuple[datetime, str, int]],
+                    until: datetime, runs: int = 100,
+                    bottling_lines: int = 1, duration_spread: float = 0.2,
+                    seed: int = 0,
+                    max_workers: Optional[int] = None
+                    ) -> List[Dict[str, Any]]:
+    """Simulates the arrivals several times with random phase durations
+
+    The runs are simulated in parallel worker processes.
+
+    Args:
+        arrivals (list): A list of tuples (start, beer type, volume)
+        until (datetime): The datetime the simulations end at
+        runs (int): An int representing the number of simulations
+        bottling_lines (int): An int repres. num of batches that can be
+            bottled at the same time
+        duration_spread (float): A float representing the max relative
+            deviation of a randomised phase duration
+        seed (int): An int seeding the runs; run i uses seed + i
+        max_workers (int): An int representing max num of worker processes;
+            None uses the number of processors
+
+    Returns:
+        (list): A list of dicts representing the metrics of each run
+    """
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(simulate, arrivals, until, bottling_lines,
+                                   duration_spread, seed + run)
+                   for run in range(runs)]
+        return [future.result() for future in futures]
+
+def summarise_runs(results: List[Dict[str, Any]]) -> Dict[str, Dict[str,
+                                                                   float]]:
+    """Calculates mean, 5th, and 95th percentile of the metrics of all runs
+
+    Args:
+        results (list): A list of dicts representing the metrics of each run
+
+    Returns:
+        (dict): A dict mapping metric names to dicts with "mean", "p5", and
+            "p95"; utilisation and bottles are summarised per tank/beer type
+    """
+    samples = {}
+    for result in results:
+        for name in ["mean_queue_hours", "max_queue_hours", "batches_started",
+                     "batches_finished", "batches_waiting"]:
+            samples.setdefault(name, []).append(result[name])
+        for tank_name, utilisation in result["tank_utilisation"].items():
+            samples.setdefault("utilisation " + tank_name, []).append(
+                utilisation)
+        for beer_type, bottles in result["bottles"].items():
+            samples.setdefault("bottles " + beer_type, []).append(bottles)
+    summary = {}
+    for name, values in samples.items():
+        values = sorted(values)
+        summary[name] = {"mean": statistics.mean(values),
+                         "p5": values[int(0.05 * (len(values) - 1))],
+                         "p95": values[int(0.95 * (len(values) - 1))]}
+    return summary
+
+def main() -> None:
+    """Simulates a weekly capacity plan and prints the summarised metrics
+
+    Args:
+        No arguments
+
+    Returns:
+        No returns
+    """
+    parser = argparse.ArgumentParser(
+        description="Simulates brewery production")
+    parser.add_argument("--weeks", type=int, default=104,
+                        help="number of weeks batches are started")
+    parser.add_argument("--batches-per-week", type=int, default=2)
+    parser.add_argument("--volume", type=int, default=800,
+                        help="volume of every batch in litres")
+    parser.add_argument("--bottling-lines", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=100,
+                        help="number of Monte Carlo runs")
+    parser.add_argument("--spread", type=float, default=0.2,
+                        help="max relative deviation of phase durations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    arguments = parser.parse_args()
+    start = datetime(2020, 1, 1)
+    arrivals = make_weekly_arrivals(start, arguments.weeks,
+                                    arguments.batches_per_week,
+                                    arguments.volume,
+                                    ["dunkers", "pilsner", "red_helles"])
+    # Simulates until the batches started last had time to finish.
+    until = start + timedelta(weeks=arguments.weeks + 8)
+    results = run_monte_carlo(arrivals, until, arguments.runs,
+                              arguments.bottling_lines, arguments.spread,
+                              arguments.seed, arguments.workers)
+    summary = summarise_runs(results)
+    print("{:<28} {:>12} {:>12} {:>12}".format("Metric", "Mean", "P5",
+                                               "P95"))
+    for name, values in summary.items():
+        print("{:<28} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+            name, values["mean"], values["p5"], values["p95"]))
+
+if __name__ == "__main__":
+    main()
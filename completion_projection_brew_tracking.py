@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a projection of when the batches in production finish and how many
+bottles of each recipe are finished in each of the next calendar months. The
+phase end times, remaining phase durations, and bottles of all unfinished
+batches are gathered into numpy arrays in one pass over the phase registry, so
+the finish times of all batches are computed by a few array operations instead
+of an if-elif chain per batch. Finish times are binned into months by their
+datetime64 month, which counts months since 1970 and thus stays correct across
+year boundaries, and the bottles are summed per recipe and month in a single
+np.bincount.
+"""
+from datetime import datetime
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+import numpy as np
+from data_structure_brew_tracking import PhaseRegistry
+from phase_scheduler_brew_tracking import PHASE_END_FIELDS
+
+# Phases of unfinished batches in the order a batch goes through them.
+IN_FLIGHT_PHASES = ["hot brewing", "ferm", "cond", "bottling"]
+# Instance variables of Batch holding the durations of the phases in hours.
+PHASE_DURATION_FIELDS = ["duration_phase1", "duration_phase2",
+                         "duration_phase3", "duration_phase4"]
+
+def to_timedelta64(hours: np.ndarray) -> np.ndarray:
+    """Converts durations in hours to timedelta64 in microseconds
+
+    Args:
+        hours (np.ndarray): An array representing durations in hours
+
+    Returns:
+        (np.ndarray): An array of timedelta64[us] representing the durations
+    """
+    return np.round(hours * 3600e6).astype(np.int64).astype("timedelta64[us]")
+
+def get_month_starts(start: datetime, num_months: int) -> List[datetime]:
+    """Gets first days of start's month and of the following months
+
+    Args:
+        start (datetime): A datetime in the first month
+        num_months (int): An int representing the number of months
+
+    Returns:
+        (list): A list of datetimes representing the first days of months
+    """
+    months = np.datetime64(start, "M") + np.arange(num_months)
+    return months.astype("datetime64[s]").tolist()
+
+def collect_in_flight_batches(phases: PhaseRegistry,
+                              beer_types: Optional[List[str]] = None
+                              ) -> Dict[str, Any]:
+    """Gathers the unfinished batches of the phase registry into arrays
+
+    Args:
+        phases (PhaseRegistry): An instance of class PhaseRegistry
+        beer_types (list): A list representing the beer types to project;
+            None if the beer types aren't needed
+
+    Returns:
+        (dict): A dict with "batches" (list of the batches) and arrays with
+            one element per batch: "phase" (index into IN_FLIGHT_PHASES),
+            "phase_end" (end of current phase), "until_bottling" (duration
+            of the following phases before bottling), "bottling" (duration
+            of bottling), "remaining" (duration of all following phases),
+            "bottles", and "beer_type" (index into beer_types, -1 for other
+            beer types)
+    """
+    beer_type_indexes = {beer_type: index
+                         for index, beer_type in enumerate(beer_types or [])}
+    in_flight_batches = []
+    phase_ends = []
+    phase_indexes = []
+    durations = []
+    bottles = []
+    recipes = []
+    for phase_index, phase in enumerate(IN_FLIGHT_PHASES):
+        for batch in phases.get_batches(phase):
+            phase_end = getattr(batch, PHASE_END_FIELDS[phase])
+            # Phase end is "" if the phase wasn't started properly.
+            if batch.bottles_put_in_inventory or phase_end == "":
+                continue
+            in_flight_batches.append(batch)
+            phase_ends.append(phase_end)
+            phase_indexes.append(phase_index)
+            durations.append([getattr(batch, field)
+                              for field in PHASE_DURATION_FIELDS])
+            # * 2 to get the number of bottles, 1 litre equals 2 bottles.
+            bottles.append(batch.volume * 2)
+            recipes.append(beer_type_indexes.get(batch.beer_type, -1))
+    durations = np.array(durations, dtype=np.float64).reshape(-1, 4)
+    phase_indexes = np.array(phase_indexes, dtype=np.int64)
+    # Phases after the current phase still have to be gone through.
+    following = np.arange(4)[np.newaxis, :] > phase_indexes[:, np.newaxis]
+    until_bottling = (durations[:, :3] * following[:, :3]).sum(axis=1)
+    return {"batches": in_flight_batches, "phase": phase_indexes,
+            "phase_end": np.array(phase_ends, dtype="datetime64[us]"),
+            "until_bottling": to_timedelta64(until_bottling),
+            "bottling": to_timedelta64(durations[:, 3]),
+            "remaining": to_timedelta64((durations * following).sum(axis=1)),
+            "bottles": np.array(bottles, dtype=np.float64),
+            "beer_type": np.array(recipes, dtype=np.int64)}
+
+def project_finish_times(in_flight: Dict[str, Any], now: datetime
+                         ) -> np.ndarray:
+    """Computes when the batches finish bottling
+
+    Assumes that every batch goes to its next phase without delay; phases
+    that should have ended already are assumed to end now.
+
+    Args:
+        in_flight (dict): A dict of arrays, see collect_in_flight_batches
+        now (datetime): The current datetime
+
+    Returns:
+        (np.ndarray): An array of datetime64[us] representing finish times
+    """
+    phase_end = np.maximum(in_flight["phase_end"],
+                           np.datetime64(now, "us"))
+    return phase_end + in_flight["remaining"]
+
+def bin_bottles_by_month(finish: np.ndarray, in_flight: Dict[str, Any],
+                         start: datetime, num_months: int,
+                         num_beer_types: int) -> np.ndarray:
+    """Sums bottles per beer type and calendar month of finishing
+
+    Args:
+        finish (np.ndarray): An array of datetime64 representing finish times
+        in_flight (dict): A dict of arrays, see collect_in_flight_batches
+        start (datetime): A datetime in the first month
+        num_months (int): An int representing the number of months
+        num_beer_types (int): An int representing the number of beer types
+
+    Returns:
+        (np.ndarray): An array of shape (beer types, months) representing
+            the bottles finished in each month
+    """
+    month_index = (finish.astype("datetime64[M]")
+                   - np.datetime64(start, "M")).astype(np.int64)
+    beer_type = in_flight["beer_type"]
+    counted = ((month_index >= 0) & (month_index < num_months)
+               & (beer_type >= 0))
+    # Each (beer type, month) pair gets its own bin of a flat array.
+    bins = beer_type[counted] * num_months + month_index[counted]
+    totals = np.bincount(bins, weights=in_flight["bottles"][counted],
+                         minlength=num_beer_types * num_months)
+    return totals.reshape(num_beer_types, num_months)
+
+def project_monthly_bottles(phases: PhaseRegistry, beer_types: List[str],
+                            now: datetime, num_months: int
+                            ) -> Dict[str, List[int]]:
+    """Projects bottles finished per beer type in each of the next months
+
+    Args:
+        phases (PhaseRegistry): An instance of class PhaseRegistry
+        beer_types (list): A list representing the beer types to project
+        now (datetime): The current datetime; its month is the first month
+        num_months (int): An int representing the number of months
+
+    Returns:
+        (dict): A dict mapping beer types to lists of bottles finished in
+            this month and each of the following months
+    """
+    in_flight = collect_in_flight_batches(phases, beer_types)
+    finish = project_finish_times(in_flight, now)
+    totals = bin_bottles_by_month(finish, in_flight, now, num_months,
+                                  len(beer_types))
+    return {beer_type: [int(bottles) for bottles in totals[index]]
+            for index, beer_type in enumerate(beer_types)}
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a cache of parsed sales CSV files. Loading a CSV file parses every
+row and every date string, which takes long for multi-year order exports. The
+cleaned and datetime-indexed dataframe is therefore cached by the hash of the
+file's content, in memory (least recently used entries are evicted first) and
+on disk as pickled dataframe, whose columns are stored as binary numpy arrays.
+The content hash of a file is remembered by its path, modification time, and
+size, so unchanged files are neither parsed nor hashed again. Instead of the
+whole dataframe, the daily sums and counts by recipe of a file can be loaded
+and cached; their size is bounded by the number of days and recipes.
+"""
+from collections import OrderedDict
+from functools import partial
+from typing import Callable
+from typing import Optional
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import pandas as pd
+from persistence_brew_tracking import write_file_atomically
+from sales_forecast_brewing import load_csv_clean_to_dataframe
+from sales_forecast_brewing import convert_to_time_series
+from sales_forecast_brewing import load_csv_daily_partials
+
+# Is part of every cache key; must be increased whenever the parsing changes,
+# so that dataframes parsed by an older version aren't used anymore.
+PARSER_VERSION = 1
+# Number of bytes read at once when hashing the content of a file.
+HASH_BLOCK_SIZE = 1 << 20
+
+def hash_file(file_path: str) -> str:
+    """Calculates the SHA-256 hash of the content of a file
+
+    Args:
+        file_path (str): A string representing the file path
+
+    Returns:
+        (str): A string representing the hex digest of the file's content
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def load_and_parse_csv(file_path: str) -> pd.DataFrame:
+    """Loads CSV file, removes missing values, and sets dates as index
+
+    Args:
+        file_path (str): A string representing the file path to the CSV file
+
+    Returns:
+        (pd.DataFrame): A pandas dataframe with dates as index
+
+    Raises:
+        KeyError: If the column "Date Required" is missing in the data
+    """
+    dataframe = load_csv_clean_to_dataframe(file_path)
+    return convert_to_time_series(dataframe)
+
+class ParsedCsvCache:
+    """Caches cleaned and datetime-indexed dataframes of sales CSV files
+
+    Attributes:
+        cache_dir (str): A string representing the directory of the disk
+            cache; None disables the disk cache
+        max_entries (int): An int representing max num of dataframes in memory
+        dataframes (OrderedDict): An OrderedDict mapping content hashes to
+            dataframes, ordered from least to most recently used
+        file_hashes (dict): A dict mapping file paths to their modification
+            time, size, and content hash
+        lock (threading.Lock): A lock, as requests may load CSVs concurrently
+    """
+    def __init__(self, cache_dir: Optional[str] = "csv_cache",
+                 max_entries: int = 8) -> None:
+        """Initialises all instance variables of ParsedCsvCache
+
+        Args:
+            cache_dir (str): A string representing the directory of the disk
+                cache; None disables the disk cache
+            max_entries (int): An int repres. max num of dataframes in memory
+
+        Returns:
+            No returns
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.dataframes = OrderedDict()
+        self.file_hashes = {}
+        self.lock = threading.Lock()
+
+    def get_content_hash(self, file_path: str) -> str:
+        """Gets content hash of file; only hashes if file changed since
+
+        Args:
+            file_path (str): A string representing the file path
+
+        Returns:
+            (str): A string representing the hex digest of the file's content
+
+        Raises:
+            OSError: If the file can't be accessed, e.g. FileNotFoundError
+        """
+        file_path = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+        with self.lock:
+            known = self.file_hashes.get(file_path)
+        # True if file hasn't changed since it was hashed the last time.
+        if (known is not None and known[0] == file_stat.st_mtime_ns
+                and known[1] == file_stat.st_size):
+            return known[2]
+        content_hash = hash_file(file_path)
+        with self.lock:
+            self.file_hashes[file_path] = (file_stat.st_mtime_ns,
+                                           file_stat.st_size, content_hash)
+        return content_hash
+
+    def get_disk_path(self, key: str) -> str:
+        """Gets path of the disk cache file of the dataframe with key
+
+        Args:
+            key (str): A string representing the cache key
+
+        Returns:
+            (str): A string representing the path of the disk cache file
+        """
+        return os.path.join(self.cache_dir, key + ".pickle")
+
+    def put_memory(self, key: str, dataframe: pd.DataFrame) -> None:
+        """Puts dataframe into memory cache and evicts least recently used
+
+        Args:
+            key (str): A string representing the cache key
+            dataframe (pd.DataFrame): A pandas dataframe to be cached
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            self.dataframes[key] = dataframe
+            self.dataframes.move_to_end(key)
+            while len(self.dataframes) > self.max_entries:
+                self.dataframes.popitem(last=False)
+
+    def get_memory(self, key: str) -> Optional[pd.DataFrame]:
+        """Gets dataframe from memory cache and marks it as recently used
+
+        Args:
+            key (str): A string representing the cache key
+
+        Returns:
+            (pd.DataFrame): The cached dataframe; None if it isn't cached
+        """
+        with self.lock:
+            dataframe = self.dataframes.get(key)
+            if dataframe is not None:
+                self.dataframes.move_to_end(key)
+        return dataframe
+
+    def read_disk(self, key: str) -> Optional[pd.DataFrame]:
+        """Reads dataframe from disk cache
+
+        Args:
+            key (str): A string representing the cache key
+
+        Returns:
+            (pd.DataFrame): The cached dataframe; None if it isn't cached
+        """
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.get_disk_path(key), "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        # A damaged cache file is treated like a missing one.
+        except (EOFError, pickle.UnpicklingError) as error:
+            logging.warning("Parsed CSV cache file of %s is damaged: %s",
+                            key, error)
+            return None
+
+    def write_disk(self, key: str, dataframe: pd.DataFrame) -> None:
+        """Writes dataframe to disk cache; errors are logged, not raised
+
+        Args:
+            key (str): A string representing the cache key
+            dataframe (pd.DataFrame): A pandas dataframe to be cached
+
+        Returns:
+            No returns
+        """
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Protocol 5 stores the columns' numpy arrays as raw buffers.
+            write_file_atomically(self.get_disk_path(key),
+                                  pickle.dumps(dataframe, protocol=5))
+        except OSError as error:
+            logging.warning("Parsed CSV could not be cached on disk: %s",
+                            error)
+
+    def get_or_parse(self, file_path: str, kind: str,
+                     parse: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Gets dataframe of kind for CSV file from cache or parses the file
+
+        Args:
+            file_path (str): A string representing the path to the CSV file
+            kind (str): A string representing what the dataframe holds, e.g.
+                "dataframe"; is part of the cache key
+            parse (Callable): Function parsing the CSV file into a dataframe
+
+        Returns:
+            (pd.DataFrame): The cached or parsed dataframe
+        """
+        content_hash = self.get_content_hash(file_path)
+        key = "{}_{}_v{}".format(content_hash, kind, PARSER_VERSION)
+        dataframe = self.get_memory(key)
+        if dataframe is None:
+            dataframe = self.read_disk(key)
+            if dataframe is None:
+                dataframe = parse()
+                self.write_disk(key, dataframe)
+            self.put_memory(key, dataframe)
+        # Shallow copy, so callers can't change the cached frame's columns.
+        return dataframe.copy(deep=False)
+
+    def load(self, file_path: str) -> pd.DataFrame:
+        """Loads cleaned, datetime-indexed dataframe of CSV file from cache
+
+        Parses the CSV file if neither memory nor disk cache holds it.
+
+        Args:
+            file_path (str): A string representing the path to the CSV file
+
+        Returns:
+            (pd.DataFrame): A pandas dataframe with dates as index
+
+        Raises:
+            KeyError: If the column "Date Required" is missing in the data
+        """
+        try:
+            return self.get_or_parse(file_path, "dataframe",
+                                     partial(load_and_parse_csv, file_path))
+        # Missing file is handled (and logged) by load_csv_clean_to_dataframe.
+        except OSError:
+            return load_and_parse_csv(file_path)
+
+    def load_daily_partials(self, file_path: str, column: str,
+                            group_by: str = "Recipe",
+                            chunk_rows: int = 100000) -> pd.DataFrame:
+        """Loads daily sums and counts by group of CSV file from cache
+
+        Reads the CSV file in chunks if neither memory nor disk cache holds
+        its daily sums and counts, so the file doesn't need to fit in memory.
+
+        Args:
+            file_path (str): A string representing the path to the CSV file
+            column (str): A string representing the column to aggregate
+            group_by (str): A string representing the column to group by
+            chunk_rows (int): An int representing number of rows read at once
+
+        Returns:
+            (pd.DataFrame): A dataframe with columns "sum" and "count",
+                indexed by day and group
+
+        Raises:
+            FileNotFoundError: If the CSV file doesn't exist
+            KeyError: If the column "Date Required" is missing in the data
+        """
+        # Result doesn't depend on chunk_rows, so it isn't part of the key.
+        kind = "partials_{}_{}".format(
+            hashlib.sha256(column.encode()).hexdigest()[:8],
+            hashlib.sha256(group_by.encode()).hexdigest()[:8])
+        return self.get_or_parse(file_path, kind, partial(
+            load_csv_daily_partials, file_path, column, group_by, chunk_rows))
@@ -4,16 +4,42 @@ Created on Sat Nov 16 12:53:24 2019
 
 @author: Stefan Kasperzack
 
-Provides data structure to model brewing process. Provided are three classes:
-Batch, Inventory, and Tanks; and supporting methods.
+Provides data structure to model brewing process. Provided are seven classes:
+Batch, Inventory, Tanks, TankOccupancy, TankCalendar, PhaseRegistry, and
+SortedIndex; and supporting methods.
 """
 from datetime import datetime
 from datetime import timedelta
+from bisect import bisect_left
+from bisect import bisect_right
+from itertools import product
+from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 import logging
 
+# Durations of the phases in hours that every Batch starts with; also used
+# to plan batches that don't exist yet.
+HOT_BREWING_HOURS = 5 # Can be done within a few hours.
+FERM_HOURS = 672 # On average four weeks.
+COND_HOURS = 336 # Up to two weeks.
+
+def get_bottling_hours(volume: float) -> float:
+    """Calculates duration of bottling a batch in hours
+
+    Args:
+        volume (float): A float representing the volume of batch in litres
+
+    Returns:
+        (float): A float representing the duration in hours
+    """
+    # One minute per bottle and each bottle contains 0.5 litres.
+    return (1 / 60) * volume * 2
+
 class Tanks:
     """Holds information about all tanks
 
@@ -147,6 +173,537 @@ class Inventory:
                            and not inventory_item.startswith("__")]
         return inv_items_names
 
+class TankOccupancy:
+    """Indexes which batch currently occupies which tank
+
+    Attributes:
+        tank_to_batch (dict): A dict mapping occupied tank names to batch IDs
+    """
+    def __init__(self) -> None:
+        """Initialises all instance variables of TankOccupancy
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        self.tank_to_batch = {}
+
+    def occupy(self, tank_name: str, batch_id: str) -> None:
+        """Marks tank as occupied by batch; placeholder tank names are ignored
+
+        Args:
+            tank_name (str): A string representing the tank name
+            batch_id (str): A string representing the batch ID
+
+        Returns:
+            No returns
+        """
+        # "" and "not applicable" mean that the batch is not in a tank.
+        if tank_name not in ["", "not applicable"]:
+            self.tank_to_batch[tank_name] = batch_id
+
+    def release(self, tank_name: str, batch_id: str) -> None:
+        """Marks tank as free if it is occupied by the given batch
+
+        Args:
+            tank_name (str): A string representing the tank name
+            batch_id (str): A string representing the batch ID
+
+        Returns:
+            No returns
+        """
+        # Only the batch that occupies the tank can release it.
+        if self.tank_to_batch.get(tank_name) == batch_id:
+            del self.tank_to_batch[tank_name]
+
+    def get_batch_id(self, tank_name: str) -> str:
+        """Gets ID of the batch in the tank or "" if the tank is free
+
+        Args:
+            tank_name (str): A string representing the tank name
+
+        Returns:
+            (str): A string representing the batch ID or "" if tank is free
+        """
+        return self.tank_to_batch.get(tank_name, "")
+
+    def get_free_tanks(self, tank_names: List[str]) -> List[str]:
+        """Filters tank names down to the tanks that are not occupied
+
+        Args:
+            tank_names (list): A list representing tank names to check
+
+        Returns:
+            free_tanks (list): A list representing names of all free tanks
+        """
+        # Dict lookup per tank, so no batches need to be scanned.
+        free_tanks = [tank_name for tank_name in tank_names
+                      if tank_name not in self.tank_to_batch]
+        return free_tanks
+
+    def rebuild(self, batches: Dict[str, "Batch"]) -> None:
+        """Rebuilds index from batches, e.g. after loading the program state
+
+        Args:
+            batches (dict): A dictionary representing all batches
+
+        Returns:
+            No returns
+        """
+        self.tank_to_batch = {}
+        for batch in batches.values():
+            # Rebinds batch to this index so that later changes are tracked.
+            batch.occupancy = self
+            self.occupy(batch.phase_current_tank, batch.id)
+
+class TankCalendar:
+    """Holds future reservations of tanks, e.g. for a planned fermentation
+
+    The reservations of a tank never overlap, so sorting them by start also
+    sorts them by end. Thus, the reservations that overlap a period are found
+    by binary search over the ends in O(log n), like with an interval tree.
+
+    Attributes:
+        starts (dict): A dict mapping tank names to sorted reservation starts
+        ends (dict): A dict mapping tank names to reservation ends, in the
+            order of the starts
+        ids (dict): A dict mapping tank names to reservation IDs, in the order
+            of the starts
+        reservations (dict): A dict mapping reservation IDs to dicts with
+            "id", "tank", "start", "end", and "label"
+    """
+    def __init__(self) -> None:
+        """Initialises all instance variables of TankCalendar
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        self.starts = {}
+        self.ends = {}
+        self.ids = {}
+        self.reservations = {}
+
+    def get_conflicts(self, tank_name: str, start: datetime,
+                      end: datetime) -> List[Dict[str, Any]]:
+        """Gets reservations of tank that overlap the period from start to end
+
+        Args:
+            tank_name (str): A string representing the tank name
+            start (datetime): The start of the period
+            end (datetime): The end of the period
+
+        Returns:
+            (list): A list of dicts representing the overlapping reservations
+        """
+        starts = self.starts.get(tank_name, [])
+        ends = self.ends.get(tank_name, [])
+        # First reservation that ends after start; later ones overlap as long
+        # as they start before end.
+        position = bisect_right(ends, start)
+        conflicts = []
+        while position < len(starts) and starts[position] < end:
+            conflicts.append(self.reservations[
+                self.ids[tank_name][position]])
+            position += 1
+        return conflicts
+
+    def is_free(self, tank_name: str, start: datetime,
+                end: datetime) -> bool:
+        """Checks if tank has no reservation from start to end
+
+        Args:
+            tank_name (str): A string representing the tank name
+            start (datetime): The start of the period
+            end (datetime): The end of the period
+
+        Returns:
+            (bool): True if no reservation of tank overlaps the period
+        """
+        ends = self.ends.get(tank_name, [])
+        position = bisect_right(ends, start)
+        return (position == len(ends)
+                or self.starts[tank_name][position] >= end)
+
+    def get_free_tanks(self, tank_names: List[str], start: datetime,
+                       end: datetime, batch_id: str = "") -> List[str]:
+        """Filters tank names down to the tanks without reservation
+
+        Args:
+            tank_names (list): A list representing tank names to check
+            start (datetime): The start of the period
+            end (datetime): The end of the period
+            batch_id (str): A string representing the ID of the batch that
+                needs the tank; reservations labelled with it don't count
+
+        Returns:
+            (list): A list representing names of tanks free in the period
+        """
+        if not batch_id:
+            return [tank_name for tank_name in tank_names
+                    if self.is_free(tank_name, start, end)]
+        return [tank_name for tank_name in tank_names
+                if all(reservation["label"] == batch_id
+                       for reservation
+                       in self.get_conflicts(tank_name, start, end))]
+
+    def get_earliest_free_slot(self, tank_name: str, duration: timedelta,
+                               not_before: datetime) -> datetime:
+        """Gets earliest start of a period of duration without reservation
+
+        Args:
+            tank_name (str): A string representing the tank name
+            duration (timedelta): The duration of the period
+            not_before (datetime): The earliest possible start
+
+        Returns:
+            (datetime): The earliest start of a free period
+        """
+        starts = self.starts.get(tank_name, [])
+        ends = self.ends.get(tank_name, [])
+        slot_start = not_before
+        # Skips reservations that leave no gap of duration before them.
+        position = bisect_right(ends, slot_start)
+        while (position < len(starts)
+               and starts[position] < slot_start + duration):
+            slot_start = max(slot_start, ends[position])
+            position += 1
+        return slot_start
+
+    def reserve(self, reservation_id: str, tank_name: str, start: datetime,
+                end: datetime, label: str = "") -> List[Dict[str, Any]]:
+        """Reserves tank from start to end unless a reservation overlaps
+
+        Args:
+            reservation_id (str): A string representing the reservation ID
+            tank_name (str): A string representing the tank name
+            start (datetime): The start of the reservation
+            end (datetime): The end of the reservation
+            label (str): A string describing the reservation, e.g. beer type
+
+        Returns:
+            (list): A list of dicts representing the overlapping reservations;
+                the tank is only reserved if the list is empty
+
+        Raises:
+            ValueError: If end isn't after start or the ID is already used
+        """
+        if end <= start:
+            raise ValueError("A reservation must end after it starts")
+        if reservation_id in self.reservations:
+            raise ValueError("Reservation {} already "
+                             "exists".format(reservation_id))
+        conflicts = self.get_conflicts(tank_name, start, end)
+        if conflicts:
+            return conflicts
+        starts = self.starts.setdefault(tank_name, [])
+        position = bisect_left(starts, start)
+        starts.insert(position, start)
+        self.ends.setdefault(tank_name, []).insert(position, end)
+        self.ids.setdefault(tank_name, []).insert(position, reservation_id)
+        self.reservations[reservation_id] = {
+            "id": reservation_id, "tank": tank_name, "start": start,
+            "end": end, "label": label}
+        return []
+
+    def cancel(self, reservation_id: str) -> bool:
+        """Cancels a reservation
+
+        Args:
+            reservation_id (str): A string representing the reservation ID
+
+        Returns:
+            (bool): True if the reservation existed
+        """
+        reservation = self.reservations.pop(reservation_id, None)
+        if reservation is None:
+            return False
+        tank_name = reservation["tank"]
+        position = bisect_left(self.starts[tank_name], reservation["start"])
+        del self.starts[tank_name][position]
+        del self.ends[tank_name][position]
+        del self.ids[tank_name][position]
+        return True
+
+    def get_reservations(self) -> List[Dict[str, Any]]:
+        """Gets all reservations sorted by tank and start
+
+        Args:
+            No arguments
+
+        Returns:
+            (list): A list of dicts representing the reservations
+        """
+        return [self.reservations[reservation_id]
+                for tank_name in sorted(self.ids)
+                for reservation_id in self.ids[tank_name]]
+
+    def rebuild(self, reservations: Dict[str, Dict[str, Any]]) -> None:
+        """Rebuilds calendar from reservations, e.g. after loading the state
+
+        Args:
+            reservations (dict): A dict mapping reservation IDs to dicts
+                representing the reservations
+
+        Returns:
+            No returns
+        """
+        self.starts = {}
+        self.ends = {}
+        self.ids = {}
+        self.reservations = {}
+        for reservation in reservations.values():
+            conflicts = self.reserve(reservation["id"], reservation["tank"],
+                                     reservation["start"], reservation["end"],
+                                     reservation["label"])
+            if conflicts:
+                logging.error("Reservation %s overlaps another one and was "
+                              "dropped.", reservation["id"])
+
+class PhaseRegistry:
+    """Groups batches by their current production phase
+
+    Attributes:
+        phase_to_batches (dict): A dict mapping phases to dicts of batches
+        batch_to_phase (dict): A dict mapping batch IDs to registered phases
+    """
+    def __init__(self) -> None:
+        """Initialises all instance variables of PhaseRegistry
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        self.phase_to_batches = {}
+        self.batch_to_phase = {}
+
+    def update(self, batch: "Batch") -> None:
+        """Moves batch into the bucket of its current phase
+
+        Args:
+            batch (Batch): An instance of class Batch whose phase changed
+
+        Returns:
+            No returns
+        """
+        # Removes batch from the bucket of its previous phase first.
+        self.remove(batch.id)
+        self.phase_to_batches.setdefault(batch.phase_current, {})
+        self.phase_to_batches[batch.phase_current][batch.id] = batch
+        self.batch_to_phase[batch.id] = batch.phase_current
+
+    def remove(self, batch_id: str) -> None:
+        """Removes batch from the registry, e.g. when the batch is deleted
+
+        Args:
+            batch_id (str): A string representing the batch ID
+
+        Returns:
+            No returns
+        """
+        phase = self.batch_to_phase.pop(batch_id, None)
+        if phase is not None:
+            del self.phase_to_batches[phase][batch_id]
+
+    def get_batches(self, phase: str) -> List["Batch"]:
+        """Gets all batches that are currently in the given phase
+
+        Args:
+            phase (str): A string representing the production phase
+
+        Returns:
+            (list): A list representing all batches in the phase
+        """
+        return list(self.phase_to_batches.get(phase, {}).values())
+
+    def rebuild(self, batches: Dict[str, "Batch"]) -> None:
+        """Rebuilds registry from batches, e.g. after loading the program state
+
+        Args:
+            batches (dict): A dictionary representing all batches
+
+        Returns:
+            No returns
+        """
+        self.phase_to_batches = {}
+        self.batch_to_phase = {}
+        for batch in batches.values():
+            # Rebinds batch to this registry so that later changes are tracked.
+            batch.phases = self
+            self.update(batch)
+
+class SortedIndex:
+    """Keeps item IDs in sorted buckets to answer filtered, paged queries
+
+    Every item is put into one bucket per combination of its filter values,
+    where each filter value can also be None (meaning "any"). Thus, each query
+    reads a single bucket that is already filtered and sorted; page N costs
+    O(log n + page size) instead of a scan over all items.
+
+    Attributes:
+        sort_key (Callable): A function returning the sort value of an item
+        filter_keys (dict): A dict mapping filter names to functions that
+            return the item's value for the filter
+        buckets (dict): A dict mapping filter values to sorted bucket lists
+        entries (dict): A dict mapping item IDs to sort value and bucket keys
+    """
+    def __init__(self, sort_key: Callable[[Any], Any],
+                 filter_keys: Dict[str, Callable[[Any], Any]]) -> None:
+        """Initialises all instance variables of SortedIndex
+
+        Args:
+            sort_key (Callable): A function returning the sort value of an item
+            filter_keys (dict): A dict mapping filter names to functions that
+                return the item's value for the filter
+
+        Returns:
+            No returns
+        """
+        self.sort_key = sort_key
+        self.filter_keys = filter_keys
+        # Bucket key -> (sorted list of sort values, list of (value, ID)).
+        self.buckets = {}
+        self.entries = {}
+
+    def add(self, item_id: str, item: Any) -> None:
+        """Adds item to the index or re-sorts it if it's already indexed
+
+        Args:
+            item_id (str): A string representing the ID of the item
+            item (Any): The item, e.g. an order dict or an instance of Batch
+
+        Returns:
+            No returns
+        """
+        self.remove(item_id)
+        sort_value = self.sort_key(item)
+        item_values = [self.filter_keys[name](item)
+                       for name in self.filter_keys]
+        # Creates one bucket key per combination of value and None ("any").
+        bucket_keys = list(product(*[(value, None) for value in item_values]))
+        for bucket_key in bucket_keys:
+            values, pairs = self.buckets.setdefault(bucket_key, ([], []))
+            # Pairs are sorted by value and then by ID to keep a stable order.
+            position = bisect_left(pairs, (sort_value, item_id))
+            values.insert(position, sort_value)
+            pairs.insert(position, (sort_value, item_id))
+        self.entries[item_id] = (sort_value, bucket_keys)
+
+    def remove(self, item_id: str) -> None:
+        """Removes item from the index if it is indexed
+
+        Args:
+            item_id (str): A string representing the ID of the item
+
+        Returns:
+            No returns
+        """
+        entry = self.entries.pop(item_id, None)
+        if entry is None:
+            return
+        sort_value, bucket_keys = entry
+        for bucket_key in bucket_keys:
+            values, pairs = self.buckets[bucket_key]
+            position = bisect_left(pairs, (sort_value, item_id))
+            del values[position]
+            del pairs[position]
+
+    def rebuild(self, items: Dict[str, Any]) -> None:
+        """Rebuilds index from items, e.g. after loading the program state
+
+        Args:
+            items (dict): A dict mapping item IDs to items
+
+        Returns:
+            No returns
+        """
+        self.buckets = {}
+        self.entries = {}
+        for item_id, item in items.items():
+            self.add(item_id, item)
+
+    def query(self, filters: Dict[str, Any], lower: Optional[Any] = None,
+              upper: Optional[Any] = None, offset: int = 0, limit: int = 50,
+              descending: bool = False) -> Tuple[List[str], int]:
+        """Gets one page of item IDs that match the filters and sort range
+
+        Args:
+            filters (dict): A dict mapping filter names to required values;
+                missing names or None mean that any value matches
+            lower (Any): Lowest sort value to include; None for no bound
+            upper (Any): Highest sort value to include; None for no bound
+            offset (int): An int representing the number of items to skip
+            limit (int): An int representing the maximum number of items
+            descending (bool): Bool where True sorts from highest to lowest
+
+        Returns:
+            (tuple):
+                item_ids (list): A list representing the IDs on the page
+                total (int): An int representing the number of matching items
+        """
+        bucket_key = tuple(filters.get(name) for name in self.filter_keys)
+        values, pairs = self.buckets.get(bucket_key, ([], []))
+        # Narrows bucket down to the sort range via binary search.
+        start = 0 if lower is None else bisect_left(values, lower)
+        end = len(values) if upper is None else bisect_right(values, upper)
+        total = max(end - start, 0)
+        if descending:
+            page_end = max(end - offset, start)
+            page_start = max(page_end - limit, start)
+            page = reversed(pairs[page_start:page_end])
+        else:
+            page_start = min(start + offset, end)
+            page = pairs[page_start:min(page_start + limit, end)]
+        item_ids = [item_id for _, item_id in page]
+        return item_ids, total
+
+def find_free_tank(tanks: Tanks, occupancy: TankOccupancy, batch: "Batch",
+                   phase: str, calendar: Optional[TankCalendar] = None) -> str:
+    """Finds tank for batch's next phase: its current or the smallest free
+
+    Args:
+        tanks (Tanks): An instance of class Tanks representing the tanks
+        occupancy (TankOccupancy): Index of which batch occupies which tank
+        batch (Batch): An instance of class Batch
+        phase (str): A string representing the next phase, "ferm" or "cond"
+        calendar (TankCalendar): An instance of class TankCalendar; tanks
+            reserved for another batch during the phase aren't used; None if
+            no tank is reserved
+
+    Returns:
+        (str): A string representing the tank name; "" if no tank fits
+    """
+    tank_names = occupancy.get_free_tanks(tanks.get_tank_names())
+    # Batch can remain in its tank if the tank has the next capability.
+    current_tank = batch.phase_current_tank
+    if current_tank not in ["", "not applicable"]:
+        tank_names.append(current_tank)
+    # Tank is needed from now until the phase ends.
+    if calendar is not None:
+        phase_start = batch.clock()
+        phase_end = phase_start + timedelta(
+            hours=batch.duration_phase2 if phase == "ferm"
+            else batch.duration_phase3)
+        tank_names = calendar.get_free_tanks(tank_names, phase_start,
+                                             phase_end, batch.id)
+    if (current_tank in tank_names
+            and phase in tanks.get_tank_value(current_tank)["capability"]):
+        return current_tank
+    # Smallest fitting tank leaves larger tanks free for larger batches.
+    fitting_tanks = []
+    for tank_name in tank_names:
+        tank_value = tanks.get_tank_value(tank_name)
+        if (phase in tank_value["capability"]
+                and tank_value["volume"] >= batch.volume):
+            fitting_tanks.append((tank_value["volume"], tank_name))
+    return min(fitting_tanks)[1] if fitting_tanks else ""
+
 class Batch:
     """Holds all information to a batch and supporting methods
 
@@ -173,6 +730,10 @@ class Batch:
         duration_phase4 (int): An int representing duration of phase 4 in hours
         tank (Tanks): An instance of class Tanks representing the tanks
         inventory (Inventory): Instance of class Inventory represe. entire inv.
+        occupancy (TankOccupancy): Index of which batch occupies which tank
+        phases (PhaseRegistry): Registry of batches grouped by current phase
+        clock (Callable): Function returning the current datetime; e.g. a
+            virtual clock when the batch is simulated
     """
     def __init__(self, batch_id: str, beer_type: str, volume: str,
                  handle: Dict[str, Union[Inventory, Tanks]]) -> None:
@@ -182,7 +743,9 @@ class Batch:
             batch_id (str): A string representing the batch ID
             beer_type (str): A string representing the beer type of the batch
             volume (str): A string representing the volume of the batch in L
-            handle (dict): Contains instances of class Tanks and Inventory
+            handle (dict): Contains instances of Tanks, Inventory, and
+                TankOccupancy and PhaseRegistry (both optional), and the
+                clock (optional; datetime.now by default)
 
         Returns:
             No returns
@@ -193,6 +756,9 @@ class Batch:
         self.volume = volume # In litres.
         self.num_bottles_to_inv = ""
         self.bottles_put_in_inventory = False
+        # Handle on TankOccupancy obj. to keep tank index up to date; is set
+        # before phase_current_tank, because its setter updates the index.
+        self.occupancy = handle.get("occupancy", TankOccupancy())
         # Information about batch's production phase.
         self.phase_current = ""
         self.phase_current_tank = ""
@@ -207,15 +773,97 @@ class Batch:
         self.time_end_phase3 = ""
         self.time_end_phase4 = ""
         # Time information about batch's production phase's duration (in hours)
-        self.duration_phase1 = 5 # Can be done within a few hours.
-        self.duration_phase2 = 672 # On average four weeks.
-        self.duration_phase3 = 336 # Up to two weeks.
-        # One minute per bottle and each bottle contains 0.5 litres.
-        self.duration_phase4 = (1 / 60) * self.volume * 2
+        self.duration_phase1 = HOT_BREWING_HOURS
+        self.duration_phase2 = FERM_HOURS
+        self.duration_phase3 = COND_HOURS
+        self.duration_phase4 = get_bottling_hours(self.volume)
         # Handle on Tanks object to check tanks' restraints.
         self.tanks = handle["tanks"]
         # Handle on Inventory obj. to put produced bottles into the inventory.
         self.inventory = handle["inventory"]
+        # Function returning current datetime; is used for the phase times.
+        self.clock = handle.get("clock", datetime.now)
+        # Handle on PhaseRegistry obj. to keep batches grouped by phase.
+        self.phases = handle.get("phases", PhaseRegistry())
+        self.phases.update(self)
+
+    @property
+    def phase_current_tank(self) -> str:
+        """Gets the name of the tank that the batch is currently in
+
+        Args:
+            No arguments
+
+        Returns:
+            (str): A string representing current tank of batch
+        """
+        return self._phase_current_tank
+
+    @phase_current_tank.setter
+    def phase_current_tank(self, tank_name: str) -> None:
+        """Sets the current tank of the batch and updates the tank occupancy
+
+        Args:
+            tank_name (str): A string representing the new tank of the batch
+
+        Returns:
+            No returns
+        """
+        # Frees the previous tank (if any) before occupying the new one.
+        self.occupancy.release(getattr(self, "_phase_current_tank", ""),
+                               self.id)
+        self._phase_current_tank = tank_name
+        self.occupancy.occupy(tank_name, self.id)
+
+    def __getstate__(self) -> Dict[str, object]:
+        """Gets instance variables to pickle, without handles on shared objects
+
+        Args:
+            No arguments
+
+        Returns:
+            state (dict): A dict representing the instance variables to pickle
+        """
+        # Handles are rebound to the program's objects after loading.
+        state = {name: value for name, value in self.__dict__.items()
+                 if name not in ["tanks", "inventory", "occupancy", "phases",
+                                 "clock"]}
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        """Restores pickled batch; also restores batches saved before the index
+
+        Args:
+            state (dict): A dict representing the pickled instance variables
+
+        Returns:
+            No returns
+        """
+        # Older save files store the tank as plain instance variable.
+        if "phase_current_tank" in state:
+            state["_phase_current_tank"] = state.pop("phase_current_tank")
+        # Handles aren't pickled; placeholders are used until they're rebound.
+        handle = {"tanks": Tanks, "inventory": Inventory,
+                  "occupancy": TankOccupancy, "phases": PhaseRegistry}
+        for name, handle_class in handle.items():
+            if name not in state:
+                state[name] = handle_class()
+        # Restored batches are tracked in real time.
+        state["clock"] = datetime.now
+        self.__dict__.update(state)
+
+    def __copy__(self) -> "Batch":
+        """Creates shallow copy that shares the handles with this batch
+
+        Args:
+            No arguments
+
+        Returns:
+            batch_copy (Batch): A copy of the batch, e.g. for a snapshot
+        """
+        batch_copy = Batch.__new__(Batch)
+        batch_copy.__dict__.update(self.__dict__)
+        return batch_copy
 
     # Is called once per production phase to set production start and end times
     def set_phase_start_end_datetimes(self) -> None:
@@ -227,10 +875,12 @@ class Batch:
         Returns:
             No returns
         """
+        # Moves batch into the phase registry's bucket of its current phase.
+        self.phases.update(self)
         # True if current phase is hot brewing (phase 1).
         if self.phase_current == "hot brewing":
             # Sets start time equal to current datetime.
-            self.time_start_phase1 = datetime.now()
+            self.time_start_phase1 = self.clock()
             # Sets end time equal to current datetime + duration of phase 1.
             self.time_end_phase1 = (self.time_start_phase1
                                     + timedelta(hours=self.duration_phase1))
@@ -238,19 +888,19 @@ class Batch:
             self.phase_last_completed = ""
         # Else True if current phase is fermentation (phase 2).
         elif self.phase_current == "ferm":
-            self.time_start_phase2 = datetime.now()
+            self.time_start_phase2 = self.clock()
             self.time_end_phase2 = (self.time_start_phase2
                                     + timedelta(hours=self.duration_phase2))
             self.phase_last_completed = "hot brewing"
         # Else True if current phase is conditioning (phase 3).
         elif self.phase_current == "cond":
-            self.time_start_phase3 = datetime.now()
+            self.time_start_phase3 = self.clock()
             self.time_end_phase3 = (self.time_start_phase3
                                     + timedelta(hours=self.duration_phase3))
             self.phase_last_completed = "ferm"
         # Else True if current phase is bottling (phase 4).
         elif self.phase_current == "bottling":
-            self.time_start_phase4 = datetime.now()
+            self.time_start_phase4 = self.clock()
             self.time_end_phase4 = (self.time_start_phase4
                                     + timedelta(hours=self.duration_phase4))
             self.phase_last_completed = "cond"
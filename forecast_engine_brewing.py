@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a forecasting engine that fits the seasonal ARIMA models of all beer
+types in parallel. Fitting is CPU-bound and the models of different beer types
+are independent, so the fits are fanned out to a pool of processes (threads
+would be serialised by the global interpreter lock). Each process returns a
+CompactForecast and the fitted parameters, which are small and cheap to send
+back to the Flask process. Fitted parameters are cached, so a model that was
+already fitted to the same series with the same hyperparameters is recreated
+from its parameters instead of being fitted again. If a series only extends the
+series of the previous forecast of its beer type by newly appended periods, the
+previous model is updated with the new observations instead of being fitted
+again; it is fitted again once the hyperparameters change, the past data
+changes, or too many periods were appended since the last fit.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from forecast_storage_brewing import CompactForecast
+from model_cache_brewing import FittedModelCache
+from sales_forecast_brewing import define_and_fit_model
+from sales_forecast_brewing import define_and_filter_model
+
+def forecast_fitted_model(fitted_model: object,
+                          steps: int) -> Tuple[CompactForecast, np.ndarray]:
+    """Forecasts steps periods ahead with fitted model
+
+    Args:
+        fitted_model (obj): An object representing the fitted ARIMA model
+        steps (int): An int representing the number of periods to forecast
+
+    Returns:
+        (tuple): The forecast of the fitted model and its fitted parameters
+    """
+    forecast = CompactForecast.from_prediction(
+        fitted_model.get_forecast(steps=steps), fitted_model)
+    return forecast, np.asarray(fitted_model.params, dtype=np.float64)
+
+def fit_and_forecast(series: pd.Series, order: List[int],
+                     seasonal_order: List[int],
+                     steps: int) -> Tuple[CompactForecast, np.ndarray]:
+    """Fits seasonal ARIMA model to series and forecasts steps periods ahead
+
+    Args:
+        series (pd.Series): A pd.Series representing past monthly sales
+        order (list): A list representing hyperparameters for the ARIMA model
+        seasonal_order (list): A list repres. hyperparam. of seasonal component
+        steps (int): An int representing the number of periods to forecast
+
+    Returns:
+        (tuple): The forecast of the fitted model and its fitted parameters
+
+    Raises:
+        ValueError: If the model can't be fitted with the hyperparameters
+    """
+    fitted_model = define_and_fit_model(series, False, order, seasonal_order)
+    return forecast_fitted_model(fitted_model, steps)
+
+def is_extended_series(old_series: pd.Series, new_series: pd.Series) -> bool:
+    """Checks if new_series is old_series with periods appended to its end
+
+    Args:
+        old_series (pd.Series): A pd.Series with dates as index
+        new_series (pd.Series): A pd.Series with dates as index
+
+    Returns:
+        (bool): True if old_series is a strict prefix of new_series
+    """
+    num_old = len(old_series)
+    return (len(new_series) > num_old
+            and old_series.index.freqstr == new_series.index.freqstr
+            and new_series.index[:num_old].equals(old_series.index)
+            and np.array_equal(new_series.to_numpy(dtype=np.float64)[:num_old],
+                               old_series.to_numpy(dtype=np.float64)))
+
+class ForecastEngine:
+    """Fits the models of several beer types in parallel worker processes
+
+    Attributes:
+        max_workers (int): An int representing max num of worker processes;
+            None uses the number of processors, 1 fits in the calling process
+        executor (ProcessPoolExecutor): The pool of worker processes; is
+            created when it is needed for the first time
+        model_cache (FittedModelCache): Caches fitted parameters; None
+            disables caching
+        max_appended_periods (int): An int representing max num of periods
+            appended to a model since it was fitted; 0 disables updating
+        latest_models (dict): A dict mapping beer types to the series,
+            hyperparameters, parameters, and (if available) fitted model of
+            their latest forecast, and the periods appended since fitting
+        lock (threading.Lock): A lock, as requests may forecast concurrently
+    """
+    def __init__(self, max_workers: Optional[int] = None,
+                 model_cache: Optional[FittedModelCache] = None,
+                 max_appended_periods: int = 12) -> None:
+        """Initialises all instance variables of ForecastEngine
+
+        Args:
+            max_workers (int): An int representing max num of worker
+                processes; None uses the number of processors
+            model_cache (FittedModelCache): Caches fitted parameters; None
+                disables caching
+            max_appended_periods (int): An int repres. max num of periods
+                appended to a model since it was fitted; 0 disables updating
+
+        Returns:
+            No returns
+        """
+        self.max_workers = max_workers
+        self.model_cache = model_cache
+        self.max_appended_periods = max_appended_periods
+        self.latest_models = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Gets pool of worker processes and starts it if necessary
+
+        Args:
+            No arguments
+
+        Returns:
+            (ProcessPoolExecutor): The pool of worker processes
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.max_workers)
+            return self.executor
+
+    def forecast(self, series_by_beer: Dict[str, pd.Series],
+                 order: List[int], seasonal_order: List[int],
+                 steps: int = 12,
+                 model_orders: Optional[Dict[str, Tuple[List[int],
+                                                        List[int]]]] = None
+                 ) -> Dict[str, CompactForecast]:
+        """Fits a model to each series and forecasts steps periods ahead
+
+        Args:
+            series_by_beer (dict): A dict mapping beer types to pd.Series
+                representing past monthly sales
+            order (list): A list representing hyperparam. for the ARIMA model
+            seasonal_order (list): A list repres. hyperp. of seasonal component
+            steps (int): An int representing the number of periods to forecast
+            model_orders (dict): A dict mapping beer types to their own order
+                and seasonal order, e.g. found by tuning; beer types that
+                aren't in it use order and seasonal_order
+
+        Returns:
+            (dict): A dict mapping beer types to their forecasts; keeps the
+                order of series_by_beer
+
+        Raises:
+            ValueError: If a model can't be fitted with the hyperparameters
+            BrokenProcessPool: If a worker process terminated abruptly
+        """
+        # Copies hyperparameters, as app.config's lists may change meanwhile.
+        model_orders = dict(model_orders or {})
+        for beer_type in series_by_beer:
+            beer_order, beer_seasonal_order = model_orders.get(
+                beer_type, (order, seasonal_order))
+            model_orders[beer_type] = (list(beer_order),
+                                       list(beer_seasonal_order))
+        results = {}
+        to_fit = {}
+        for beer_type, series in series_by_beer.items():
+            order, seasonal_order = model_orders[beer_type]
+            # Looks up fitted parameters of model fitted to the same series;
+            # recreating it is cheap, so it's done in this process.
+            key = None
+            params = None
+            if self.model_cache is not None:
+                key = self.model_cache.get_key(series, order, seasonal_order)
+                params = self.model_cache.get(key)
+            if params is not None:
+                fitted_model = define_and_filter_model(series, order,
+                                                       seasonal_order, params)
+                self.set_latest_model(beer_type, series, order,
+                                      seasonal_order, fitted_model, 0)
+                results[beer_type] = forecast_fitted_model(fitted_model,
+                                                           steps)
+                continue
+            # Else updates the latest model with newly appended periods.
+            fitted_model = self.update_latest_model(beer_type, series, order,
+                                                    seasonal_order)
+            if fitted_model is not None:
+                results[beer_type] = forecast_fitted_model(fitted_model,
+                                                           steps)
+            else:
+                to_fit[beer_type] = (key, series, order, seasonal_order)
+        fitted = self.fit_all({beer_type: job[1:]
+                               for beer_type, job in to_fit.items()}, steps)
+        for beer_type, (key, series, order, seasonal_order) in to_fit.items():
+            params = fitted[beer_type][1]
+            if key is not None:
+                self.model_cache.put(key, params)
+            # The fitted model stays in the worker process; only its
+            # parameters are kept to update it later.
+            self.set_latest_model(beer_type, series, order, seasonal_order,
+                                  None, 0, params)
+        results.update(fitted)
+        return {beer_type: results[beer_type][0]
+                for beer_type in series_by_beer}
+
+    def set_latest_model(self, beer_type: str, series: pd.Series,
+                         order: List[int], seasonal_order: List[int],
+                         fitted_model: Optional[object],
+                         appended_periods: int,
+                         params: Optional[np.ndarray] = None) -> None:
+        """Remembers model of the latest forecast of beer type for updates
+
+        Args:
+            beer_type (str): A string representing the beer type
+            series (pd.Series): A pd.Series representing the fitted data
+            order (list): A list representing hyperparam. for the ARIMA model
+            seasonal_order (list): A list repres. hyperp. of seasonal component
+            fitted_model (obj): An object representing the fitted ARIMA model;
+                None if it's not available in this process
+            appended_periods (int): An int representing num of periods
+                appended to the model since it was fitted
+            params (np.ndarray): An array representing fitted parameters;
+                None takes them from fitted_model
+
+        Returns:
+            No returns
+        """
+        if params is None:
+            params = np.asarray(fitted_model.params, dtype=np.float64)
+        with self.lock:
+            self.latest_models[beer_type] = {
+                "series": series, "order": order,
+                "seasonal_order": seasonal_order, "params": params,
+                "fitted_model": fitted_model,
+                "appended_periods": appended_periods}
+
+    def update_latest_model(self, beer_type: str, series: pd.Series,
+                            order: List[int], seasonal_order: List[int]
+                            ) -> Optional[object]:
+        """Updates latest model of beer type with newly appended periods
+
+        The parameters of the model aren't estimated again; the new
+        observations are only filtered with the existing parameters.
+
+        Args:
+            beer_type (str): A string representing the beer type
+            series (pd.Series): A pd.Series representing past monthly sales
+            order (list): A list representing hyperparam. for the ARIMA model
+            seasonal_order (list): A list repres. hyperp. of seasonal component
+
+        Returns:
+            (obj): An object representing the updated ARIMA model; None if
+                the model must be fitted again
+        """
+        with self.lock:
+            latest = self.latest_models.get(beer_type)
+        # Model must be fitted again if hyperparameters or past data changed.
+        if (latest is None or latest["order"] != order
+                or latest["seasonal_order"] != seasonal_order
+                or not is_extended_series(latest["series"], series)):
+            return None
+        num_new = len(series) - len(latest["series"])
+        appended_periods = latest["appended_periods"] + num_new
+        # Parameters become outdated if too many periods were appended.
+        if appended_periods > self.max_appended_periods:
+            return None
+        fitted_model = latest["fitted_model"]
+        # Model fitted in a worker process is recreated from its parameters.
+        if fitted_model is None:
+            fitted_model = define_and_filter_model(
+                latest["series"], order, seasonal_order, latest["params"])
+        fitted_model = fitted_model.append(series.iloc[-num_new:])
+        self.set_latest_model(beer_type, series, order, seasonal_order,
+                              fitted_model, appended_periods)
+        return fitted_model
+
+    def fit_all(self, jobs: Dict[str, Tuple[pd.Series, List[int],
+                                            List[int]]],
+                steps: int) -> Dict[str, Tuple[CompactForecast, np.ndarray]]:
+        """Fits a model to each series in parallel worker processes
+
+        Args:
+            jobs (dict): A dict mapping beer types to a pd.Series repres.
+                past monthly sales, the order, and the seasonal order
+            steps (int): An int representing the number of periods to forecast
+
+        Returns:
+            (dict): A dict mapping beer types to their forecasts and fitted
+                parameters
+
+        Raises:
+            ValueError: If a model can't be fitted with the hyperparameters
+            BrokenProcessPool: If a worker process terminated abruptly
+        """
+        # A single fit isn't worth sending data to another process.
+        if self.max_workers == 1 or len(jobs) < 2:
+            return {beer_type: fit_and_forecast(*job, steps)
+                    for beer_type, job in jobs.items()}
+        executor = self.get_executor()
+        futures = {beer_type: executor.submit(fit_and_forecast, *job, steps)
+                   for beer_type, job in jobs.items()}
+        try:
+            return {beer_type: future.result()
+                    for beer_type, future in futures.items()}
+        except BrokenProcessPool as error:
+            # A crashed worker breaks the pool; it's replaced on the next call.
+            logging.error("Forecast worker process terminated: %s", error)
+            self.discard_executor(executor)
+            raise
+        finally:
+            # Fits of other beer types are useless if one of them failed.
+            for future in futures.values():
+                future.cancel()
+
+    def discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Drops a broken pool, so the next call starts a new one
+
+        Args:
+            executor (ProcessPoolExecutor): The pool a worker crashed in
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            # Pool may have been replaced already by a concurrent request.
+            if self.executor is executor:
+                self.executor = None
+
+    def shutdown(self) -> None:
+        """Stops the worker processes
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a queue of sales forecast jobs that are run in the background, so
+that a request submitting a forecast returns immediately with the ID of the
+job instead of waiting until the CSV file is loaded and all models are fitted.
+Worker threads run the forecast pipeline of each job, which reports the stage
+it is in (load, resample, fit, plot), so the progress of a job can be polled.
+Only the results of the most recently submitted job that completed are
+published, so an older job that finishes late doesn't overwrite newer results.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+import itertools
+import logging
+import threading
+import uuid
+
+class ForecastJobQueue:
+    """Runs sales forecast pipelines in worker threads and tracks their status
+
+    Attributes:
+        executor (ThreadPoolExecutor): Worker threads running the pipelines
+        jobs (dict): A dict mapping job IDs to the status of the forecast job
+        max_jobs (int): An int representing number of job statuses to keep
+        job_numbers (itertools.count): Numbers jobs in order of submission
+        latest_published (int): An int representing the number of the job
+            whose results were published last; 0 if none were published
+        latest_job_id (str): A string representing the ID of the job whose
+            results were published last; "" if none were published
+        lock (threading.Lock): Lock protecting the job statuses
+    """
+    def __init__(self, max_workers: int = 2, max_jobs: int = 100) -> None:
+        """Initialises all instance variables of ForecastJobQueue
+
+        Args:
+            max_workers (int): An int representing number of worker threads
+            max_jobs (int): An int representing number of job statuses to keep
+
+        Returns:
+            No returns
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = {}
+        self.max_jobs = max_jobs
+        self.job_numbers = itertools.count(1)
+        self.latest_published = 0
+        self.latest_job_id = ""
+        self.lock = threading.Lock()
+
+    def submit(self, pipeline: Callable[[Callable[[str], None]], Any],
+               on_success: Callable[[Any], None]) -> str:
+        """Queues a forecast pipeline
+
+        Args:
+            pipeline (Callable): Function running the forecast; is called with
+                a function to which it passes the name of each stage it starts
+            on_success (Callable): Function publishing the pipeline's result;
+                is only called if no newer job has been published yet
+
+        Returns:
+            job_id (str): A string representing the ID of the forecast job
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            job_number = next(self.job_numbers)
+            self.jobs[job_id] = {"status": "pending", "stage": "",
+                                 "submitted": datetime.now(),
+                                 "finished": "", "error": ""}
+            # Forgets the oldest job statuses (dicts keep insertion order).
+            while len(self.jobs) > self.max_jobs:
+                del self.jobs[next(iter(self.jobs))]
+        self.executor.submit(self.run, job_id, job_number, pipeline,
+                             on_success)
+        return job_id
+
+    def run(self, job_id: str, job_number: int,
+            pipeline: Callable[[Callable[[str], None]], Any],
+            on_success: Callable[[Any], None]) -> None:
+        """Runs forecast pipeline and publishes its result (in worker thread)
+
+        Args:
+            job_id (str): A string representing the ID of the forecast job
+            job_number (int): An int representing the job's submission order
+            pipeline (Callable): Function running the forecast
+            on_success (Callable): Function publishing the pipeline's result
+
+        Returns:
+            No returns
+        """
+        self.set_status(job_id, status="running")
+        try:
+            result = pipeline(partial(self.set_stage, job_id))
+            with self.lock:
+                # Results of older jobs must not replace those of newer jobs.
+                if job_number > self.latest_published:
+                    self.latest_published = job_number
+                    self.latest_job_id = job_id
+                    on_success(result)
+        # Any error must end up in the job status, else it stays "running".
+        except Exception as error: # pylint: disable=broad-except
+            logging.error("Forecast job %s failed: %s", job_id, error)
+            self.set_status(job_id, status="failed", error=str(error),
+                            finished=datetime.now())
+        else:
+            self.set_status(job_id, status="done", finished=datetime.now())
+
+    def set_stage(self, job_id: str, stage: str) -> None:
+        """Records the stage of the pipeline the forecast job is in
+
+        Args:
+            job_id (str): A string representing the ID of the forecast job
+            stage (str): A string representing the stage, e.g. "fit"
+
+        Returns:
+            No returns
+        """
+        self.set_status(job_id, stage=stage)
+
+    def set_status(self, job_id: str, **values: Any) -> None:
+        """Updates the status of a forecast job
+
+        Args:
+            job_id (str): A string representing the ID of the forecast job
+            values (Any): Keyword arguments representing the updated values
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(values)
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Gets the status of a forecast job
+
+        Args:
+            job_id (str): A string representing the ID of the forecast job
+
+        Returns:
+            (dict): A dict representing the job status or None if unknown
+        """
+        with self.lock:
+            job_status = self.jobs.get(job_id)
+            return None if job_status is None else dict(job_status)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a compact representation of monthly sales forecasts. Instead of the
+statsmodels prediction results, which reference the fitted model, the data,
+and the state space matrices, only the forecast dates, the predicted mean, and
+the confidence bounds are kept as float arrays, together with some metadata
+about the model. These are all that plan_production and the user interface
+need, and they are small and fast to pickle; pandas is only imported when a
+forecast is accessed as pd.Series, so loading them is fast. Rendered plots of
+forecasts are kept in memory by forecast ID, so they can be served without
+writing files.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+import threading
+import numpy as np
+if TYPE_CHECKING:
+    import pandas as pd
+
+# MIME types of the formats in which forecast plots can be rendered.
+PLOT_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+class CompactForecast:
+    """Holds forecast dates, predicted mean, and confidence bounds as arrays
+
+    Attributes:
+        dates (np.ndarray): A datetime64 array representing forecast dates
+        freq (str): A string representing the frequency of dates, e.g. "MS"
+        mean (np.ndarray): A float array representing the predicted mean
+        lower (np.ndarray): A float array representing lower confidence bound
+        upper (np.ndarray): A float array representing upper confidence bound
+        metadata (dict): A dict representing information about the model,
+            e.g. order, seasonal order, AIC, and number of observations
+    """
+    def __init__(self, dates: np.ndarray, freq: str, mean: np.ndarray,
+                 lower: np.ndarray, upper: np.ndarray,
+                 metadata: Dict[str, Any]) -> None:
+        """Initialises all instance variables of CompactForecast
+
+        Args:
+            dates (np.ndarray): A datetime64 array representing forecast dates
+            freq (str): A string representing the frequency of dates
+            mean (np.ndarray): A float array representing the predicted mean
+            lower (np.ndarray): A float array repres. lower confidence bound
+            upper (np.ndarray): A float array repres. upper confidence bound
+            metadata (dict): A dict representing information about the model
+
+        Returns:
+            No returns
+        """
+        self.dates = dates
+        self.freq = freq
+        self.mean = mean
+        self.lower = lower
+        self.upper = upper
+        self.metadata = metadata
+
+    @classmethod
+    def from_prediction(cls, prediction: object, fitted_model: object,
+                        alpha: float = 0.05) -> "CompactForecast":
+        """Creates CompactForecast from statsmodels prediction results
+
+        Args:
+            prediction (obj): An object representing the statsmodels forecast
+                (PredictionResultsWrapper), e.g. from get_forecast()
+            fitted_model (obj): An object representing fitted SARIMAX model;
+                None if model information isn't available
+            alpha (float): A float representing significance level of bounds
+
+        Returns:
+            (CompactForecast): The compact representation of the forecast
+        """
+        predicted_mean = prediction.predicted_mean
+        confidence_bounds = np.asarray(prediction.conf_int(alpha=alpha),
+                                       dtype=np.float64)
+        metadata = {"alpha": alpha, "created": datetime.now()}
+        if fitted_model is not None:
+            model_spec = fitted_model.model
+            metadata.update({"order": tuple(model_spec.order),
+                             "seasonal_order": tuple(
+                                 model_spec.seasonal_order),
+                             "aic": float(fitted_model.aic),
+                             "nobs": int(fitted_model.nobs)})
+        return cls(predicted_mean.index.values.astype("datetime64[ns]"),
+                   predicted_mean.index.freqstr,
+                   np.asarray(predicted_mean, dtype=np.float64),
+                   confidence_bounds[:, 0].copy(),
+                   confidence_bounds[:, 1].copy(), metadata)
+
+    def get_index(self) -> "pd.DatetimeIndex":
+        """Creates pandas DatetimeIndex of the forecast dates
+
+        Args:
+            No arguments
+
+        Returns:
+            (pd.DatetimeIndex): A DatetimeIndex representing forecast dates
+        """
+        # Is imported on first use, so loading forecasts doesn't import it.
+        import pandas as pd
+        return pd.DatetimeIndex(self.dates, freq=self.freq)
+
+    @property
+    def predicted_mean(self) -> "pd.Series":
+        """Gets predicted mean as pd.Series, like statsmodels' forecasts do
+
+        Args:
+            No arguments
+
+        Returns:
+            (pd.Series): A pd.Series representing predicted mean by date
+        """
+        import pandas as pd
+        return pd.Series(self.mean, index=self.get_index(),
+                         name="predicted_mean")
+
+    def conf_int(self) -> "pd.DataFrame":
+        """Gets confidence bounds as pd.DataFrame with lower/upper columns
+
+        Args:
+            No arguments
+
+        Returns:
+            (pd.DataFrame): A pd.DataFrame representing confidence bounds
+        """
+        import pandas as pd
+        return pd.DataFrame({"lower": self.lower, "upper": self.upper},
+                            index=self.get_index())
+
+def compact_forecasts(forecasts: Dict[str, object]) -> Dict[str, object]:
+    """Converts forecasts that are statsmodels results into CompactForecast
+
+    Args:
+        forecasts (dict): A dict mapping beer types to forecasts, e.g. loaded
+            from a save file written before forecasts were stored compactly
+
+    Returns:
+        (dict): A dict mapping beer types to instances of CompactForecast
+    """
+    return {beer_type: forecast if isinstance(forecast, CompactForecast)
+            else CompactForecast.from_prediction(forecast, None)
+            for beer_type, forecast in forecasts.items()}
+
+class PlotCache:
+    """Keeps rendered forecast plots in memory by forecast ID
+
+    Attributes:
+        max_entries (int): An int representing max num of plots kept; the
+            least recently used plots are evicted first
+        plots (OrderedDict): An OrderedDict mapping forecast IDs to tuples of
+            the image bytes and their MIME type
+        lock (threading.Lock): A lock, as forecast jobs run in worker threads
+    """
+    def __init__(self, max_entries: int = 32) -> None:
+        """Initialises all instance variables of PlotCache
+
+        Args:
+            max_entries (int): An int representing max num of plots kept
+
+        Returns:
+            No returns
+        """
+        self.max_entries = max_entries
+        self.plots = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, forecast_id: str, image: bytes, mimetype: str) -> None:
+        """Puts rendered plot into cache and evicts least recently used
+
+        Args:
+            forecast_id (str): A string representing the ID of the forecast
+            image (bytes): The rendered plot
+            mimetype (str): A string representing the MIME type of the image
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            self.plots[forecast_id] = (image, mimetype)
+            self.plots.move_to_end(forecast_id)
+            while len(self.plots) > self.max_entries:
+                self.plots.popitem(last=False)
+
+    def get(self, forecast_id: str) -> Optional[Tuple[bytes, str]]:
+        """Gets rendered plot and its MIME type from cache
+
+        Args:
+            forecast_id (str): A string representing the ID of the forecast
+
+        Returns:
+            (tuple): The image bytes and MIME type; None if it isn't cached
+        """
+        with self.lock:
+            plot = self.plots.get(forecast_id)
+            if plot is not None:
+                self.plots.move_to_end(forecast_id)
+            return plot
@@ -13,26 +13,58 @@ production. Further, the status of the brewing process can be saved and loaded.
 from datetime import datetime
 from datetime import timedelta
 import glob
-from calendar import monthrange
+from functools import partial
 import pickle
 import logging
-import os
+import threading
+import uuid
 from typing import List
 from typing import Dict
 from typing import Tuple
-from PIL import Image
+from typing import Iterable
+from typing import Iterator
+from typing import Union
+from typing import Any
+from typing import Optional
+from typing import Callable
+from typing import TYPE_CHECKING
+from urllib.parse import urlencode
 from flask import Flask
 from flask import request
-import pandas as pd
+from flask import Response
+from flask import stream_with_context
+from markupsafe import escape
 from data_structure_brew_tracking import Batch
 from data_structure_brew_tracking import Inventory
 from data_structure_brew_tracking import Tanks
-from sales_forecast_brewing import load_csv_clean_to_dataframe
-from sales_forecast_brewing import convert_to_time_series
-from sales_forecast_brewing import average_data
-from sales_forecast_brewing import sum_data
-from sales_forecast_brewing import define_and_fit_model
-from sales_forecast_brewing import plot_sales_forecast
+from data_structure_brew_tracking import TankOccupancy
+from data_structure_brew_tracking import TankCalendar
+from data_structure_brew_tracking import PhaseRegistry
+from data_structure_brew_tracking import SortedIndex
+from data_structure_brew_tracking import find_free_tank
+from data_structure_brew_tracking import HOT_BREWING_HOURS
+from data_structure_brew_tracking import FERM_HOURS
+from persistence_brew_tracking import SnapshotWorker
+from persistence_brew_tracking import StateJournal
+from persistence_brew_tracking import copy_program_state
+from persistence_brew_tracking import write_file_atomically
+from persistence_brew_tracking import get_batch_phase_state
+from persistence_brew_tracking import set_batch_phase_state
+from sqlite_store_brew_tracking import SqliteStateStore
+from forecast_storage_brewing import compact_forecasts
+from forecast_storage_brewing import PlotCache
+from forecast_storage_brewing import PLOT_MIMETYPES
+from forecast_jobs_brewing import ForecastJobQueue
+from phase_scheduler_brew_tracking import PhaseDeadlineScheduler
+from phase_scheduler_brew_tracking import get_next_phase
+from production_scheduler_brew_tracking import ProductionScheduler
+from production_scheduler_brew_tracking import get_in_flight_schedule
+from completion_projection_brew_tracking import get_month_starts
+from completion_projection_brew_tracking import project_monthly_bottles
+# The forecasting stack (pandas, statsmodels, matplotlib) takes seconds to
+# import, so it is imported by start_forecasting when it's first needed.
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Creates instance of class Flask; name is used to find resources on filesystem
 app = Flask(__name__)
@@ -41,14 +73,101 @@ app = Flask(__name__)
 app.config["batches"] = {}
 app.config["customer_orders"] = {}
 app.config["monthly_sales_forecasts"] = {}
+# Maps recipe names in sales CSV files to the beer types brewed and tracked.
+app.config["recipe_beer_types"] = {"Organic Dunkel": "dunkers",
+                                   "Organic Pilsner": "pilsner",
+                                   "Organic Red Helles": "red_helles"}
 app.config["table_monthly_growth"] = ""
 app.config["table_weekly_growth"] = ""
 # Filename of the pickle file with which the program state is saved and loaded.
 app.config["save_file_name"] = "savefile_program_state.pickle"
+# Append-only journal recording every change of the program state, so that
+# saving costs O(change); is opened on startup if journal_enabled is True.
+app.config["journal"] = None
+app.config["journal_enabled"] = True
+app.config["journal_file_name"] = "journal_program_state.pickle"
+# If True, each journal record is synced to disk before the request returns.
+app.config["journal_fsync"] = True
+# Number of journal records after which the journal is compacted (snapshot).
+app.config["journal_compact_every"] = 10000
+# Storage backend for changes: "journal" (append-only journal file) or
+# "sqlite" (batches, orders, and inventory in indexed SQLite tables).
+app.config["state_backend"] = "journal"
+app.config["sqlite_file_name"] = "brew_tracking.sqlite3"
+# If True, snapshots are pickled and written by a background worker from a copy
+# of the program state, so saving doesn't block the request.
+app.config["background_snapshots"] = True
+app.config["snapshot_worker"] = SnapshotWorker()
+# Caches parsed sales CSV files by content hash in memory and in csv_cache_dir,
+# so repeated forecasts with the same CSV file skip parsing.
+app.config["csv_cache_dir"] = "csv_cache"
+app.config["csv_cache_size"] = 8
+# Reads sales CSV files in chunks of csv_chunk_rows rows if True, so files
+# larger than the memory can be forecasted.
+app.config["stream_sales_csv"] = True
+app.config["csv_chunk_rows"] = 100000
+# Fits the models of all beer types in parallel worker processes; None uses
+# one process per processor, 1 fits the models in the Flask process.
+app.config["forecast_workers"] = None
+# Caches fitted model parameters by series and hyperparameters, so forecasting
+# the same data again skips fitting; model_cache_dir = None keeps them only in
+# memory, else they are also written to the directory and survive restarts.
+app.config["model_cache_size"] = 64
+app.config["model_cache_dir"] = "model_cache"
+# If sales data was only appended since the last forecast, the latest models
+# are updated with the new months instead of being fitted again, until more
+# than max_appended_periods months were appended; 0 always fits the models.
+app.config["max_appended_periods"] = 12
+# CSV cache and forecast engine are created by start_forecasting on first use
+# of the forecasting stack or, if prewarm_forecasting is True, by a background
+# thread started with the server.
+app.config["csv_cache"] = None
+app.config["forecast_engine"] = None
+app.config["forecasting_lock"] = threading.Lock()
+app.config["prewarm_forecasting"] = True
+# Runs forecasts in the background if True; /forecast_status shows progress.
+app.config["background_forecasts"] = True
+app.config["forecast_jobs"] = ForecastJobQueue(max_workers=2)
+# Plots of forecasts are rendered in memory in forecast_plot_format ("png" or
+# "svg") and served by /forecast_plot/<forecast ID> from forecast_plots.
+app.config["forecast_plot_format"] = "png"
+app.config["forecast_plots"] = PlotCache(max_entries=32)
+# ID of the forecast whose results are published; "" if there is none yet.
+app.config["latest_forecast_id"] = ""
 # Initialises tanks to model brewing process; handle on tanks object.
 app.config["tanks"] = Tanks()
 # Initialises inventory to model brewing process; handle on inventory object.
 app.config["inventory"] = Inventory()
+# Initialises index of which batch occupies which tank; handle on index object.
+app.config["tank_occupancy"] = TankOccupancy()
+# Initialises registry of batches grouped by phase; handle on registry object.
+app.config["phase_registry"] = PhaseRegistry()
+# Initialises calendar of future tank reservations; handle on calendar object.
+app.config["tank_calendar"] = TankCalendar()
+# Phases whose batches are advanced to the next phase automatically once the
+# phase's end time is reached, e.g. "bottling" -> "finished"; batches going
+# into "ferm" or "cond" are put into a free tank with the right capability and
+# volume or wait until such a tank is freed. The scheduler waits for the next
+# phase end time and is started in main() if phase_scheduler_enabled is True.
+app.config["auto_advance_phases"] = ["bottling"]
+app.config["phase_scheduler_enabled"] = True
+app.config["phase_scheduler"] = None
+# Serialises changes of the program state by requests and by the scheduler
+# thread, and snapshot copies of the state.
+app.config["phase_lock"] = threading.RLock()
+# Initialises sorted secondary indexes for paginated, filtered order and batch
+# lists; orders are sorted by date required, batches by batch ID.
+app.config["order_index"] = SortedIndex(
+    lambda order: datetime.strptime(order["date required"], "%d/%m/%Y"),
+    {"recipe": lambda order: order["recipe"],
+     "dispatched": lambda order: order["dispatched"]})
+app.config["batch_index"] = SortedIndex(
+    lambda batch: batch.id,
+    {"recipe": lambda batch: batch.beer_type,
+     "phase": lambda batch: batch.phase_current})
+# Default and maximum number of orders/batches shown per page.
+app.config["page_size"] = 50
+app.config["max_page_size"] = 1000
 # Handle on logger.
 app.config["logger"] = None
 # Filename of log file.
@@ -61,6 +180,11 @@ app.config["log_file_name"] = "brew_tracking.log"
 # configured correctly (doesn't block), the Flask server is accessible via the
 # public IP address remotely via the Internet, e.g., http://31.220.200.5:5000
 app.config["localhost"] = True
+# If True, the tracking page is streamed section by section, so the browser can
+# render header and forms while large tables are still being produced.
+app.config["stream_tracking_page"] = True
+# Number of HTML table rows that are sent together per chunk when streaming.
+app.config["stream_chunk_rows"] = 500
 # Autoregressive Integrated Moving Average (ARIMA) model for sales prediction.
 # Sets hyperparameters (hp) for seasonal ARIMA model; as the hp are set, it is
 # assumed that the past repeats itself in the future, thus the model
@@ -75,6 +199,25 @@ app.config["order"] = [0, 0, 0]
 # number of periods in season: e.g., 12 for 12 months or 52 for 52 weeks.
 app.config["number_past_periods"] = 12
 app.config["seasonal_order"] = [0, 1, 0, app.config["number_past_periods"]]
+# Auto-tuning evaluates every combination of the values in tuning_grid for
+# each beer type and ranks them by tuning_criterion: "aic", "bic", or
+# "holdout" (error of forecasting the last tuning_holdout_periods months);
+# fits are stopped after tuning_maxiter iterations, diverged fits discarded.
+app.config["tuning_grid"] = {"p": [0, 1, 2], "d": [0, 1], "q": [0, 1],
+                             "P": [0, 1], "D": [1], "Q": [0, 1]}
+app.config["tuning_criterion"] = "aic"
+app.config["tuning_holdout_periods"] = 6
+app.config["tuning_maxiter"] = 50
+# Winning hyperparameters of each beer type are saved to this file and, if
+# use_tuned_hyperparameters is True, used instead of order/seasonal_order.
+app.config["tuned_hyperparameters_file"] = "tuned_hyperparameters.json"
+app.config["use_tuned_hyperparameters"] = True
+# Number of weeks for which plan_production plans batches on the tanks.
+app.config["planning_horizon_weeks"] = 26
+# Number of calendar months (including the current one) for which bottles
+# finished by batches in production and forecasted sales are compared, e.g. 3
+# or 12.
+app.config["projection_months"] = 3
 
 def start_logging() -> logging.RootLogger:
     """Configures and starts logging
@@ -95,6 +238,359 @@ def start_logging() -> logging.RootLogger:
     logger = logging.getLogger()
     return logger
 
+def get_program_state() -> Dict[str, Any]:
+    """Collects the program state that is saved to and loaded from disk
+
+    Args:
+        No arguments
+
+    Returns:
+        program_state (dict): A dict representing the state of the program
+    """
+    program_state = {"batches": app.config["batches"],
+                     "orders": app.config["customer_orders"],
+                     "inventory": app.config["inventory"],
+                     "forecasts": app.config["monthly_sales_forecasts"],
+                     "reservations": app.config["tank_calendar"].reservations}
+    return program_state
+
+def set_program_state(program_state: Dict[str, Any]) -> None:
+    """Sets a loaded program state and rebuilds all indexes from it
+
+    Args:
+        program_state (dict): A dict representing the state of the program
+
+    Returns:
+        No returns
+    """
+    # Accesses program_state dictionary and sets loaded states.
+    app.config["batches"] = program_state["batches"]
+    app.config["customer_orders"] = program_state["orders"]
+    app.config["inventory"] = program_state["inventory"]
+    # Converts forecasts from save files written before forecasts were stored
+    # compactly, so that later snapshots no longer contain statsmodels results.
+    app.config["monthly_sales_forecasts"] = compact_forecasts(
+        program_state["forecasts"])
+    # Rebinds the batches' handles, as handles aren't saved with the batches.
+    for batch in app.config["batches"].values():
+        batch.tanks = app.config["tanks"]
+        batch.inventory = app.config["inventory"]
+    # Rebuilds tank occupancy index from the loaded batches.
+    app.config["tank_occupancy"].rebuild(app.config["batches"])
+    # Rebuilds phase registry from the loaded batches.
+    app.config["phase_registry"].rebuild(app.config["batches"])
+    # Rebuilds sorted order and batch indexes for the list pages.
+    app.config["order_index"].rebuild(app.config["customer_orders"])
+    app.config["batch_index"].rebuild(app.config["batches"])
+    # Rebuilds tank calendar; save files written before tanks could be
+    # reserved contain no reservations.
+    app.config["tank_calendar"].rebuild(program_state.get("reservations", {}))
+    # Rebuilds heap of phase end times from the loaded batches.
+    if app.config["phase_scheduler"] is not None:
+        app.config["phase_scheduler"].rebuild(app.config["batches"])
+
+def write_snapshot(program_state: Dict[str, Any]) -> None:
+    """Writes the program state to the pickle file (snapshot)
+
+    Args:
+        program_state (dict): A dict representing the state of the program
+
+    Returns:
+        No returns
+    """
+    filename = app.config["save_file_name"]
+    # Writes program_state to temporary file that replaces the pickle file, so
+    # a crash while writing doesn't corrupt the previous snapshot.
+    data = pickle.dumps(program_state, protocol=pickle.HIGHEST_PROTOCOL)
+    write_file_atomically(filename, data)
+
+def record_change(kind: str, payload: Any) -> None:
+    """Appends a change of the program state to the journal, if enabled
+
+    Args:
+        kind (str): A string representing the kind of change, e.g. "add_batch"
+        payload (Any): The data needed to replay the change
+
+    Returns:
+        No returns
+    """
+    journal = app.config["journal"]
+    if journal is None:
+        return
+    journal.append(kind, payload)
+    # Compacts journal into a snapshot, so that replay on startup stays fast.
+    if journal.num_records >= app.config["journal_compact_every"]:
+        compact_program_state()
+
+def compact_program_state() -> Optional[str]:
+    """Writes a snapshot of the program state and discards replayed journal
+
+    Args:
+        No arguments
+
+    Returns:
+        job_id (str): A string representing ID of the background snapshot job
+            or None if the snapshot was written directly
+    """
+    journal = app.config["journal"]
+    # Rotates journal before copying, so every change that is not contained in
+    # the copy is in the new journal file; replaying a change that is also in
+    # the copy is harmless, as records set values instead of adding to them.
+    # No change may happen between rotating and copying, and the dicts
+    # mustn't change while they are copied.
+    with app.config["phase_lock"]:
+        journal_seq = journal.rotate() if journal is not None else 0
+        program_state = copy_program_state(get_program_state())
+    # Records which journal records are contained in the snapshot.
+    program_state["journal_seq"] = journal_seq
+    # Deletes the rotated journal files once the snapshot contains them.
+    on_success = None
+    if journal is not None:
+        on_success = partial(journal.discard_upto, journal_seq)
+    if app.config["background_snapshots"]:
+        job_id = app.config["snapshot_worker"].submit(
+            program_state, app.config["save_file_name"], on_success)
+        return job_id
+    write_snapshot(program_state)
+    if on_success is not None:
+        on_success()
+    return None
+
+def apply_journal_record(program_state: Dict[str, Any], kind: str,
+                         payload: Any) -> None:
+    """Replays one journal record on a loaded program state
+
+    Args:
+        program_state (dict): A dict representing the state of the program
+        kind (str): A string representing the kind of change
+        payload (Any): The data needed to replay the change
+
+    Returns:
+        No returns
+    """
+    batches = program_state["batches"]
+    orders = program_state["orders"]
+    inventory = program_state["inventory"]
+    if kind == "add_batch":
+        handle = {"inventory": inventory, "tanks": app.config["tanks"]}
+        batches[payload["id"]] = Batch(payload["id"], payload["beer_type"],
+                                       payload["volume"], handle)
+    elif kind == "delete_batch":
+        batches.pop(payload, None)
+    elif kind == "change_phase":
+        # Sets recorded phase and datetimes; bottles that were put into the
+        # inventory are replayed by their own "inventory" record.
+        set_batch_phase_state(batches[payload["id"]], payload["phase_state"])
+    elif kind == "register_order":
+        orders[payload["invoice number"]] = payload
+    elif kind == "dispatch_order":
+        orders[payload]["dispatched"] = "dispatched"
+    elif kind == "delete_order":
+        orders.pop(payload, None)
+    elif kind == "inventory":
+        # Sets the recorded quantity; the delta is only kept for information.
+        inventory_item_quantity = inventory.get_inv_items_quantity(
+            payload["beer_type"])
+        inventory_item_quantity["num"] = payload["num"]
+    elif kind == "reserve_tank":
+        program_state.setdefault("reservations", {})[payload["id"]] = payload
+    elif kind == "cancel_reservation":
+        program_state.setdefault("reservations", {}).pop(payload, None)
+
+def restore_program_state() -> None:
+    """Loads the snapshot and replays all journal records that are newer
+
+    Args:
+        No arguments
+
+    Returns:
+        No returns
+    """
+    journal = app.config["journal"]
+    try:
+        filename = app.config["save_file_name"]
+        # rb to read binary file.
+        with open(filename, "rb") as file:
+            program_state = pickle.load(file)
+    except FileNotFoundError:
+        # Without journal, there is nothing to restore the state from.
+        if journal is None:
+            raise
+        program_state = {"batches": {}, "orders": {},
+                         "inventory": Inventory(), "forecasts": {},
+                         "reservations": {}}
+    # True if batches, orders, and inventory are stored in SQLite tables.
+    if isinstance(journal, SqliteStateStore):
+        # Imports existing state from the pickle file once into empty tables.
+        if journal.is_empty():
+            journal.import_program_state(program_state)
+        # Else tables hold the current state; pickle file holds forecasts.
+        else:
+            forecasts = program_state["forecasts"]
+            program_state = journal.load_program_state(app.config["tanks"])
+            program_state["forecasts"] = forecasts
+    # Snapshots saved before the journal existed contain no journal records.
+    journal_seq = program_state.get("journal_seq", 0)
+    if journal is not None:
+        for _, kind, payload in journal.read_records(journal_seq):
+            apply_journal_record(program_state, kind, payload)
+        # New records must be numbered after the records in the snapshot.
+        journal.last_seq = max(journal.last_seq, journal_seq)
+    set_program_state(program_state)
+
+def start_journal() -> None:
+    """Opens journal/SQLite store and restores the program state from it
+
+    Args:
+        No arguments
+
+    Returns:
+        No returns
+    """
+    if app.config["state_backend"] == "sqlite":
+        app.config["journal"] = SqliteStateStore(
+            app.config["sqlite_file_name"])
+    else:
+        app.config["journal"] = StateJournal(app.config["journal_file_name"],
+                                             app.config["journal_fsync"])
+    restore_program_state()
+    log_message = ("Program state was restored using the {} "
+                   + "backend.").format(app.config["state_backend"])
+    app.config["logger"].info(log_message)
+
+def apply_phase_change(batch_id: str, phase: str, tank_name: str) -> None:
+    """Changes batch's phase and tank, and updates indexes and journal
+
+    Args:
+        batch_id (str): A string representing the batch ID
+        phase (str): A string representing the new phase of the batch
+        tank_name (str): A string representing the new tank of the batch or
+            "not applicable"
+
+    Returns:
+        No returns
+    """
+    with app.config["phase_lock"]:
+        batch = app.config["batches"][batch_id]
+        previous_tank = batch.phase_current_tank
+        bottles_were_in_inv = batch.bottles_put_in_inventory
+        batch.phase_current = phase
+        batch.phase_current_tank = tank_name
+        batch.set_phase_start_end_datetimes()
+        # Re-sorts batch into the batch index's buckets of its new phase.
+        app.config["batch_index"].add(batch_id, batch)
+        record_change("change_phase", {
+            "id": batch_id, "phase_state": get_batch_phase_state(batch)})
+        # True if finishing the batch put its bottles into the inventory.
+        if batch.bottles_put_in_inventory and not bottles_were_in_inv:
+            record_change("inventory", {
+                "beer_type": batch.beer_type,
+                "delta": batch.num_bottles_to_inv,
+                "num": app.config["inventory"].get_inv_items_quantity(
+                    batch.beer_type)["num"]})
+        scheduler = app.config["phase_scheduler"]
+        if scheduler is not None:
+            # Replaces the deadline of the batch's previous phase.
+            scheduler.schedule(batch)
+            # Batches waiting for a tank may fit into the freed tank.
+            if previous_tank not in ["", "not applicable", tank_name]:
+                scheduler.release_waiting()
+    info_message = "Batch {} was changed to phase {}.".format(batch_id, phase)
+    app.config["logger"].info(info_message)
+
+def advance_batch(batch_id: str, phase: str) -> bool:
+    """Advances batch to its next phase when its phase ended (by scheduler)
+
+    Args:
+        batch_id (str): A string representing the batch ID
+        phase (str): A string representing the phase that ended
+
+    Returns:
+        (bool): False if the batch has to wait for a free tank, else True
+    """
+    with app.config["phase_lock"]:
+        batch = app.config["batches"].get(batch_id)
+        # Batch was deleted or its phase was changed by hand meanwhile.
+        if batch is None or batch.phase_current != phase:
+            return True
+        if phase not in app.config["auto_advance_phases"]:
+            log_message = ("Phase {} of batch {} has "
+                           + "ended.").format(phase, batch_id)
+            app.config["logger"].info(log_message)
+            return True
+        next_phase = get_next_phase(phase)
+        tank_name = "not applicable"
+        if next_phase in ["ferm", "cond"]:
+            tank_name = find_free_tank(app.config["tanks"],
+                                       app.config["tank_occupancy"], batch,
+                                       next_phase, app.config["tank_calendar"])
+            if tank_name == "":
+                log_message = ("Batch {} waits for a free tank for "
+                               + "phase {}.").format(batch_id, next_phase)
+                app.config["logger"].info(log_message)
+                return False
+        apply_phase_change(batch_id, next_phase, tank_name)
+    return True
+
+def start_phase_scheduler() -> PhaseDeadlineScheduler:
+    """Schedules the phase end times of all batches and starts the scheduler
+
+    Args:
+        No arguments
+
+    Returns:
+        scheduler (PhaseDeadlineScheduler): The started scheduler
+    """
+    scheduler = PhaseDeadlineScheduler(advance_batch)
+    scheduler.rebuild(app.config["batches"])
+    app.config["phase_scheduler"] = scheduler
+    scheduler.start()
+    return scheduler
+
+def render_rows(rows: Iterable[Iterable[object]]) -> Iterator[str]:
+    """Yields one HTML table row per row of cell values
+
+    Args:
+        rows (iterable): An iterable of rows, each an iterable of cell values
+
+    Returns:
+        (Iterator): An iterator of strings, each representing one HTML row
+    """
+    # Each row is built once and yielded, so the rows can either be joined
+    # once or streamed; the accumulated table string is never copied per row.
+    for row in rows:
+        yield ("<tr>"
+               + "".join(["<td>{}</td>".format(cell) for cell in row])
+               + "</tr>")
+
+def render_options(values: Iterable[str]) -> Iterator[str]:
+    """Yields one HTML drop-down list option per value
+
+    Args:
+        values (iterable): An iterable of strings representing option values
+
+    Returns:
+        (Iterator): An iterator of strings, each representing one HTML option
+    """
+    for value in values:
+        yield '<option value="{0}">{0}</option>'.format(value)
+
+def iter_batch_rows(batches: Iterable[Batch]) -> Iterator[str]:
+    """Yields HTML table rows containing the batches' information
+
+    Args:
+        batches (iterable): An iterable of instances of class Batch
+
+    Returns:
+        (Iterator): An iterator of strings representing HTML rows of batches
+    """
+    # Iter. over each batch object and inserts batches' values into HTML rows.
+    return render_rows((batch.id, batch.beer_type, batch.volume,
+                        batch.phase_current, batch.phase_current_tank,
+                        batch.get_start_end_dt()["end"],
+                        batch.phase_last_completed, batch.num_bottles_to_inv)
+                       for batch in batches)
+
 def update_batch_table(batches: Dict[str, Batch]) -> str:
     """Creates HTML table containing all the batches' information
 
@@ -104,154 +600,66 @@ def update_batch_table(batches: Dict[str, Batch]) -> str:
     Returns:
         batch_table (str): A string representing HTML table of batches' info
     """
-    batch_table = ""
-    # Iter. over each batch object and inserts batches' values into HTML table.
-    for batch in batches.values():
-        batch_table = (batch_table
-                       + "<tr>"
-                       + "<td>{}</td>".format(batch.id)
-                       + "<td>{}</td>".format(batch.beer_type)
-                       + "<td>{}</td>".format(batch.volume)
-                       + "<td>{}</td>".format(batch.phase_current)
-                       + "<td>{}</td>".format(batch.phase_current_tank)
-                       + "<td>{}</td>".format(batch.get_start_end_dt()["end"])
-                       + "<td>{}</td>".format(batch.phase_last_completed)
-                       + "<td>{}</td>".format(batch.num_bottles_to_inv)
-                       + "</tr>")
+    batch_table = "".join(iter_batch_rows(batches.values()))
     return batch_table
 
-def update_inventory_table(inventory: Inventory) -> str:
-    """Creates HTML table containing all inventory values
+def iter_inventory_rows(inventory: Inventory) -> Iterator[str]:
+    """Yields HTML table rows containing all inventory values
 
     Args:
         inventory (Inventory): Instance of class Inventory repres. entire inv.
 
     Returns:
-        inventory_table (str): A string represe. HTML table of inventory values
+        (Iterator): An iterator of strings representing HTML rows of inventory
     """
-    inventory_table = ""
     # Gets names of inventory items.
     inventory_items = inventory.get_inv_items_names()
-    # Iter. over each inventory item and inserts inv. values into HTML table.
-    for inventory_item in inventory_items:
-        # Uses inv._item to get value of inv. instance var with same name.
-        inventory_item_quant = inventory.get_inv_items_quantity(inventory_item)
-        # Gets inventory item's quantity (number of bottles).
-        inventory_quantity = inventory_item_quant["num"]
-        inventory_table = (inventory_table
-                           + "<tr>"
-                           + "<td>{}</td>".format(inventory_item)
-                           + "<td>{}</td>".format(str(inventory_quantity))
-                           + "</tr>")
-    return inventory_table
-
-def update_process_tables(batches: Dict[str, Batch]) -> Tuple[str]:
-    """Creates HTML tables containing brewing order and process tracking info
+    # Iter. over each inventory item and inserts inv. values into HTML rows;
+    # gets inventory item's quantity (number of bottles) by item name.
+    return render_rows(
+        (inventory_item,
+         str(inventory.get_inv_items_quantity(inventory_item)["num"]))
+        for inventory_item in inventory_items)
+
+def iter_process_rows(phases: PhaseRegistry, phase: str) -> Iterator[str]:
+    """Yields HTML table rows containing process tracking info of one phase
 
     Args:
-        batches (dict): A dictionary representing all batches
+        phases (PhaseRegistry): Registry of all batches grouped by phase
+        phase (str): A string representing the phase, e.g. "ferm"
 
     Returns:
-        (Tuble):
-            hot_brew_table (str): A string repre. HTML table of hot brew. phase
-            ferm_table (str): A string repres. HTML table of fermentation phase
-            cond_table (str): A string repres. HTML table of conditioning phase
-            bottling_table (str): A string repres. HTML table of bottling phase
+        (Iterator): An iterator of strings representing HTML rows of phase
     """
-    hot_brew_table = ""
-    ferm_table = ""
-    cond_table = ""
-    bottling_table = ""
-    # True if there are no batches in the batches dict; returns empty tables.
-    if not batches:
-        return "", "", "", ""
-    # Iter. over each batch and inserts batches' values into proper HTML table.
-    for batch in batches.values():
-        # True if batch is not assigned to a tank.
-        if batch.phase_current_tank in ["", "not applicable"]:
-            max_capacity = ""
-        # If batch is assigned to a tank, get tank name and capacity.
-        else:
-            tank_name = batch.phase_current_tank
-            tank_value = batch.tanks.get_tank_value(tank_name)
-            max_capacity = tank_value["volume"]
-        # True if batch in hot brew.; writes batches' info in hot brew table.
-        if batch.phase_current == "hot brewing":
-            phase_current_start_dt = batch.get_start_end_dt()["start"]
-            phase_current_end_dt = batch.get_start_end_dt()["end"]
-            hot_brew_table = (hot_brew_table
-                              + "<tr>"
-                              + "<td>{}</td>".format(batch.phase_current_tank)
-                              + "<td>{}</td>".format(batch.volume)
-                              + "<td>{}</td>".format(phase_current_start_dt)
-                              + "<td>{}</td>".format(phase_current_end_dt)
-                              + "<td>{}</td>".format(batch.id)
-                              + "</tr>")
-        # True if batch in fermentation; writes batches' info in ferm. table.
-        elif batch.phase_current == "ferm":
-            phase_current_start_dt = batch.get_start_end_dt()["start"]
-            phase_current_end_dt = batch.get_start_end_dt()["end"]
-            ferm_table = (ferm_table
-                          + "<tr>"
-                          + "<td>{}</td>".format(batch.phase_current_tank)
-                          + "<td>{}</td>".format(max_capacity)
-                          + "<td>{}</td>".format(batch.volume)
-                          + "<td>{}</td>".format(phase_current_start_dt)
-                          + "<td>{}</td>".format(phase_current_end_dt)
-                          + "<td>{}</td>".format(batch.id)
-                          + "</tr>")
-        # True if batch in conditioning; writes batches' info in cond. table.
-        elif batch.phase_current == "cond":
-            phase_current_start_dt = batch.get_start_end_dt()["start"]
-            phase_current_end_dt = batch.get_start_end_dt()["end"]
-            cond_table = (cond_table
-                          + "<tr>"
-                          + "<td>{}</td>".format(batch.phase_current_tank)
-                          + "<td>{}</td>".format(max_capacity)
-                          + "<td>{}</td>".format(batch.volume)
-                          + "<td>{}</td>".format(phase_current_start_dt)
-                          + "<td>{}</td>".format(phase_current_end_dt)
-                          + "<td>{}</td>".format(batch.id)
-                          + "</tr>")
-        # True if batch in bottling; writes batches' info in bottling table.
-        elif batch.phase_current == "bottling":
-            phase_current_start_dt = batch.get_start_end_dt()["start"]
-            phase_current_end_dt = batch.get_start_end_dt()["end"]
-            bottling_table = (bottling_table
-                              + "<tr>"
-                              + "<td>{}</td>".format(batch.phase_current_tank)
-                              + "<td>{}</td>".format(batch.volume)
-                              + "<td>{}</td>".format(phase_current_start_dt)
-                              + "<td>{}</td>".format(phase_current_end_dt)
-                              + "<td>{}</td>".format(batch.id)
-                              + "</tr>")
-    return hot_brew_table, ferm_table, cond_table, bottling_table
-
-def update_order_table(orders: Dict[str, Dict[str, str]]) -> str:
-    """Creates HTML table containing registered customer order information
+    # Iter. over batches in the phase only; finished batches aren't touched.
+    for batch in phases.get_batches(phase):
+        phase_current_start_end_dt = batch.get_start_end_dt()
+        row = [batch.phase_current_tank]
+        # Fermentation and conditioning tables also show the tank capacity.
+        if phase in ["ferm", "cond"]:
+            tank_value = batch.tanks.get_tank_value(batch.phase_current_tank)
+            row.append(tank_value["volume"])
+        row.extend([batch.volume, phase_current_start_end_dt["start"],
+                    phase_current_start_end_dt["end"], batch.id])
+        yield from render_rows([row])
+
+def iter_order_rows(orders: Iterable[Dict[str, str]]) -> Iterator[str]:
+    """Yields HTML table rows containing registered customer order information
 
     Args:
-        orders (dict): A dictionary representing all customer orders
+        orders (iterable): An iterable of dicts representing customer orders
 
     Returns:
-        order_table (str): A string represent. HTML table of customer orders
+        (Iterator): An iterator of strings representing HTML rows of orders
     """
-    order_table = ""
-    # Iterates over each order and inserts order values into HTML table.
-    for order in orders.values():
-        order_table = (order_table
-                       + "<tr>"
-                       + "<td>{}</td>".format(order["invoice number"])
-                       + "<td>{}</td>".format(order["customer"])
-                       + "<td>{}</td>".format(order["date required"])
-                       + "<td>{}</td>".format(order["recipe"])
-                       + "<td>{}</td>".format(order["gyle number"])
-                       + "<td>{}</td>".format(order["quantity ordered"])
-                       + "<td>{}</td>".format(order["dispatched"])
-                       + "</tr>")
-    return order_table
-
-def update_growth_rate_table(growth_rates: pd.Series) -> str:
+    # Iterates over each order and inserts order values into HTML rows.
+    return render_rows((order["invoice number"], order["customer"],
+                        order["date required"], order["recipe"],
+                        order["gyle number"], order["quantity ordered"],
+                        order["dispatched"])
+                       for order in orders)
+
+def update_growth_rate_table(growth_rates: "pd.Series") -> str:
     """Creates HTML table containing average sales growth rates
 
     Args:
@@ -260,17 +668,11 @@ def update_growth_rate_table(growth_rates: pd.Series) -> str:
     Returns:
         growth_table (str): A string repr. HTML table of avg sales growth rates
     """
-    growth_table = ""
-    # Iterates over each growth rate and inserts values into HTML table.
-    for date_time, growth_rate in growth_rates.items():
-        # Formats date_time (of corresponding average growth rate).
-        date_time = date_time.strftime("%d/%m/%Y")
-        growth_table = (growth_table
-                        + "<tr>"
-                        + "<td>{}</td>".format(date_time)
-                        # Converts growth rate in % with one decimal place.
-                        + "<td>{0:.1f}%</td>".format(growth_rate * 100)
-                        + "</tr>")
+    # Iterates over each growth rate and inserts values into HTML table;
+    # formats date_time and converts growth rate in % with one decimal place.
+    growth_table = "".join(render_rows(
+        (date_time.strftime("%d/%m/%Y"), "{0:.1f}%".format(growth_rate * 100))
+        for date_time, growth_rate in growth_rates.items()))
     return growth_table
 
 def update_csv_list(all_uploaded_csv: List[str]) -> str:
@@ -282,66 +684,402 @@ def update_csv_list(all_uploaded_csv: List[str]) -> str:
     Returns:
         csv_list (str): A string represe. HTML drop-down list of CSV filenames
     """
-    csv_list = ""
     # Iter. over each CSV filename and inserts values into HTML drop-down list.
-    for csv_file in all_uploaded_csv:
-        csv_list = (csv_list
-                    + '<option value="{0}">{0}</option>'.format(csv_file))
+    csv_list = "".join(render_options(all_uploaded_csv))
     return csv_list
 
-def update_three_months_table(three_months: Dict[str, Dict[str, int]]) -> str:
-    """Creates HTML table containing 3 months forecast or inventory data
+def update_months_table(months: Dict[str, List[int]],
+                        month_starts: List[datetime]) -> str:
+    """Creates HTML table containing monthly forecast or inventory data
 
     Args:
-        three_months (dict): A dictionary representing 3 months of data
+        months (dict): A dict mapping beer types to lists of monthly values
+        month_starts (list): A list of datetimes representing the months
 
     Returns:
-        three_mon_table (str): A string represe. HTML table of 3 months of data
+        months_table (str): A string representing HTML table of monthly data
     """
-    three_mon_table = ""
-    months = three_months
+    header = "".join("<th>{}</th>".format(month_start.strftime("%m/%Y"))
+                     for month_start in month_starts)
     # Iterates over each beer type and inserts values into HTML table.
-    for beer in months:
-        three_mon_table = (three_mon_table
-                           + "<tr>"
-                           + "<td>{}</td>".format(beer)
-                           + "<td>{}</td>".format(months[beer]["this_month"])
-                           + "<td>{}</td>".format(months[beer]["next_month"])
-                           + "<td>{}</td>".format(months[beer]["third_month"])
-                           + "</tr>")
-    return three_mon_table
+    months_table = ("<table><tr><th></th>" + header + "</tr>"
+                    + "".join(render_rows((beer, *months[beer])
+                                          for beer in months))
+                    + "</table>")
+    return months_table
 
-@app.route("/", methods=["GET", "POST"])
-def interface_tracking() -> str:
-    """Creates HTML to track brew, add/edit/del batches&orders, & predict sales
+def update_reservation_table(reservations: List[Dict[str, Any]]) -> str:
+    """Creates HTML table containing the tank reservations
 
     Args:
-        No arguments
+        reservations (list): A list of dicts representing the reservations
 
     Returns:
-        (str): A string representing HTML code for start page / user interface
+        (str): A string representing HTML table rows of the reservations
     """
-    batches = app.config["batches"]
-    orders = app.config["customer_orders"]
+    time_format = "%d/%m/%Y %H:%M"
+    return "".join(render_rows(
+        (reservation["id"], reservation["tank"],
+         reservation["start"].strftime(time_format),
+         reservation["end"].strftime(time_format), reservation["label"])
+        for reservation in reservations))
+
+def update_production_plan_table(planned_batches: List[Dict[str, Any]]
+                                 ) -> str:
+    """Creates HTML table containing the planned batches
+
+    Args:
+        planned_batches (list): A list of dicts representing planned batches
+
+    Returns:
+        (str): A string representing HTML table rows of the planned batches
+    """
+    time_format = "%d/%m/%Y %H:%M"
+    return "".join(render_rows(
+        (planned["brew_start"].strftime(time_format), planned["beer_type"],
+         planned["volume"], planned["fermenter"], planned["conditioner"],
+         planned["bottling_start"].strftime(time_format),
+         planned["finish"].strftime(time_format), planned["bottles"])
+        for planned in planned_batches))
+
+def get_production_plan(monthly_forecasts: Dict[str, Any],
+                        beer_types: List[str]) -> Dict[str, Any]:
+    """Plans batches over the planning horizon to cover forecasted sales
+
+    Args:
+        monthly_forecasts (dict): A dict mapping beer types to forecasts
+        beer_types (list): A list representing the beer types to plan
+
+    Returns:
+        (dict): A dict representing the plan, see ProductionScheduler.plan
+    """
+    now = datetime.now()
+    # Tanks and bottling line are busy until batches in production leave.
+    in_flight = get_in_flight_schedule(app.config["phase_registry"],
+                                       app.config["tanks"], now)
+    # Planned batches are kept out of reserved tanks.
+    scheduler = ProductionScheduler(app.config["tanks"], now,
+                                    app.config["planning_horizon_weeks"],
+                                    in_flight["tank_free_at"],
+                                    in_flight["bottling_free_at"],
+                                    app.config["tank_calendar"])
     inventory = app.config["inventory"]
-    # Creates HTML table containing all batches.
-    html_batch_table = update_batch_table(batches)
-    # Creates HTML table containing all inventory.
-    html_inventory_table = update_inventory_table(inventory)
-    # Creates HTML table containing all orders.
-    html_order_table = update_order_table(orders)
-    # Creates HTML tables containing all process tracking tables.
-    hot_brew, ferm, cond, bottling = update_process_tables(batches)
-    html_hot_brewing_table = hot_brew
-    html_ferm_table = ferm
-    html_cond_table = cond
-    html_bottling_table = bottling
+    supply = scheduler.get_supply(
+        {beer_type: inventory.get_inv_items_quantity(beer_type)["num"]
+         for beer_type in beer_types}, in_flight["finishing"], beer_types)
+    demand = {}
+    for beer_type in beer_types:
+        # Months without forecast have no demand; negative forecasts neither.
+        predicted_mean = monthly_forecasts[beer_type].predicted_mean
+        demand[beer_type] = [max(float(predicted_mean.get(month_start, 0)), 0)
+                             for month_start in scheduler.month_starts]
+    return scheduler.plan(demand, supply)
+
+def get_list_filters(values: Dict[str, str]) -> Dict[str, Any]:
+    """Parses filter, sort, and page size parameters of order/batch lists
+
+    Args:
+        values (dict): A dict-like object repres. request args and form data
+
+    Returns:
+        filters (dict): A dict representing the parsed filter parameters
+    """
+    filters = {"recipe": None, "dispatched": None, "phase": None,
+               "date_from": None, "date_to": None, "descending": False,
+               "page_size": app.config["page_size"]}
+    # Empty strings and "any" mean that the list isn't filtered by the value.
+    for name in ["recipe", "phase"]:
+        if values.get(name) not in [None, "", "any"]:
+            filters[name] = values.get(name)
+    # Undispatched orders are stored with an empty string as dispatch status.
+    if values.get("dispatched") == "dispatched":
+        filters["dispatched"] = "dispatched"
+    elif values.get("dispatched") == "open":
+        filters["dispatched"] = ""
+    # Dates are inputted via HTML date inputs, thus in the format YYYY-MM-DD.
+    for name in ["date_from", "date_to"]:
+        try:
+            filters[name] = datetime.strptime(values.get(name, ""), "%Y-%m-%d")
+        except ValueError:
+            filters[name] = None
+    filters["descending"] = values.get("sort") == "desc"
+    try:
+        page_size = int(values.get("page_size", app.config["page_size"]))
+    except ValueError:
+        page_size = app.config["page_size"]
+    # Limits the page size so that a single page can't dump all items again.
+    filters["page_size"] = min(max(page_size, 1), app.config["max_page_size"])
+    return filters
+
+def get_page_number(values: Dict[str, str], page_param: str) -> int:
+    """Parses page number parameter; invalid input gives the first page
+
+    Args:
+        values (dict): A dict-like object repres. request args and form data
+        page_param (str): A string representing the name of the page parameter
+
+    Returns:
+        page (int): An int representing the requested page number (>= 1)
+    """
+    try:
+        page = int(values.get(page_param, 1))
+    except ValueError:
+        page = 1
+    return max(page, 1)
+
+def get_order_page(orders: Dict[str, Dict[str, str]], filters: Dict[str, Any],
+                   page: int) -> Tuple[List[Dict[str, str]], int, int]:
+    """Gets one page of orders via the sorted order index
+
+    Args:
+        orders (dict): A dictionary representing all customer orders
+        filters (dict): A dict representing the parsed filter parameters
+        page (int): An int representing the requested page number
+
+    Returns:
+        (tuple):
+            order_page (list): A list representing the orders on the page
+            page (int): An int representing the page number that is shown
+            page_count (int): An int representing the number of pages
+    """
+    page_size = filters["page_size"]
+    # Orders are queried from the database via its indexes if it holds them.
+    if (app.config["state_backend"] == "sqlite"
+            and app.config["journal"] is not None):
+        return get_order_page_from_store(filters, page)
+    # Gets the number of matching orders to clamp page to the last page.
+    _, total = app.config["order_index"].query(
+        {"recipe": filters["recipe"], "dispatched": filters["dispatched"]},
+        filters["date_from"], filters["date_to"], limit=0)
+    page_count = max((total + page_size - 1) // page_size, 1)
+    page = min(page, page_count)
+    order_ids, _ = app.config["order_index"].query(
+        {"recipe": filters["recipe"], "dispatched": filters["dispatched"]},
+        filters["date_from"], filters["date_to"],
+        offset=(page - 1) * page_size, limit=page_size,
+        descending=filters["descending"])
+    order_page = [orders[order_id] for order_id in order_ids]
+    return order_page, page, page_count
+
+def get_order_page_from_store(filters: Dict[str, Any], page: int
+                              ) -> Tuple[List[Dict[str, str]], int, int]:
+    """Gets one page of orders from the SQLite store via its indexes
+
+    Args:
+        filters (dict): A dict representing the parsed filter parameters
+        page (int): An int representing the requested page number
+
+    Returns:
+        (tuple):
+            order_page (list): A list representing the orders on the page
+            page (int): An int representing the page number that is shown
+            page_count (int): An int representing the number of pages
+    """
+    page_size = filters["page_size"]
+    store = app.config["journal"]
+    query = partial(store.query_orders, filters["recipe"],
+                    filters["dispatched"], filters["date_from"],
+                    filters["date_to"], descending=filters["descending"])
+    # Gets the number of matching orders to clamp page to the last page.
+    _, total = query(limit=0)
+    page_count = max((total + page_size - 1) // page_size, 1)
+    page = min(page, page_count)
+    order_page, _ = query(offset=(page - 1) * page_size, limit=page_size)
+    return order_page, page, page_count
+
+def get_batch_page(batches: Dict[str, Batch], filters: Dict[str, Any],
+                   page: int) -> Tuple[List[Batch], int, int]:
+    """Gets one page of batches via the sorted batch index
+
+    Args:
+        batches (dict): A dictionary representing all batches
+        filters (dict): A dict representing the parsed filter parameters
+        page (int): An int representing the requested page number
+
+    Returns:
+        (tuple):
+            batch_page (list): A list representing the batches on the page
+            page (int): An int representing the page number that is shown
+            page_count (int): An int representing the number of pages
+    """
+    page_size = filters["page_size"]
+    _, total = app.config["batch_index"].query(
+        {"recipe": filters["recipe"], "phase": filters["phase"]}, limit=0)
+    page_count = max((total + page_size - 1) // page_size, 1)
+    page = min(page, page_count)
+    batch_ids, _ = app.config["batch_index"].query(
+        {"recipe": filters["recipe"], "phase": filters["phase"]},
+        offset=(page - 1) * page_size, limit=page_size,
+        descending=filters["descending"])
+    batch_page = [batches[batch_id] for batch_id in batch_ids]
+    return batch_page, page, page_count
+
+def get_filter_params(values: Dict[str, str]) -> Dict[str, str]:
+    """Gets filter parameters of request that must be kept by page links
+
+    Args:
+        values (dict): A dict-like object repres. request args and form data
+
+    Returns:
+        filter_params (dict): A dict representing the non-empty parameters
+    """
+    param_names = ["recipe", "dispatched", "phase", "date_from", "date_to",
+                   "sort", "page_size", "order_page", "batch_page"]
+    filter_params = {name: values.get(name) for name in param_names
+                     if values.get(name) not in [None, ""]}
+    return filter_params
+
+def render_selected_options(filter_params: Dict[str, str], name: str,
+                            choices: List[Tuple[str, str]]) -> str:
+    """Creates HTML drop-down list options with the current value selected
+
+    Args:
+        filter_params (dict): A dict representing current filter parameters
+        name (str): A string representing the name of the filter parameter
+        choices (list): A list of (value, label) tuples of the options
+
+    Returns:
+        (str): A string representing HTML code of the options
+    """
+    return "".join(['<option value="{0}"{2}>{1}</option>'.format(
+        value, label,
+        " selected" if filter_params.get(name, "") == value else "")
+                    for value, label in choices])
+
+def render_filter_form(action: str, filter_params: Dict[str, str],
+                       show_orders: bool, show_batches: bool) -> str:
+    """Creates HTML form to filter, sort, and page order and/or batch lists
+
+    Args:
+        action (str): A string representing the URL the form is sent to
+        filter_params (dict): A dict representing current filter parameters
+        show_orders (bool): Bool where True shows the order filters
+        show_batches (bool): Bool where True shows the batch filters
+
+    Returns:
+        filter_form (str): A string representing HTML code of filter form
+    """
+    filter_form = ('<form action="{}" method="GET">'.format(action)
+                   + 'Recipe: <select name="recipe">'
+                   + render_selected_options(filter_params, "recipe",
+                                             [("", "Any"),
+                                              ("dunkers", "Dunkers"),
+                                              ("pilsner", "Pilsner"),
+                                              ("red_helles", "Red Helles")])
+                   + "</select> ")
+    if show_orders:
+        filter_form = (filter_form
+                       + 'Dispatched: <select name="dispatched">'
+                       + render_selected_options(
+                           filter_params, "dispatched",
+                           [("", "Any"), ("dispatched", "Dispatched"),
+                            ("open", "Not dispatched")])
+                       + "</select> "
+                       + 'Date required from: <input type="date" '
+                       + 'name="date_from" value="{}"> '.format(
+                           filter_params.get("date_from", ""))
+                       + 'to: <input type="date" name="date_to" '
+                       + 'value="{}"> '.format(filter_params.get("date_to",
+                                                                 "")))
+    if show_batches:
+        filter_form = (filter_form
+                       + 'Phase: <select name="phase">'
+                       + render_selected_options(
+                           filter_params, "phase",
+                           [("", "Any"), ("hot brewing", "Hot brewing"),
+                            ("ferm", "Fermentation"),
+                            ("cond", "Conditioning"),
+                            ("bottling", "Bottling"),
+                            ("finished", "Finished")])
+                       + "</select> ")
+    filter_form = (filter_form
+                   + 'Sort: <select name="sort">'
+                   + render_selected_options(filter_params, "sort",
+                                             [("", "Ascending"),
+                                              ("desc", "Descending")])
+                   + "</select> "
+                   + 'Page size: <input type="number" name="page_size" '
+                   + 'min="1" value="{}"> '.format(
+                       filter_params.get("page_size", app.config["page_size"]))
+                   + '<input type="submit" value="Filter"></form>')
+    return filter_form
+
+def render_page_links(action: str, filter_params: Dict[str, str],
+                      page_param: str, page: int, page_count: int) -> str:
+    """Creates HTML links to the previous and next page of a list
+
+    Args:
+        action (str): A string representing the URL of the paginated page
+        filter_params (dict): A dict representing current filter parameters
+        page_param (str): A string representing the name of page parameter
+        page (int): An int representing the page number that is shown
+        page_count (int): An int representing the number of pages
+
+    Returns:
+        page_links (str): A string representing HTML code of page links
+    """
+    # Pages that are linked, if they exist, and their link labels.
+    targets = []
+    if page > 1:
+        targets = targets + [(1, "First"), (page - 1, "Previous")]
+    if page < page_count:
+        targets = targets + [(page + 1, "Next"), (page_count, "Last")]
+    page_links = "Page {} of {} ".format(page, page_count)
+    for target_page, label in targets:
+        # Keeps filters and the other list's page when switching pages.
+        params = dict(filter_params)
+        params[page_param] = str(target_page)
+        page_links = (page_links
+                      + '<a href="{}?{}">{}</a> '.format(action,
+                                                         urlencode(params),
+                                                         label))
+    return page_links
+
+def chunk_rows(rows: Iterable[str], chunk_size: int) -> Iterator[str]:
+    """Joins HTML rows into chunks so that a stream isn't flushed per row
+
+    Args:
+        rows (iterable): An iterable of strings representing HTML rows
+        chunk_size (int): An int representing the number of rows per chunk
+
+    Returns:
+        (Iterator): An iterator of strings, each representing joined rows
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        # True if chunk is full; yields it and starts a new one.
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+def generate_tracking_page(batch_list: List[Batch],
+                           order_list: List[Dict[str, str]],
+                           inventory: Inventory, phases: PhaseRegistry,
+                           page_html: Dict[str, str]) -> Iterator[str]:
+    """Yields HTML of the tracking page section by section
+
+    Args:
+        batch_list (list): A list representing the batches on the page
+        order_list (list): A list representing the orders on the page
+        inventory (Inventory): Instance of class Inventory repres. entire inv.
+        phases (PhaseRegistry): Registry of all batches grouped by phase
+        page_html (dict): A dict representing HTML of the filter form and the
+            order and batch page links
+
+    Returns:
+        (Iterator): An iterator of strings representing the tracking page
+    """
+    chunk_size = app.config["stream_chunk_rows"]
     # HTML code shows how HTML should be rendered in the browser (style); order
     # and process tracking; and buttons for loading and saving state of
     # program, uploading sales data, inputting new batch, changing production
     # phase, registering and dispatching orders, predicting sales, and planning
-    # what to produce next.
-    return ("""<style>
+    # what to produce next. Header and forms are yielded first so that the
+    # browser can render them while the tables are still being produced.
+    yield """<style>
                 h1, h2, h3 {
                   font-family: arial, sans-serif;
                 }
@@ -380,6 +1118,10 @@ def interface_tracking() -> str:
                 <input type="hidden">
                 <input type="submit" value="Change batch's phase">
             </form>
+            <form action="/reserve_tank" method="POST">
+                <input type="hidden">
+                <input type="submit" value="Reserve tank">
+            </form>
             <form action="/register_dispatch_delete_order" method="POST">
                 <input type="hidden">
                 <input type="submit" 
@@ -393,8 +1135,9 @@ def interface_tracking() -> str:
                 <input type="hidden">
                 <input type="submit" value="Second: plan production">
             </form>
-            <h2>Order tracking</h2>
-            <h3>Registered customer orders</h3>
+            <h2>Order tracking</h2>"""
+    yield page_html["filter_form"]
+    yield """<h3>Registered customer orders</h3>
             <table>
               <tr>
                 <th>Invoice number</th>
@@ -404,8 +1147,12 @@ def interface_tracking() -> str:
                 <th>Gyle number</th>
                 <th>Quantity ordered</th>
                 <th>Dispatched</th>
-              </tr>""" + html_order_table + "</table>"
-            + """<h3>Batches</h3>
+              </tr>"""
+    # Yields rows of HTML table containing the orders on the page.
+    yield from chunk_rows(iter_order_rows(order_list), chunk_size)
+    yield "</table>"
+    yield page_html["order_links"]
+    yield """<h3>Batches</h3>
             <table>
               <tr>
                 <th>Batch ID</th>
@@ -416,14 +1163,22 @@ def interface_tracking() -> str:
                 <th>Current phase finishes</th>
                 <th>Last completed phase</th>
                 <th>Bottles put in inventory</th>
-              </tr>""" + html_batch_table + "</table>"
-            + """<h3>Ready for delivery</h3>
+              </tr>"""
+    # Yields rows of HTML table containing the batches on the page.
+    yield from chunk_rows(iter_batch_rows(batch_list), chunk_size)
+    yield "</table>"
+    yield page_html["batch_links"]
+    yield """<h3>Ready for delivery</h3>
             <table>
               <tr>
                 <th>Beer type</th>
                 <th>Number of bottles</th>
-              </tr>""" + html_inventory_table + "</table>"
-            + """<h2>Process tracking</h2>
+              </tr>"""
+    # Yields rows of HTML table containing all inventory.
+    yield from chunk_rows(iter_inventory_rows(inventory), chunk_size)
+    yield "</table>"
+    # Yields all process tracking tables.
+    yield """<h2>Process tracking</h2>
             <h3>1. Hot brewing</h3>
             <table>
               <tr>
@@ -432,8 +1187,10 @@ def interface_tracking() -> str:
                 <th>Start time</th>
                 <th>End time</th>
                 <th>Batch ID</th>
-              </tr>""" + html_hot_brewing_table + "</table>"
-            + """<h3>2. Fermentation</h3>
+              </tr>"""
+    yield from chunk_rows(iter_process_rows(phases, "hot brewing"), chunk_size)
+    yield "</table>"
+    yield """<h3>2. Fermentation</h3>
             <table>
               <tr>
                 <th>Equipment name</th>
@@ -442,8 +1199,10 @@ def interface_tracking() -> str:
                 <th>Start time</th>
                 <th>End time</th>
                 <th>Batch ID</th>
-              </tr>""" + html_ferm_table + "</table>"
-            + """<h3>3. Conditioning and Carbonation</h3>
+              </tr>"""
+    yield from chunk_rows(iter_process_rows(phases, "ferm"), chunk_size)
+    yield "</table>"
+    yield """<h3>3. Conditioning and Carbonation</h3>
             <table>
               <tr>
                 <th>Equipment name</th>
@@ -452,8 +1211,10 @@ def interface_tracking() -> str:
                 <th>Start time</th>
                 <th>End time</th>
                 <th>Batch ID</th>
-              </tr>""" + html_cond_table + "</table>"
-            + """<h3>4. Bottling and Labelling</h3>
+              </tr>"""
+    yield from chunk_rows(iter_process_rows(phases, "cond"), chunk_size)
+    yield "</table>"
+    yield """<h3>4. Bottling and Labelling</h3>
             <table>
               <tr>
                 <th>Equipment name</th>
@@ -461,7 +1222,48 @@ def interface_tracking() -> str:
                 <th>Start time</th>
                 <th>End time</th>
                 <th>Batch ID</th>
-              </tr>""" + html_bottling_table + "</table>")
+              </tr>"""
+    yield from chunk_rows(iter_process_rows(phases, "bottling"), chunk_size)
+    yield "</table>"
+
+@app.route("/", methods=["GET", "POST"])
+def interface_tracking() -> Union[str, Response]:
+    """Creates HTML to track brew, add/edit/del batches&orders, & predict sales
+
+    Args:
+        No arguments
+
+    Returns:
+        (str or Response): HTML code for start page / user interface; as
+            streamed Response if app.config["stream_tracking_page"] is True
+    """
+    batches = app.config["batches"]
+    orders = app.config["customer_orders"]
+    inventory = app.config["inventory"]
+    phases = app.config["phase_registry"]
+    # Gets filter, sort, and page parameters from the URL or form data.
+    values = request.values
+    filters = get_list_filters(values)
+    filter_params = get_filter_params(values)
+    # Gets only the requested pages of orders and batches via sorted indexes.
+    order_list, order_page, order_pages = get_order_page(
+        orders, filters, get_page_number(values, "order_page"))
+    batch_list, batch_page, batch_pages = get_batch_page(
+        batches, filters, get_page_number(values, "batch_page"))
+    page_html = {"filter_form": render_filter_form("/", filter_params, True,
+                                                   True),
+                 "order_links": render_page_links("/", filter_params,
+                                                  "order_page", order_page,
+                                                  order_pages),
+                 "batch_links": render_page_links("/", filter_params,
+                                                  "batch_page", batch_page,
+                                                  batch_pages)}
+    page = generate_tracking_page(batch_list, order_list, inventory, phases,
+                                  page_html)
+    # True if page should be sent section by section while it's produced.
+    if app.config["stream_tracking_page"]:
+        return Response(stream_with_context(page), mimetype="text/html")
+    return "".join(page)
 
 @app.route("/load_program_state", methods=["GET", "POST"])
 def load_program_state() -> str:
@@ -479,21 +1281,15 @@ def load_program_state() -> str:
     # True if user clicks on the load button.
     if load_input is not None:
         try:
-            filename = app.config["save_file_name"]
-            # rb to read binary file.
-            with open(filename, "rb") as file:
-                program_state = pickle.load(file)
+            # Loads snapshot and replays the journal records saved after it.
+            with app.config["phase_lock"]:
+                restore_program_state()
         except (FileNotFoundError, PermissionError) as error:
             error_message = ("Loading the program state wasn't successful! "
                              + str(error))
             app.config["logger"].error(error_message)
             return error_message
         else:
-            # Accesses program_state dictionary and sets loaded states.
-            app.config["batches"] = program_state["batches"]
-            app.config["customer_orders"] = program_state["orders"]
-            app.config["inventory"] = program_state["inventory"]
-            app.config["monthly_sales_forecasts"] = program_state["forecasts"]
             # Logs that state was loaded successfully.
             log_message = "Loading the program state was successful!"
             app.config["logger"].info(log_message)
@@ -536,25 +1332,26 @@ def save_program_state() -> str:
     save_input = response.get("save_button")
     # True if user clicks on the save button.
     if save_input is not None:
-        batches = app.config["batches"]
-        orders = app.config["customer_orders"]
-        inventory = app.config["inventory"]
-        monthly_sales_forecasts = app.config["monthly_sales_forecasts"]
-        # Holds states in program_state.
-        program_state = {"batches": batches, "orders": orders,
-                         "inventory": inventory,
-                         "forecasts": monthly_sales_forecasts}
         try:
-            filename = app.config["save_file_name"]
-            # Writes program_state to pickle file.
-            # wb to write binary to file.
-            with open(filename, "wb") as savefile:
-                pickle.dump(program_state, savefile)
+            # Writes snapshot; journal records it contains are discarded.
+            job_id = compact_program_state()
         except PermissionError as error:
             error_message = ("Saving the program state was not successful! "
                              + str(error))
             app.config["logger"].error(error_message)
             return error_message
+        # True if the snapshot is written by the background worker.
+        if job_id is not None:
+            log_message = "Snapshot job {} was started.".format(job_id)
+            app.config["logger"].info(log_message)
+            return ("""Saving the program state was started!<br>
+                    Snapshot job ID: {0}<br>
+                    <a href="/snapshot_status?job_id={0}">Show status</a>
+                    <form action="/" method="POST">
+                       <input type="hidden">
+                       <br>
+                       <input type="submit" value="Go back to tracking screen">
+                    </form>""").format(job_id)
         else:
             log_message = "Saving the program state was successful!"
             app.config["logger"].info(log_message)
@@ -582,6 +1379,97 @@ def save_program_state() -> str:
                 <input type="submit" value="Go back to tracking screen">
             </form>"""
 
+@app.route("/snapshot_status", methods=["GET", "POST"])
+def snapshot_status() -> str:
+    """Shows the status of a background snapshot job
+
+    Args:
+        No arguments
+
+    Returns:
+        (str): A string representing HTML code for snapshot_status page
+    """
+    job_id = request.values.get("job_id", "")
+    job_status = app.config["snapshot_worker"].get_status(job_id)
+    # Job ID is user input, so it is escaped before it is put into HTML.
+    if job_status is None:
+        return "Snapshot job {} doesn't exist.".format(escape(job_id))
+    return ("""<style>
+                h1, h2, h3 {{
+                  font-family: arial, sans-serif;
+                }}
+            </style>
+            <h2>Snapshot status</h2>
+            Job ID: {0}<br>
+            Status: <b>{1}</b><br>
+            Submitted: {2}<br>
+            Finished: {3}<br>
+            Error: {4}<br>
+            <a href="/snapshot_status?job_id={0}">Refresh</a>
+            <form action="/" method="POST">
+                <input type="hidden">
+                <br>
+                <input type="submit" value="Go back to tracking screen">
+            </form>""").format(job_id, job_status["status"],
+                               job_status["submitted"],
+                               job_status["finished"],
+                               escape(job_status["error"]))
+
+@app.route("/forecast_status", methods=["GET", "POST"])
+def forecast_status() -> str:
+    """Shows the status and stage of a background forecast job
+
+    Args:
+        No arguments
+
+    Returns:
+        (str): A string representing HTML code for forecast_status page
+    """
+    job_id = request.values.get("job_id", "")
+    job_status = app.config["forecast_jobs"].get_status(job_id)
+    # Job ID is user input, so it is escaped before it is put into HTML.
+    if job_status is None:
+        return "Forecast job {} doesn't exist.".format(escape(job_id))
+    return ("""<style>
+                h1, h2, h3 {{
+                  font-family: arial, sans-serif;
+                }}
+            </style>
+            <h2>Forecast status</h2>
+            Job ID: {0}<br>
+            Status: <b>{1}</b><br>
+            Stage: {2}<br>
+            Submitted: {3}<br>
+            Finished: {4}<br>
+            Error: {5}<br>
+            <a href="/forecast_status?job_id={0}">Refresh</a>
+            <form action="/predict_sales" method="POST">
+                <input type="hidden">
+                <br>
+                <input type="submit" value="Go back to predict sales">
+            </form>""").format(job_id, job_status["status"],
+                               job_status["stage"], job_status["submitted"],
+                               job_status["finished"],
+                               escape(job_status["error"]))
+
+@app.route("/forecast_plot/<forecast_id>", methods=["GET"])
+def forecast_plot(forecast_id: str) -> Response:
+    """Serves the rendered plot of a forecast from memory
+
+    Args:
+        forecast_id (str): A string representing the ID of the forecast
+
+    Returns:
+        (Response): A response containing the image; status 404 if the plot
+            doesn't exist (anymore)
+    """
+    plot = app.config["forecast_plots"].get(forecast_id)
+    if plot is None:
+        return Response("Forecast plot {} doesn't exist.".format(forecast_id),
+                        status=404)
+    image, mimetype = plot
+    return Response(image, mimetype=mimetype)
+
 @app.route("/upload_sales_data", methods=["GET", "POST"])
 def upload_sales_data() -> str:
     """Loads CSV file in folder where module interface_brew_tracking is located
@@ -637,32 +1525,63 @@ def add_delete_batch() -> str:
     batch_volume_input = response.get("volume_input")
     batch_beer_type_input = response.get("beer_type_input")
     delete_batch_input = response.get("delete_batch_input")
-    # True if user submits batch id, volume, and beer_type (part of one form).
-    if batch_id_input is not None:
-        # Removes blanks (whitespace characters) from batch id.
-        batch_id_input = batch_id_input.replace(" ", "")
-        # Volume is always a number as str; HTML is set to only allow num input
-        batch_volume_input = int(batch_volume_input)
-        # Creates and adds Batch to batches dict. if ID isn't in batches dict.
-        if batches.get(batch_id_input) is None:
-            handle = {"inventory": app.config["inventory"],
-                      "tanks": app.config["tanks"]}
-            batches[batch_id_input] = Batch(batch_id_input,
-                                            batch_beer_type_input,
-                                            batch_volume_input,
-                                            handle)
-            log_message = ("Batch {} with beer type {} and {} L volume "
-                           + "was added.").format(batch_id_input,
-                                                  batch_beer_type_input,
-                                                  batch_volume_input)
+    # Changes are made under the lock, so that snapshots stay consistent.
+    with app.config["phase_lock"]:
+        # True if user submits batch id, volume, and beer_type (one form).
+        if batch_id_input is not None:
+            # Removes blanks (whitespace characters) from batch id.
+            batch_id_input = batch_id_input.replace(" ", "")
+            # Volume is always a number as str; HTML only allows num input.
+            batch_volume_input = int(batch_volume_input)
+            # Creates and adds Batch to batches dict. if ID isn't in dict.
+            if batches.get(batch_id_input) is None:
+                handle = {"inventory": app.config["inventory"],
+                          "tanks": app.config["tanks"],
+                          "occupancy": app.config["tank_occupancy"],
+                          "phases": app.config["phase_registry"]}
+                batches[batch_id_input] = Batch(batch_id_input,
+                                                batch_beer_type_input,
+                                                batch_volume_input,
+                                                handle)
+                app.config["batch_index"].add(batch_id_input,
+                                              batches[batch_id_input])
+                record_change("add_batch",
+                              {"id": batch_id_input,
+                               "beer_type": batch_beer_type_input,
+                               "volume": batch_volume_input})
+                log_message = ("Batch {} with beer type {} and {} L volume "
+                               + "was added.").format(batch_id_input,
+                                                      batch_beer_type_input,
+                                                      batch_volume_input)
+                app.config["logger"].info(log_message)
+        # Elif user wants to del. a batch and batch id exists, deletes it.
+        elif delete_batch_input is not None and delete_batch_input in batches:
+            # Frees the tank of the deleted batch.
+            batch = batches[delete_batch_input]
+            app.config["tank_occupancy"].release(batch.phase_current_tank,
+                                                 batch.id)
+            # Removes the deleted batch from the phase registry.
+            app.config["phase_registry"].remove(batch.id)
+            app.config["batch_index"].remove(batch.id)
+            # Removes the deleted batch's phase end time from the scheduler.
+            if app.config["phase_scheduler"] is not None:
+                app.config["phase_scheduler"].unschedule(batch.id)
+                app.config["phase_scheduler"].release_waiting()
+            del batches[delete_batch_input]
+            record_change("delete_batch", delete_batch_input)
+            log_message = "Batch {} was deleted.".format(delete_batch_input)
             app.config["logger"].info(log_message)
-    # Elif user wants to del. a batch and batch id exists, deletes this batch.
-    elif delete_batch_input is not None and delete_batch_input in batches:
-        del batches[delete_batch_input]
-        log_message = "Batch {} was deleted.".format(delete_batch_input)
-        app.config["logger"].info(log_message)
-    # Creates HTML table containing all batches.
-    html_batch_table = update_batch_table(batches)
+    # Creates HTML table containing the requested page of batches.
+    values = request.values
+    filters = get_list_filters(values)
+    filter_params = get_filter_params(values)
+    batch_list, batch_page, batch_pages = get_batch_page(
+        batches, filters, get_page_number(values, "batch_page"))
+    html_batch_table = "".join(iter_batch_rows(batch_list))
+    html_filter_form = render_filter_form("/add_delete_batch", filter_params,
+                                          False, True)
+    html_page_links = render_page_links("/add_delete_batch", filter_params,
+                                        "batch_page", batch_page, batch_pages)
     return """<style>
                 h1, h2, h3 {
                   font-family: arial, sans-serif;
@@ -712,7 +1631,7 @@ def add_delete_batch() -> str:
                 <br>
                 <input type="submit" value="Go back to tracking screen">
             </form>
-            <h2>Batches</h2>
+            <h2>Batches</h2>""" + html_filter_form + """
             <table>
               <tr>
                 <th>Batch ID</th>
@@ -723,7 +1642,7 @@ def add_delete_batch() -> str:
                 <th>Current phase finishes</th>
                 <th>Last completed phase</th>
                 <th>Bottles put in inventory</th>
-              </tr>""" + html_batch_table + "</table>"
+              </tr>""" + html_batch_table + "</table>" + html_page_links
 
 @app.route("/change_batchs_phase", methods=["GET", "POST"])
 def change_batchs_phase() -> str:
@@ -737,6 +1656,8 @@ def change_batchs_phase() -> str:
     """
     batches = app.config["batches"]
     tanks = app.config["tanks"]
+    occupancy = app.config["tank_occupancy"]
+    calendar = app.config["tank_calendar"]
     # Contains HTML form data inputted by the user submitted using POST.
     response = request.form
     id_input = response.get("id_input") # Batch ID.
@@ -755,27 +1676,36 @@ def change_batchs_phase() -> str:
         # El True if one of these 2 phases is selected and a tank is selected.
         elif (phase_input in ["ferm", "cond"] and
               tank_input != "not applicable"):
-            used_tanks = []
             # Checks if selected/inputted tank is available.
-            # Adds the names of all used tanks to used_tanks' list.
-            for batch in batches.values():
-                # True if tank is used.
-                if batch.phase_current_tank != "":
-                    used_tanks.append(batch.phase_current_tank)
-            # Gets list of all tank names.
-            all_tanks = tanks.get_tank_names()
-            # Gives list of all available tanks.
-            available_tanks = [tank for tank in all_tanks
-                               if tank not in used_tanks]
-            # Adds current tank in use by batch to available_tanks,
-            # because if a batch in phase 2 is in a tank that has ferm. and
+            # Tank is needed until the selected phase ends.
+            batch = batches[id_input]
+            phase_start = datetime.now()
+            phase_end = phase_start + timedelta(
+                hours=batch.duration_phase2 if phase_input == "ferm"
+                else batch.duration_phase3)
+            # Reservations labelled with the batch ID were made for the batch.
+            conflicts = [reservation for reservation
+                         in calendar.get_conflicts(tank_input, phase_start,
+                                                   phase_end)
+                         if reservation["label"] != id_input]
+            # True if inputted tank is already used for another batch or
+            # reserved; if a batch in phase 2 is in a tank that has ferm. and
             # cond. capabilities, then the batch can remain in that tank.
-            if batches[id_input].phase_current_tank != "":
-                available_tanks.append(batches[id_input].phase_current_tank)
-            # True if inputted tank is already used for another batch.
-            if tank_input not in available_tanks:
-                return ("Please select an available tank. "
-                        + "The following tanks are available: "
+            if (occupancy.get_batch_id(tank_input) not in ["", id_input]
+                    or conflicts):
+                # Gives list of all available tanks via the tank occupancy
+                # index and the tank calendar.
+                available_tanks = calendar.get_free_tanks(
+                    occupancy.get_free_tanks(tanks.get_tank_names()),
+                    phase_start, phase_end, id_input)
+                reserved_message = "".join(
+                    " Tank {} is reserved from {} to {} ({}).".format(
+                        tank_input, reservation["start"], reservation["end"],
+                        reservation["label"])
+                    for reservation in conflicts)
+                return ("Please select an available tank."
+                        + reserved_message
+                        + " The following tanks are available: "
                         + str(available_tanks))
             # Uses tank_inp. to get value of Tanks' instance var with same name
             tank_value = tanks.get_tank_value(tank_input)
@@ -787,24 +1717,19 @@ def change_batchs_phase() -> str:
         # If True, batch phase will be changed to user input.
         if change_batch:
             change_batch = False
-            batches[id_input].phase_current = phase_input
-            batches[id_input].phase_current_tank = tank_input
-            batches[id_input].set_phase_start_end_datetimes()
-            info_message = ("Batch {} was changed to "
-                            + "phase {}.").format(id_input, phase_input)
-            log_message = (info_message)
-            app.config["logger"].info(log_message)
+            with app.config["phase_lock"]:
+                # Tank may have been taken by the scheduler since the check.
+                if (tank_input != batches[id_input].phase_current_tank
+                        and occupancy.get_batch_id(tank_input) != ""):
+                    return "Please select an available tank."
+                apply_phase_change(id_input, phase_input, tank_input)
         else:
             return "Please select a tank with the right capability/volume!"
-    htm_batch_ids = ""
-    # Creates HTML drop-down list options containing all batch IDs.
-    for batch in batches.values():
-        # True if batch is finished; finished batch can't go back to production
-        if batch.phase_current == "finished":
-            continue
-        # If not finished, adds batch ID to HTML drop-down list.
-        htm_batch_ids = (htm_batch_ids
-                         + '<option value="{0}">{0}</option>'.format(batch.id))
+    # Creates HTML drop-down list options containing all batch IDs; finished
+    # batches are left out, because they can't go back to production.
+    htm_batch_ids = "".join(render_options(
+        batch.id for batch in batches.values()
+        if batch.phase_current != "finished"))
     # Creates HTML table containing all batches.
     html_batch_table = update_batch_table(batches)
     return ("""<style>
@@ -888,6 +1813,165 @@ def change_batchs_phase() -> str:
                 <th>Bottles put in inventory</th>
               </tr>""" + html_batch_table + "</table>")
 
+@app.route("/reserve_tank", methods=["GET", "POST"])
+def reserve_tank() -> str:
+    """Receives user form input via POST to reserve tanks or cancel reservation
+
+    Args:
+        No arguments
+
+    Returns:
+        (str): A string representing HTML code for reserve_tank page
+    """
+    tanks = app.config["tanks"]
+    calendar = app.config["tank_calendar"]
+    # Contains HTML form data inputted by the user submitted using POST.
+    response = request.form
+    tank_input = response.get("tank_input")
+    start_input = response.get("start_input")
+    hours_input = response.get("hours_input")
+    label_input = response.get("label_input", "")
+    slot_tank_input = response.get("slot_tank_input")
+    cancel_input = response.get("cancel_reservation")
+    html_message = ""
+    # True if user enters reservation (reservation info is part of 1 form).
+    if tank_input is not None and tank_input in tanks.get_tank_names():
+        try:
+            start = datetime.strptime(start_input, "%Y-%m-%dT%H:%M")
+            end = start + timedelta(hours=float(hours_input))
+        except (TypeError, ValueError):
+            return "Please enter a valid start and duration!"
+        if end <= start:
+            return "Please enter a duration of more than 0 hours!"
+        reservation_id = uuid.uuid4().hex[:8]
+        with app.config["phase_lock"]:
+            conflicts = calendar.reserve(reservation_id, tank_input, start,
+                                         end, label_input)
+            if not conflicts:
+                record_change("reserve_tank",
+                              dict(calendar.reservations[reservation_id]))
+        # True if the tank is already reserved for part of the period.
+        if conflicts:
+            # Suggests the earliest period of the same duration instead.
+            slot_start = calendar.get_earliest_free_slot(
+                tank_input, end - start, start)
+            return ("Tank {} is already reserved in this period by "
+                    + "reservation(s) {}. It is free from {} on.").format(
+                        tank_input,
+                        ", ".join(reservation["id"]
+                                  for reservation in conflicts),
+                        slot_start.strftime("%d/%m/%Y %H:%M"))
+        info_message = ("Tank {} was reserved from {} to {} ({}); "
+                        + "reservation {}.").format(tank_input, start, end,
+                                                    label_input,
+                                                    reservation_id)
+        app.config["logger"].info(info_message)
+    # Else True if user asks for the earliest free slot of a tank.
+    elif (slot_tank_input is not None
+          and slot_tank_input in tanks.get_tank_names()):
+        try:
+            duration = timedelta(hours=float(hours_input))
+        except (TypeError, ValueError):
+            return "Please enter a valid duration!"
+        slot_start = calendar.get_earliest_free_slot(
+            slot_tank_input, duration, datetime.now())
+        html_message = ("<b>Tank {} is not reserved for {} hours from {} "
+                        + "on.</b><br>").format(
+                            slot_tank_input, hours_input,
+                            slot_start.strftime("%d/%m/%Y %H:%M"))
+    # Else True if user enters reservation to be cancelled.
+    elif cancel_input is not None:
+        with app.config["phase_lock"]:
+            cancelled = calendar.cancel(cancel_input)
+            if cancelled:
+                record_change("cancel_reservation", cancel_input)
+                # Batches waiting for a tank may fit into the released tank.
+                if app.config["phase_scheduler"] is not None:
+                    app.config["phase_scheduler"].release_waiting()
+        if not cancelled:
+            return "Reservation {} doesn't exist.".format(cancel_input)
+        log_message = "Reservation {} was cancelled.".format(cancel_input)
+        app.config["logger"].info(log_message)
+    # Creates HTML drop-down list options containing all tank names.
+    html_tank_names = "".join(render_options(tanks.get_tank_names()))
+    # Creates HTML table containing all reservations.
+    html_reservation_table = update_reservation_table(
+        calendar.get_reservations())
+    return ("""<style>
+                h1, h2, h3 {
+                  font-family: arial, sans-serif;
+                }
+                table {
+                  font-family: arial, sans-serif;
+                  border-collapse: collapse;
+                  width: 100%;
+                }
+                td, th {
+                  border: 1px solid #dddddd;
+                  text-align: left;
+                  padding: 8px;
+                }
+                tr:nth-child(even) {
+                  background-color: #dddddd;
+                }
+            </style>
+            <h2>Reserve tank</h2>
+            A reserved tank can't be used by other batches while reserved; a
+            reservation labelled with a batch ID doesn't block that batch.
+            <form action="/reserve_tank" method="POST">
+                <br>
+                Tank:<br>
+                <select name="tank_input">""" + html_tank_names
+            + """</select>
+                <br>
+                Start:<br>
+                <input type="datetime-local" name="start_input"
+                required="required">
+                <br>
+                Duration (hours):<br>
+                <input type="number" name="hours_input" min="1"
+                required="required">
+                <br>
+                Label (e.g. batch ID or beer type):<br>
+                <input type="text" name="label_input">
+                <br><br>
+                <input type="submit" value="Reserve tank">
+            </form>
+            <h2>Find earliest free period</h2>""" + html_message
+            + """<form action="/reserve_tank" method="POST">
+                Tank:<br>
+                <select name="slot_tank_input">""" + html_tank_names
+            + """</select>
+                <br>
+                Duration (hours):<br>
+                <input type="number" name="hours_input" min="1"
+                required="required">
+                <br><br>
+                <input type="submit" value="Find free period">
+            </form>
+            <h2>Cancel reservation</h2>
+            <form action="/reserve_tank" method="POST">
+                Reservation ID:<br>
+                <input type="text" name="cancel_reservation"
+                required="required">
+                <br><br>
+                <input type="submit" value="Cancel reservation">
+            </form>
+            <form action="/" method="POST">
+                <input type="hidden">
+                <br>
+                <input type="submit" value="Go back to tracking screen">
+            </form>
+            <h2>Reservations</h2>
+            <table>
+              <tr>
+                <th>Reservation ID</th>
+                <th>Tank</th>
+                <th>Start</th>
+                <th>End</th>
+                <th>Label</th>
+              </tr>""" + html_reservation_table + "</table>")
+
 @app.route("/register_dispatch_delete_order", methods=["GET", "POST"])
 def register_dispatch_delete_order() -> str:
     """Receives user form input via POST to register, dispatch or delete order
@@ -910,60 +1994,87 @@ def register_dispatch_delete_order() -> str:
     quantity_input = response.get("quantity_ordered_input")
     dispatch_order_num = response.get("dispatch_order")
     delete_order = response.get("delete_order")
-    # True if user enters all order info (order info are part of 1 HTML form).
-    if invoice_num_input is not None:
-        # Removes blanks (whitespace characters) from invoice number.
-        invoice_num_input = invoice_num_input.replace(" ", "")
-        # Converts string date_required_input to datetime object.
-        date_required = datetime.strptime(date_required_input, "%Y-%m-%d")
-        # Formats date_required.
-        date_required = date_required.strftime("%d/%m/%Y")
-        # Adds order to orders dict. if invoice number is not in orders dict.
-        if orders.get(invoice_num_input) is None:
-            orders[invoice_num_input] = {"invoice number": invoice_num_input,
-                                         "customer": customer_input,
-                                         "date required": date_required,
-                                         "recipe": recipe_input,
-                                         "gyle number": gyle_number_input,
-                                         "quantity ordered": quantity_input,
-                                         "dispatched": ""}
-            info_message = ("Order {} was added. Customer: {}; date required: "
-                            + "{}; recipe: {}; gyle number: {};  quantity "
-                            + "ordered: {}.").format(invoice_num_input,
-                                                     customer_input,
-                                                     date_required,
-                                                     recipe_input,
-                                                     gyle_number_input,
-                                                     quantity_input)
-            app.config["logger"].info(info_message)
-    # Else True if user enters order number, clicks dispatch, and order exists.
-    elif dispatch_order_num is not None and dispatch_order_num in orders:
-        # True if order has already been dispatched.
-        if orders[dispatch_order_num]["dispatched"] == "dispatched":
-            return "Order has already been dispatched."
-        # Gets beer type of order.
-        beer_type = orders[dispatch_order_num]["recipe"]
-        # Gets number of bottles in inventory for this beer type.
-        inventory_item_quantity = inventory.get_inv_items_quantity(beer_type)
-        quantity_ordered = int(orders[dispatch_order_num]["quantity ordered"])
-        # True if enough bottles of the right beer type in the inventory.
-        if inventory_item_quantity["num"] >= quantity_ordered:
-            # Reduces inventory quantity by the number of dispatched bottles.
-            inventory_item_quantity["num"] -= quantity_ordered
-            orders[dispatch_order_num]["dispatched"] = "dispatched"
-            log_message = "Order {} was dispatched.".format(dispatch_order_num)
+    # Changes are made under the lock, so that snapshots stay consistent.
+    with app.config["phase_lock"]:
+        # True if user enters all order info (order info are part of 1 form).
+        if invoice_num_input is not None:
+            # Removes blanks (whitespace characters) from invoice number.
+            invoice_num_input = invoice_num_input.replace(" ", "")
+            # Converts string date_required_input to datetime object.
+            date_required = datetime.strptime(date_required_input, "%Y-%m-%d")
+            # Formats date_required.
+            date_required = date_required.strftime("%d/%m/%Y")
+            # Adds order to orders dict. if invoice number is not in dict.
+            if orders.get(invoice_num_input) is None:
+                orders[invoice_num_input] = {
+                    "invoice number": invoice_num_input,
+                    "customer": customer_input,
+                    "date required": date_required,
+                    "recipe": recipe_input,
+                    "gyle number": gyle_number_input,
+                    "quantity ordered": quantity_input,
+                    "dispatched": ""}
+                app.config["order_index"].add(invoice_num_input,
+                                              orders[invoice_num_input])
+                record_change("register_order",
+                              dict(orders[invoice_num_input]))
+                info_message = ("Order {} was added. Customer: {}; date "
+                                + "required: {}; recipe: {}; gyle number: "
+                                + "{};  quantity ordered: {}.").format(
+                                    invoice_num_input, customer_input,
+                                    date_required, recipe_input,
+                                    gyle_number_input, quantity_input)
+                app.config["logger"].info(info_message)
+        # Else True if user enters order num, clicks dispatch, & order exists.
+        elif dispatch_order_num is not None and dispatch_order_num in orders:
+            # True if order has already been dispatched.
+            if orders[dispatch_order_num]["dispatched"] == "dispatched":
+                return "Order has already been dispatched."
+            # Gets beer type of order.
+            beer_type = orders[dispatch_order_num]["recipe"]
+            # Gets number of bottles in inventory for this beer type.
+            inventory_item_quantity = inventory.get_inv_items_quantity(
+                beer_type)
+            quantity_ordered = int(
+                orders[dispatch_order_num]["quantity ordered"])
+            # True if enough bottles of the right beer type in the inventory.
+            if inventory_item_quantity["num"] >= quantity_ordered:
+                # Reduces inventory quantity by the num of dispatched bottles.
+                inventory_item_quantity["num"] -= quantity_ordered
+                orders[dispatch_order_num]["dispatched"] = "dispatched"
+                # Moves order into the order index's buckets of dispatched.
+                app.config["order_index"].add(dispatch_order_num,
+                                              orders[dispatch_order_num])
+                record_change("dispatch_order", dispatch_order_num)
+                record_change("inventory", {
+                    "beer_type": beer_type, "delta": -quantity_ordered,
+                    "num": inventory_item_quantity["num"]})
+                log_message = "Order {} was dispatched.".format(
+                    dispatch_order_num)
+                app.config["logger"].info(log_message)
+            # Else order can't be dispatched and user is informed.
+            else:
+                return ("Unfortunately, not enough bottles of type {} "
+                        + "are in stock!").format(beer_type)
+        # Else True if user enters order to be deleted and order exists.
+        elif delete_order is not None and delete_order in orders:
+            app.config["order_index"].remove(delete_order)
+            del orders[delete_order]
+            record_change("delete_order", delete_order)
+            log_message = "Order {} was deleted.".format(delete_order)
             app.config["logger"].info(log_message)
-        # Else order can't be dispatched and user is informed.
-        else:
-            return ("Unfortunately, not enough bottles of type {} "
-                    + "are in stock!").format(beer_type)
-    # Else True if user enters order to be deleted and order exists.
-    elif delete_order is not None and delete_order in orders:
-        del orders[delete_order]
-        log_message = "Order {} was deleted.".format(delete_order)
-        app.config["logger"].info(log_message)
-    # Creates HTML table containing all orders.
-    html_order_table = update_order_table(orders)
+    # Creates HTML table containing the requested page of orders.
+    values = request.values
+    filters = get_list_filters(values)
+    filter_params = get_filter_params(values)
+    order_list, order_page, order_pages = get_order_page(
+        orders, filters, get_page_number(values, "order_page"))
+    html_order_table = "".join(iter_order_rows(order_list))
+    html_filter_form = render_filter_form("/register_dispatch_delete_order",
+                                          filter_params, True, False)
+    html_page_links = render_page_links("/register_dispatch_delete_order",
+                                        filter_params, "order_page",
+                                        order_page, order_pages)
     return """<style>
                 h1, h2, h3 {
                   font-family: arial, sans-serif;
@@ -1033,7 +2144,7 @@ def register_dispatch_delete_order() -> str:
                 <br>
                 <input type="submit" value="Go back to tracking screen">
             </form>
-            <h2>Registered customer orders</h2>
+            <h2>Registered customer orders</h2>""" + html_filter_form + """
             <table>
               <tr>
                 <th>Invoice number</th>
@@ -1043,7 +2154,207 @@ def register_dispatch_delete_order() -> str:
                 <th>Gyle number</th>
                 <th>Quantity ordered</th>
                 <th>Dispatched</th>
-              </tr>""" + html_order_table + "</table>"
+              </tr>""" + html_order_table + "</table>" + html_page_links
+
+def start_forecasting() -> None:
+    """Imports forecasting stack and creates CSV cache and forecast engine
+
+    Does nothing if they were already created; is called on first use of the
+    forecasting stack and by the prewarm thread.
+
+    Args:
+        No arguments
+
+    Returns:
+        No returns
+    """
+    with app.config["forecasting_lock"]:
+        if app.config["forecast_engine"] is not None:
+            return
+        # Imports pandas, statsmodels, and matplotlib.
+        from csv_cache_brewing import ParsedCsvCache
+        from forecast_engine_brewing import ForecastEngine
+        from model_cache_brewing import FittedModelCache
+        app.config["csv_cache"] = ParsedCsvCache(app.config["csv_cache_dir"],
+                                                 app.config["csv_cache_size"])
+        app.config["forecast_engine"] = ForecastEngine(
+            app.config["forecast_workers"],
+            FittedModelCache(app.config["model_cache_dir"],
+                             app.config["model_cache_size"]),
+            app.config["max_appended_periods"])
+
+def prewarm_forecasting() -> threading.Thread:
+    """Starts thread importing the forecasting stack in the background
+
+    Args:
+        No arguments
+
+    Returns:
+        (threading.Thread): The started daemon thread
+    """
+    thread = threading.Thread(target=start_forecasting,
+                              name="prewarm_forecasting", daemon=True)
+    thread.start()
+    return thread
+
+def get_tuned_model_orders(season_length: int
+                           ) -> Dict[str, Tuple[List[int], List[int]]]:
+    """Gets saved tuned hyperparameters of beer types for a season length
+
+    Args:
+        season_length (int): An int representing num of periods in a season
+
+    Returns:
+        (dict): A dict mapping beer types to tuned order and seasonal order;
+            empty if tuned hyperparameters aren't used
+    """
+    from model_tuning_brewing import load_tuned_hyperparameters
+    if not app.config["use_tuned_hyperparameters"]:
+        return {}
+    tuned = load_tuned_hyperparameters(
+        app.config["tuned_hyperparameters_file"])
+    # Hyperparameters tuned for another season length don't fit the data.
+    return {beer_type: (values["order"], values["seasonal_order"])
+            for beer_type, values in tuned.items()
+            if values["seasonal_order"][3] == season_length}
+
+def run_sales_forecast(file_name: str, order: List[int],
+                       seasonal_order: List[int], auto_tune: bool,
+                       report_stage: Callable[[str], None]) -> Dict[str, Any]:
+    """Loads sales CSV file, forecasts monthly sales, and plots forecasts
+
+    Args:
+        file_name (str): A string representing the name of the CSV file
+        order (list): A list representing hyperparameters for the ARIMA model
+        seasonal_order (list): A list repres. hyperparam. of seasonal component
+        auto_tune (bool): Bool where True searches the best hyperparameters
+            for each beer type before forecasting and saves them
+        report_stage (Callable): Function called with the name of each stage
+            (load, resample, tune, fit, plot) when it starts
+
+    Returns:
+        (dict): A dict representing the forecasts and growth rate tables
+
+    Raises:
+        ValueError: If a column is missing, the models can't be fitted, or
+            a worker process terminated
+    """
+    report_stage("load")
+    start_forecasting()
+    from concurrent.futures.process import BrokenProcessPool
+    from model_tuning_brewing import get_candidate_grid
+    from model_tuning_brewing import tune_hyperparameters
+    from model_tuning_brewing import save_tuned_hyperparameters
+    from model_tuning_brewing import load_tuned_hyperparameters
+    from sales_forecast_brewing import get_daily_partials
+    from sales_forecast_brewing import aggregate_daily_partials
+    from sales_forecast_brewing import render_sales_forecasts
+    column_to_aggregate = "Quantity ordered"
+    try:
+        # Reads CSV in chunks, removes rows with missing values, and folds
+        # each chunk into daily sums and counts of Quantity ordered per
+        # recipe, so memory use doesn't grow with the number of rows.
+        if app.config["stream_sales_csv"]:
+            daily_partials = app.config["csv_cache"].load_daily_partials(
+                file_name, column_to_aggregate, "Recipe",
+                app.config["csv_chunk_rows"])
+        # Loads data from CSV into dataframe & removes rows with missing
+        # values and replaces index numbers of df with datetimes to get a
+        # time series; both are skipped if the parsed CSV file is cached.
+        else:
+            dataframe = app.config["csv_cache"].load(file_name)
+            # Calculates daily sums and counts of Quantity ordered per recipe.
+            daily_partials = get_daily_partials(
+                dataframe, column_to_aggregate, "Recipe")
+    except KeyError as error:
+        raise ValueError("The following column name is missing "
+                         "in the data: " + str(error)) from error
+    except FileNotFoundError as error:
+        raise ValueError("The file {} does not "
+                         "exist".format(file_name)) from error
+    report_stage("resample")
+    # Calculates past weekly and monthly averages and monthly sums per recipe
+    # from the daily sums and counts, without rescanning the rows.
+    aggregates = aggregate_daily_partials(daily_partials)
+    # Calculates past Quantity ordered average growth rates.
+    growth_rates_per_week = aggregates["weekly_means"].pct_change()
+    growth_rates_per_month = aggregates["monthly_means"].pct_change()
+    # Monthly Quantity ordered sums by beer type; recipes that aren't mapped
+    # to a beer type are forecasted under their recipe name.
+    all_order_sum_month = {}
+    for recipe, monthly_sums in aggregates["monthly_sums"].items():
+        beer_type = app.config["recipe_beer_types"].get(recipe, recipe)
+        all_order_sum_month[beer_type] = monthly_sums
+    if auto_tune:
+        report_stage("tune")
+        # Evaluates grid of hyperparameters for all beer types in parallel.
+        candidates = get_candidate_grid(app.config["tuning_grid"],
+                                        seasonal_order[3])
+        # Uses the worker processes of the forecast engine, so that tuning
+        # doesn't start a second pool next to it.
+        executor = app.config["forecast_engine"].get_executor()
+        try:
+            winners = tune_hyperparameters(
+                executor, all_order_sum_month, candidates,
+                app.config["tuning_criterion"],
+                app.config["tuning_holdout_periods"],
+                app.config["tuning_maxiter"])
+        # A crashed worker breaks the pool; it's replaced on the next call.
+        except BrokenProcessPool as error:
+            app.config["forecast_engine"].discard_executor(executor)
+            raise ValueError("Forecast worker process "
+                             "terminated") from error
+        # Keeps saved hyperparameters of beer types that weren't tuned now.
+        tuned = load_tuned_hyperparameters(
+            app.config["tuned_hyperparameters_file"])
+        tuned.update(winners)
+        save_tuned_hyperparameters(app.config["tuned_hyperparameters_file"],
+                                   tuned)
+    report_stage("fit")
+    # Fits ARIMA models and forecasts monthly sales for all beer types in
+    # parallel; keeps only mean, confidence bounds, dates, and model info,
+    # as the results would drag the model and data into snapshots.
+    try:
+        # Forecasts 12 months into the future with the fitted models; beer
+        # types with tuned hyperparameters use those.
+        forecasts = app.config["forecast_engine"].forecast(
+            all_order_sum_month, order, seasonal_order, steps=12,
+            model_orders=get_tuned_model_orders(seasonal_order[3]))
+    # Raised if a worker process crashed, e.g. because it ran out of memory.
+    except BrokenProcessPool as error:
+        raise ValueError("Forecast worker process terminated") from error
+    except ValueError as error:
+        raise ValueError("Wrong hyperparameters are set, the model "
+                         + "can not be fitted: " + str(error)) from error
+    report_stage("plot")
+    # Plots actual and predicted num of beers sold into an image in memory.
+    forecast_id = uuid.uuid4().hex
+    plot_size = (15, 10)
+    image_format = app.config["forecast_plot_format"]
+    image = render_sales_forecasts(forecasts, all_order_sum_month, plot_size,
+                                   image_format)
+    app.config["forecast_plots"].put(forecast_id, image,
+                                     PLOT_MIMETYPES[image_format])
+    return {"forecast_id": forecast_id, "forecasts": forecasts,
+            "table_monthly_growth": update_growth_rate_table(
+                growth_rates_per_month),
+            "table_weekly_growth": update_growth_rate_table(
+                growth_rates_per_week)}
+
+def publish_sales_forecast(result: Dict[str, Any]) -> None:
+    """Makes results of a forecast the ones used by plan_production and UI
+
+    Args:
+        result (dict): A dict representing the forecasts and growth rate
+            tables, as returned by run_sales_forecast
+
+    Returns:
+        No returns
+    """
+    app.config["latest_forecast_id"] = result["forecast_id"]
+    app.config["monthly_sales_forecasts"] = result["forecasts"]
+    app.config["table_monthly_growth"] = result["table_monthly_growth"]
+    app.config["table_weekly_growth"] = result["table_weekly_growth"]
 
 @app.route("/predict_sales", methods=["GET", "POST"])
 def predict_sales() -> str:
@@ -1059,93 +2370,46 @@ def predict_sales() -> str:
     html_gr_month_table = app.config["table_monthly_growth"]
     html_gr_week_table = app.config["table_weekly_growth"]
     html_csv_list = ""
-    # Empty filename and path to sales forecast graph; also dep. on user input.
-    graph_filename = ""
-    graph_filepath = "'File has not been created yet!'"
     # Contains HTML form data inputted by the user submitted using POST.
     response = request.form
     num_months_input = response.get("num_months_input")
     csv_filename_input = response.get("csv_filename_input")
+    # Link to the status of the submitted forecast job; depends on user input.
+    html_job_info = ""
     # True if user inputted num of past months for prediction and uploaded CSV.
     if num_months_input is not None and csv_filename_input is not None:
-        # Loads data from CSV into dataframe & removes rows with missing values
-        file_name = csv_filename_input
-        dataframe = load_csv_clean_to_dataframe(file_name)
-        try:
-            # Replaces index numbers of df with datetimes to get a time series.
-            dataframe = convert_to_time_series(dataframe)
-        except KeyError as error:
-            error_message = ("The following column name is missing "
-                             "in the data: " + str(error))
-            app.config["logger"].error(error_message)
-            return error_message
-        # Calculates Quantity ordered averages for every past week.
-        column_to_avg = "Quantity ordered"
-        average_by = "W" # "W" = week; "MS" = month
-        past_avgs_per_week = average_data(dataframe, column_to_avg, average_by)
-        # Calculates Quantity ordered averages for every past month.
-        average_by = "MS" # "W" = week; "MS" = month
-        past_avgs_per_month = average_data(dataframe, column_to_avg,
-                                           average_by)
-        # Calculates past Quantity ordered average growth rates.
-        growth_rates_per_week = past_avgs_per_week.pct_change()
-        growth_rates_per_month = past_avgs_per_month.pct_change()
-        # Creates HTML table containing past monthly sales growth rates.
-        html_gr_month_table = update_growth_rate_table(growth_rates_per_month)
-        app.config["table_monthly_growth"] = html_gr_month_table
-        # Creates HTML table containing past weekly sales growth rates.
-        html_gr_week_table = update_growth_rate_table(growth_rates_per_week)
-        app.config["table_weekly_growth"] = html_gr_week_table
-        # Filters dataframe for beer types.
-        dunkel = dataframe.loc[dataframe["Recipe"] == "Organic Dunkel"]
-        pilsner = dataframe.loc[dataframe["Recipe"] == "Organic Pilsner"]
-        red_helles = dataframe.loc[dataframe["Recipe"] == "Organic Red Helles"]
-        # Monthly basis;
-        # calculates dunkel's Quantity ordered sums for each month.
-        column_to_sum = "Quantity ordered"
-        sum_by = "MS" # "W" = week; "MS" = month
-        dunk_order_sum_per_month = sum_data(dunkel, column_to_sum, sum_by)
-        # Calculates pilsner's Quantity ordered sums for each month.
-        pils_order_sum_per_month = sum_data(pilsner, column_to_sum, sum_by)
-        # Calculates red_helles' Quantity ordered sums for each month.
-        redh_order_sum_per_month = sum_data(red_helles, column_to_sum, sum_by)
-        all_order_sum_month = {"dunkers": dunk_order_sum_per_month,
-                               "pilsner": pils_order_sum_per_month,
-                               "red_helles": redh_order_sum_per_month}
-        # Clears monthly sales forecasts from the dictionary.
-        app.config["monthly_sales_forecasts"] = {}
-        # Hyperparameters (hp) for seasonal ARIMA model.
-        order = app.config["order"]
-        # Sets num_months_in. as num of past periods to be considered by model.
-        app.config["seasonal_order"][3] = int(num_months_input)
-        seasonal_order = app.config["seasonal_order"]
-        # Fits ARIMA model and forecasts monthly sales for each beer type.
-        try:
-            for beer_type in all_order_sum_month:
-                model = define_and_fit_model(all_order_sum_month[beer_type],
-                                             False, order, seasonal_order)
-                # Forecasts 12 months into the future with the fitted model.
-                forecast = model.get_forecast(steps=12)
-                # Stores monthly sales forecasts in dictionary by beer_type.
-                app.config["monthly_sales_forecasts"][beer_type] = forecast
-                # Plots actual and predicted num of beers sold and saves plot.
-                plot_size = (15, 10)
-                plot_sales_forecast(forecast, all_order_sum_month[beer_type],
-                                    plot_size, beer_type)
-        except ValueError as error:
-            error_message = ("Wrong hyperparameters are set, the model "
-                             + "can not be fitted: " + str(error))
-            app.config["logger"].error(error_message)
-            return error_message
-        # Gets filepath of this module and thus filepath to graph (png file).
-        graph_filepath = os.path.dirname(os.path.abspath(__file__))
-        graph_filename = "monthly_forecast_and_past.png"
-        try:
-            # Opens plotted graph.
-            img = Image.open(graph_filename)
-            img.show()
-        except (FileNotFoundError, PermissionError) as error:
-            app.config["logger"].error(error)
+        # Sets num_months_in. as num of past periods to be considered by model;
+        # copies are passed to the job, so later requests can't change them.
+        seasonal_order = list(app.config["seasonal_order"])
+        seasonal_order[3] = int(num_months_input)
+        # Checkbox is only submitted if it is checked.
+        auto_tune = response.get("auto_tune_input") is not None
+        pipeline = partial(run_sales_forecast, csv_filename_input,
+                           list(app.config["order"]), seasonal_order,
+                           auto_tune)
+        # Runs forecast in background, so the request returns immediately.
+        if app.config["background_forecasts"]:
+            job_id = app.config["forecast_jobs"].submit(
+                pipeline, publish_sales_forecast)
+            html_job_info = ("""Forecast job {0} was submitted.
+                <a href="/forecast_status?job_id={0}">Show its progress</a>
+                <br>""").format(job_id)
+        else:
+            try:
+                # Stages are only logged, as nobody can poll them meanwhile.
+                publish_sales_forecast(pipeline(app.config["logger"].debug))
+            except ValueError as error:
+                app.config["logger"].error(error)
+                return str(error)
+            # Tables were updated by publish_sales_forecast.
+            html_gr_month_table = app.config["table_monthly_growth"]
+            html_gr_week_table = app.config["table_weekly_growth"]
+    # Shows graph of the latest published forecast, if there is one.
+    html_graph = "The sales forecast graph has not been created yet.<br>"
+    if app.config["latest_forecast_id"]:
+        html_graph = ("""<img src="/forecast_plot/{}" alt="Sales forecast"
+                style="max-width: 100%;"><br>""").format(
+                    app.config["latest_forecast_id"])
     # Finds names of all uploaded CSV files in folder where this module is.
     all_uploaded_csv = []
     for csv_file in glob.glob("*.csv"):
@@ -1189,11 +2453,14 @@ def predict_sales() -> str:
                 <input type="number" name="num_months_input" min="2"
                 required="required">
                 <br><br>
+                <input type="checkbox" name="auto_tune_input" value="tune">
+                Search the best hyperparameters for every beer type and use
+                them for this and later forecasts (takes considerably longer)
+                <br><br>
                 <input type="submit" value="Predict sales">
-            </form>
-            In case the graph is not displayed, please open the file """
-            + graph_filename + " manually using the path: "
-            + graph_filepath
+            </form>"""
+            + html_job_info
+            + html_graph
             + """<form action="/" method="POST">
                 <input type="hidden">
                 <br>
@@ -1227,167 +2494,63 @@ def plan_production() -> str:
     if not monthly_forecasts:
         return ("No prediction has been made. Please click first on the "
                 + "button 'First: predict sales' on the tracking screen.")
-    batches = app.config["batches"]
     tanks = app.config["tanks"]
     inventory = app.config["inventory"]
+    occupancy = app.config["tank_occupancy"]
+    # Number of calendar months (this month and the following) that the
+    # recommendation looks ahead.
+    num_months = app.config["projection_months"]
+    current_datetime = datetime.now()
+    # Holds first days of the months, to access the forecast values.
+    month_starts = get_month_starts(current_datetime, num_months)
     # Holds actual number of beers in inventory and actual number of beers that
-    # will be finished in the next three months on basis of production stage.
-    three_month_end_inv = {"dunkers": {"this_month": 0, "next_month": 0,
-                                       "third_month": 0},
-                           "pilsner": {"this_month": 0, "next_month": 0,
-                                       "third_month": 0},
-                           "red_helles": {"this_month": 0, "next_month": 0,
-                                          "third_month": 0}}
-    # Calculates when product. stage will be finished for 3 consecutive months.
-    for batch in batches.values():
-        # True if batch is already finished, continue with next batch.
-        if batch.bottles_put_in_inventory:
-            continue
-        # Implies batch isn't assigned to phase, values are set in next if-else
-        end_phase4 = ""
-        end_phase3_4 = ""
-        end_phase2_4 = ""
-        end_phase1_4 = ""
-        # Calculates end time of each batch assuming that each batch goes
-        # directly to the next production phase without any delays.
-        # True if the batch is in production phase 4 (bottling).
-        if batch.time_end_phase4 != "":
-            # Phase 4 ends when time_end_phase4 is reached.
-            end_phase4 = batch.time_end_phase4
-        # Else True if the batch is in production phase 3 (conditioning).
-        elif batch.time_end_phase3 != "":
-            # If the product is in phase 3, then the product will be finished
-            # after the duration of phase 3 + phase 4 ends.
-            # One minute per bottle (1/60) and each bottle contains 0.5 litres.
-            duration_p4 = (1 / 60) * batch.volume * 2 # In hours.
-            end_phase3_4 = batch.time_end_phase3 + timedelta(hours=duration_p4)
-        # Else True if the batch is in production phase 2 (fermentation).
-        elif batch.time_end_phase2 != "":
-            # P2 product will be finished after duration p2 + p3 + p4 ends.
-            duration_p3 = 336 #  In hours.
-            duration_p4 = (1 / 60) * batch.volume * 2
-            end_phase2_4 = (batch.time_end_phase2
-                            + timedelta(hours=duration_p3)
-                            + timedelta(hours=duration_p4))
-        # Else True if the batch is in production phase 1 (hot brewing).
-        elif batch.time_end_phase1 != "":
-            # P1 product will be finished after durat. p1 + p2 + p3 + p4 ends.
-            duration_p2 = 672 # In hours.
-            duration_p3 = 336
-            duration_p4 = (1 / 60) * batch.volume * 2
-            end_phase1_4 = (batch.time_end_phase1
-                            + timedelta(hours=duration_p2)
-                            + timedelta(hours=duration_p3)
-                            + timedelta(hours=duration_p4))
-        # Gets current month and is incremented for each iteration of for loop
-        # to represent month number of this_month, next_month, and third_month.
-        incre_month = datetime.now().month
-        months = ["this_month", "next_month", "third_month"]
-        # Calculates end of month inv. values for this, next, and third month.
-        for index, _ in enumerate(months):
-            # * 2 to get the number of bottles, 1 litre equals 2 bottles.
-            volume = batch.volume * 2
-            # True if phase4 has been reached and end month matches inc month.
-            if end_phase4 != "" and end_phase4.month == incre_month:
-                three_month_end_inv[batch.beer_type][months[index]] += volume
-            # Elif True if p3 has been reached and end month matches inc month.
-            elif end_phase3_4 != "" and end_phase3_4.month == incre_month:
-                three_month_end_inv[batch.beer_type][months[index]] += volume
-            # Elif True if p2 has been reached and end month matches inc month.
-            elif end_phase2_4 != "" and end_phase2_4.month == incre_month:
-                three_month_end_inv[batch.beer_type][months[index]] += volume
-            # Elif True if p1 has been reached and end month matches inc month.
-            elif end_phase1_4 != "" and end_phase1_4.month == incre_month:
-                three_month_end_inv[batch.beer_type][months[index]] += volume
-            incre_month += 1
-            # If month number is incremented to 13, it is set to 1 (January).
-            if incre_month == 13:
-                incre_month = 1
+    # will be finished in each month on basis of production stage; assumes
+    # that each batch goes directly to the next production phase without any
+    # delays. Finish times of all batches are projected at once.
+    month_end_inv = project_monthly_bottles(
+        app.config["phase_registry"], ["dunkers", "pilsner", "red_helles"],
+        current_datetime, num_months)
     # Adds actual inventory quantities to calculated end of month quantities.
-    for beer_type in three_month_end_inv:
+    for beer_type in month_end_inv:
         inventory_item_quantity = inventory.get_inv_items_quantity(beer_type)
         inventory_quantity = inventory_item_quantity["num"]
-        # Actual inventory quantities are only added to this_month inventory.
-        three_month_end_inv[beer_type]["this_month"] += inventory_quantity
-    # Holds three months (end of month) forecasted sales values.
-    three_month_forecast = {"dunkers": {"this_month": 0, "next_month": 0,
-                                        "third_month": 0},
-                            "pilsner": {"this_month": 0, "next_month": 0,
-                                        "third_month": 0},
-                            "red_helles": {"this_month": 0, "next_month": 0,
-                                           "third_month": 0}}
-    # Builds date-index to access forecast value for this, next, and 3rd month.
-    # 1. Builds date-index for this month.
-    # Gets current datetime.
-    current_datetime = datetime.now()
-    # Gets current month.
-    current_month = current_datetime.month
-    # Gets current year.
-    current_year = current_datetime.year
-    # Creates date-index to access forecast value for this month.
-    dt1st_month = datetime(current_year, current_month, 1) # 1st day of month.
-    # Gets number of days of the current month.
-    number_days = monthrange(current_year, current_month)[1]
-    # 2. Builds date-index for next month.
-    # Gets next datetime.
-    next_datetime = current_datetime + timedelta(days=number_days)
-    # Gets next month.
-    next_month = next_datetime.month
-    # Gets year in next month.
-    next_months_year = next_datetime.year
-    # Creates date-index to access forecast value for next month.
-    dt2nd_month = datetime(next_months_year, next_month, 1)
-    # Gets number of days of the next month.
-    number_days = monthrange(next_months_year, next_month)[1]
-    # 3. Builds date-index for 3rd month.
-    # Gets 3rd datetime.
-    third_datetime = next_datetime + timedelta(days=number_days)
-    # Gets 3rd month.
-    third_month = third_datetime.month
-    # Gets year in 3rd month.
-    third_months_year = third_datetime.year
-    # Creates date-index to access forecast value for 3rd month.
-    dt3rd_month = datetime(third_months_year, third_month, 1)
-    # Gets and stores forecast values for three months in three_month_forecast.
+        # Actual inventory quantities are only added to this month's inventory.
+        month_end_inv[beer_type][0] += inventory_quantity
+    # Holds forecasted sales values (end of month) for each month.
+    month_forecast = {beer_type: [0] * num_months
+                      for beer_type in month_end_inv}
+    # Gets and stores forecast values for each month in month_forecast.
     for beer_type in monthly_forecasts:
-        forecast_1st = monthly_forecasts[beer_type].predicted_mean[dt1st_month]
-        forecast_2nd = monthly_forecasts[beer_type].predicted_mean[dt2nd_month]
-        forecast_3rd = monthly_forecasts[beer_type].predicted_mean[dt3rd_month]
+        # Recipes that aren't one of the brewery's beer types aren't produced.
+        if beer_type not in month_forecast:
+            continue
+        predicted_mean = monthly_forecasts[beer_type].predicted_mean
         try:
-            three_month_forecast[beer_type]["this_month"] = int(forecast_1st)
-            three_month_forecast[beer_type]["next_month"] = int(forecast_2nd)
-            three_month_forecast[beer_type]["third_month"] = int(forecast_3rd)
+            # Months beyond the forecast have no forecasted sales.
+            month_forecast[beer_type] = [
+                int(predicted_mean.get(month_start, 0))
+                for month_start in month_starts]
         except ValueError as error:
             app.config["logger"].error(error)
-    # Holds 3 months differ. between forecast and finished inv. for each beer.
-    diff_3months_forecast_actual = {"dunkers": 0, "pilsner": 0,
-                                    "red_helles": 0}
-    # Calculates for each beer differ. between forecast and finished inventory.
-    for beer_type in three_month_end_inv:
-        # Holds finished inventory quantity for 3 months per beer type.
-        fin_inv_beer_3months = 0
-        # Holds forecasted sales quantity for 3 months per beer type.
-        forecast_beer_3months = 0
-        # 2nd for loop to iterate over dict in dict to calculate difference.
-        for month in three_month_end_inv[beer_type]:
-            fin_inv_beer_3months += three_month_end_inv[beer_type][month]
-            forecast_beer_3months += three_month_forecast[beer_type][month]
-        diff_beer_3months = fin_inv_beer_3months - forecast_beer_3months
-        diff_3months_forecast_actual[beer_type] = diff_beer_3months
+    # Holds differ. between forecast and finished inv. for each beer over all
+    # months.
+    diff_months_forecast_actual = {
+        beer_type: (sum(month_end_inv[beer_type])
+                    - sum(month_forecast[beer_type]))
+        for beer_type in month_end_inv}
     # Determines which beer should be produced next;
     # beer type with highest negative difference between finished inventory and
     # sales forecast is recommended to be produced if equipment is available.
     # Gets beer type with highest negative difference.
-    produce_beer = min(diff_3months_forecast_actual,
-                       key=lambda beer: diff_3months_forecast_actual[beer])
-    used_tanks = []
-    # Adds the names of all used tanks to used_tanks' list.
-    for batch in batches.values():
-        # True if tank is used.
-        if batch.phase_current_tank != "":
-            used_tanks.append(batch.phase_current_tank)
+    produce_beer = min(diff_months_forecast_actual,
+                       key=lambda beer: diff_months_forecast_actual[beer])
     all_tanks = tanks.get_tank_names()
-    available_tanks = [tank for tank in all_tanks if tank not in used_tanks]
+    # Gets all tanks that are not occupied via the tank occupancy index and
+    # not reserved while the next batch would ferment via the tank calendar.
+    ferm_start = datetime.now() + timedelta(hours=HOT_BREWING_HOURS)
+    available_tanks = app.config["tank_calendar"].get_free_tanks(
+        occupancy.get_free_tanks(all_tanks), ferm_start,
+        ferm_start + timedelta(hours=FERM_HOURS))
     capable_tanks = {}
     # Checks if tank with right capability is available.
     for tank_name in available_tanks:
@@ -1405,32 +2568,24 @@ def plan_production() -> str:
         use_tank = "'currently no tank with right capability available'"
         use_tank_volume = 0
     # Creates recommendation for the user.
-    recommendation = ("Based on the three-month forecast and production phases"
+    recommendation = ("Based on the {0}-month forecast and production phases"
                       + ", available tanks, capabilities and volumes, it is "
-                      + "recommended to produce <b>{0}</b> in tank <b>{1}</b> "
-                      + "next.").format(produce_beer, use_tank)
+                      + "recommended to produce <b>{1}</b> in tank <b>{2}</b> "
+                      + "next.").format(num_months, produce_beer, use_tank)
     # Creates reasoning for the user.
-    # Creates HTML table containing three months end inventory.
-    html_3months_end_inv_table = update_three_months_table(three_month_end_inv)
-    # Creates HTML table containing three months forecasted sales.
-    html_3months_foreca_table = update_three_months_table(three_month_forecast)
-    reason = ("Actual number of beers in inventory and actual number of beers "
-              + "that will be finished in the next three months are:<br>"
-              + """<table>
-                  <tr>
-                    <th></th>
-                    <th>This month</th>
-                    <th>Next month</th>
-                    <th>Third month</th>
-                  </tr>""" + html_3months_end_inv_table + "</table><br>"
-              + "Three months forecasted sales (in bottles) are:"
-              + """<table>
-                  <tr>
-                    <th></th>
-                    <th>This month</th>
-                    <th>Next month</th>
-                    <th>Third month</th>
-                  </tr>""" + html_3months_foreca_table + "</table><br>"
+    # Creates HTML table containing end of month inventory.
+    html_months_end_inv_table = update_months_table(month_end_inv,
+                                                    month_starts)
+    # Creates HTML table containing monthly forecasted sales.
+    html_months_foreca_table = update_months_table(month_forecast,
+                                                   month_starts)
+    reason = (("Actual number of beers in inventory and actual number of "
+               + "beers that will be finished in the next {} months "
+               + "are:<br>").format(num_months)
+              + html_months_end_inv_table + "<br>"
+              + ("Forecasted sales (in bottles) of the next {} months "
+                 + "are:").format(num_months)
+              + html_months_foreca_table + "<br>"
               + "Beer type with highest difference between forecast and "
               + "finished inventory is recommended to be produced if "
               + "equipment is available. The difference is (in bottles):<br>"
@@ -1445,14 +2600,39 @@ def plan_production() -> str:
                         <td>{1}</td>
                         <td>{2}</td>
                       </tr></table><br>
-                  """.format(diff_3months_forecast_actual["dunkers"],
-                             diff_3months_forecast_actual["pilsner"],
-                             diff_3months_forecast_actual["red_helles"])
+                  """.format(diff_months_forecast_actual["dunkers"],
+                             diff_months_forecast_actual["pilsner"],
+                             diff_months_forecast_actual["red_helles"])
               + "Available tank(s) with right capability is/are:<b>"
               + str(capable_tanks) + "</b>, where the highest available "
               + "volume is <b>{}</b> litres. ".format(use_tank_volume)
               + ("Thus, it is recommended to produce <b>{0}</b> in tank "
                  + "<b>{1}</b>.").format(produce_beer, use_tank))
+    # Plans batches on tanks and bottling line for the planning horizon.
+    production_plan = get_production_plan(
+        monthly_forecasts, [beer_type for beer_type in month_forecast
+                            if beer_type in monthly_forecasts])
+    html_production_plan_table = update_production_plan_table(
+        production_plan["batches"])
+    shortfall_after = {
+        beer_type: int(shortfalls[-1]) for beer_type, shortfalls
+        in production_plan["shortfall_after"].items()}
+    production_plan_html = (
+        "<h3>Production plan for the next {} weeks</h3>".format(
+            app.config["planning_horizon_weeks"])
+        + """<table>
+              <tr>
+                <th>Hot brewing starts</th>
+                <th>Beer type</th>
+                <th>Volume (L)</th>
+                <th>Fermenter</th>
+                <th>Conditioner</th>
+                <th>Bottling starts</th>
+                <th>Finishes</th>
+                <th>Bottles</th>
+              </tr>""" + html_production_plan_table + "</table><br>"
+        + "Forecasted sales that can't be covered by the end of the plan "
+        + "(in bottles): " + str(shortfall_after) + "<br>")
     return ("""<style>
                 h1, h2, h3 {
                   font-family: arial, sans-serif;
@@ -1475,6 +2655,7 @@ def plan_production() -> str:
             + recommendation
             + "<br><br><b>Reasoning:</b></br>"
             + reason
+            + production_plan_html
             + """<form action="/" method="POST">
                 <input type="hidden">
                 <br>
@@ -1492,6 +2673,16 @@ def main() -> None:
     """
     # Configures and starts logging.
     app.config["logger"] = start_logging()
+    # Restores the program state from snapshot and journal or SQLite store.
+    if app.config["journal_enabled"]:
+        start_journal()
+    # Advances batches whose phase ends in the background.
+    if app.config["phase_scheduler_enabled"]:
+        start_phase_scheduler()
+    # Imports forecasting stack in the background, so the server starts fast
+    # and the first forecast doesn't wait for the imports.
+    if app.config["prewarm_forecasting"]:
+        prewarm_forecasting()
     # Starts and runs Flask server on localhost:5000 if True.
     if app.config["localhost"]:
         app.run()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how long importing the interface module takes, i.e. the cold start of
+the server before it can answer requests, and checks that the forecasting
+stack isn't imported with it. Every measurement runs in a fresh Python process
+so that no module is already imported. Exits with status 1 if the median
+import time exceeds the budget or a lazily imported module was imported, so
+the script can be run to catch startup time regressions, e.g.:
+python measure_startup_brewing.py --runs 5 --budget 1.0
+"""
+from typing import List
+from typing import Tuple
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules that must only be imported on first use of the forecasting stack.
+LAZY_MODULES = ["pandas", "statsmodels", "matplotlib", "PIL"]
+# Code run in each fresh process; prints import time and imported lazy modules.
+MEASURE_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import interface_brew_tracking
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in {lazy_modules!r}
+                            if name in sys.modules]]))
+"""
+
+def measure_import(module_dir: str) -> Tuple[float, List[str]]:
+    """Imports interface module in a fresh process and measures the time
+
+    Args:
+        module_dir (str): A string representing the directory of the module
+
+    Returns:
+        (tuple): A float representing the import time in seconds and a list
+            of the lazily imported modules that were imported nonetheless
+    """
+    code = MEASURE_CODE.format(lazy_modules=LAZY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=module_dir,
+                            check=True, capture_output=True, text=True).stdout
+    # Last line is the measurement; the module may print before.
+    seconds, imported = json.loads(output.strip().splitlines()[-1])
+    return seconds, imported
+
+def main() -> None:
+    """Measures import time several times and checks it against the budget
+
+    Args:
+        No arguments
+
+    Returns:
+        No returns
+    """
+    parser = argparse.ArgumentParser(description="Measures startup time")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="number of fresh processes to measure")
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="max median import time in seconds")
+    arguments = parser.parse_args()
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    import_times = []
+    imported_lazy_modules = set()
+    for _ in range(arguments.runs):
+        seconds, imported = measure_import(module_dir)
+        import_times.append(seconds)
+        imported_lazy_modules.update(imported)
+    median = statistics.median(import_times)
+    print("Import time of interface_brew_tracking: median {:.3f} s, min "
+          "{:.3f} s, max {:.3f} s ({} runs)".format(
+              median, min(import_times), max(import_times), arguments.runs))
+    failed = False
+    if imported_lazy_modules:
+        print("Imported at startup although they should be imported lazily: "
+              + ", ".join(sorted(imported_lazy_modules)))
+        failed = True
+    if median > arguments.budget:
+        print("Median import time exceeds the budget of {:.3f} s".format(
+            arguments.budget))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
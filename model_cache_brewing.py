@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a cache of fitted seasonal ARIMA models. A model is identified by a
+fingerprint of the series it was fitted to and by its hyperparameters (order
+and seasonal order). The cache holds the fitted parameters of the models, as
+these are all that is needed to recreate a fitted model without fitting it
+again: applying them to the series runs the Kalman filter only once. Least
+recently used models are evicted from memory first; optionally, the parameters
+are also written to a directory, so cached models survive restarts.
+"""
+from collections import OrderedDict
+from typing import List
+from typing import Optional
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from persistence_brew_tracking import write_file_atomically
+
+# Is part of every cache key; must be increased whenever the way models are
+# defined or fitted changes, so that parameters of older models aren't used.
+MODEL_VERSION = 1
+
+def fingerprint_series(series: pd.Series) -> str:
+    """Calculates hash of the dates, values, and frequency of series
+
+    Args:
+        series (pd.Series): A pd.Series with dates as index
+
+    Returns:
+        (str): A string representing the hex digest of the series
+    """
+    series_hash = hashlib.sha256()
+    series_hash.update(str(series.index.freqstr).encode())
+    series_hash.update(np.ascontiguousarray(
+        series.index.values.astype("datetime64[ns]")).tobytes())
+    series_hash.update(np.ascontiguousarray(
+        series.to_numpy(dtype=np.float64)).tobytes())
+    return series_hash.hexdigest()
+
+class FittedModelCache:
+    """Caches parameters of fitted models by series and hyperparameters
+
+    Attributes:
+        cache_dir (str): A string representing the directory of the disk
+            cache; None disables the disk cache
+        max_entries (int): An int representing max num of models in memory
+        params (OrderedDict): An OrderedDict mapping cache keys to fitted
+            parameters, ordered from least to most recently used
+        lock (threading.Lock): A lock, as requests may forecast concurrently
+    """
+    def __init__(self, cache_dir: Optional[str] = None,
+                 max_entries: int = 64) -> None:
+        """Initialises all instance variables of FittedModelCache
+
+        Args:
+            cache_dir (str): A string representing the directory of the disk
+                cache; None disables the disk cache
+            max_entries (int): An int representing max num of models in memory
+
+        Returns:
+            No returns
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.params = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(series: pd.Series, order: List[int],
+                seasonal_order: List[int]) -> str:
+        """Gets cache key of model fitted to series with hyperparameters
+
+        Args:
+            series (pd.Series): A pd.Series representing the fitted data
+            order (list): A list representing hyperparam. for the ARIMA model
+            seasonal_order (list): A list repres. hyperp. of seasonal component
+
+        Returns:
+            (str): A string representing the cache key
+        """
+        hyperparameters = "_".join(str(int(value)) for value
+                                   in list(order) + list(seasonal_order))
+        return "{}_{}_v{}".format(fingerprint_series(series), hyperparameters,
+                                  MODEL_VERSION)
+
+    def get_disk_path(self, key: str) -> str:
+        """Gets path of the disk cache file of the model with key
+
+        Args:
+            key (str): A string representing the cache key
+
+        Returns:
+            (str): A string representing the path of the disk cache file
+        """
+        return os.path.join(self.cache_dir, key + ".pickle")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Gets fitted parameters from memory or disk cache
+
+        Args:
+            key (str): A string representing the cache key
+
+        Returns:
+            (np.ndarray): The fitted parameters; None if they aren't cached
+        """
+        with self.lock:
+            params = self.params.get(key)
+            if params is not None:
+                self.params.move_to_end(key)
+                return params
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.get_disk_path(key), "rb") as file:
+                params = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        # A damaged cache file is treated like a missing one.
+        except (EOFError, pickle.UnpicklingError) as error:
+            logging.warning("Model cache file of %s is damaged: %s", key,
+                            error)
+            return None
+        self.put_memory(key, params)
+        return params
+
+    def put_memory(self, key: str, params: np.ndarray) -> None:
+        """Puts fitted parameters into memory cache, evicts least recently used
+
+        Args:
+            key (str): A string representing the cache key
+            params (np.ndarray): An array representing fitted parameters
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            self.params[key] = params
+            self.params.move_to_end(key)
+            while len(self.params) > self.max_entries:
+                self.params.popitem(last=False)
+
+    def put(self, key: str, params: np.ndarray) -> None:
+        """Puts fitted parameters into memory cache and disk cache
+
+        Args:
+            key (str): A string representing the cache key
+            params (np.ndarray): An array representing fitted parameters
+
+        Returns:
+            No returns
+        """
+        self.put_memory(key, params)
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_file_atomically(self.get_disk_path(key),
+                                  pickle.dumps(params))
+        except OSError as error:
+            logging.warning("Fitted model could not be cached on disk: %s",
+                            error)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Provides automatic tuning of the hyperparameters of the seasonal ARIMA model.
+A grid of candidate orders (p, d, q) and seasonal orders (P, D, Q, s) is
+evaluated for every beer type in parallel worker processes. Candidates are
+ranked by the Akaike (AIC) or Bayesian information criterion (BIC) of the
+model fitted to all data, or by the root mean squared error of a forecast of
+the last holdout periods by a model fitted to the periods before them. Fits
+are stopped after a maximum number of optimizer iterations; candidates whose
+fit doesn't converge or yields non-finite values are discarded. The winning
+hyperparameters of every beer type are saved to a JSON file.
+"""
+from concurrent.futures import Executor
+from itertools import product
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
+import json
+import logging
+import math
+import warnings
+import numpy as np
+import pandas as pd
+from persistence_brew_tracking import write_file_atomically
+from sales_forecast_brewing import define_and_fit_model
+
+# Criteria by which candidates can be ranked; lower is better for all.
+CRITERIA = ("aic", "bic", "holdout")
+
+def get_candidate_grid(grid: Dict[str, List[int]], season_length: int
+                       ) -> List[Tuple[List[int], List[int]]]:
+    """Creates all combinations of the hyperparameter values of grid
+
+    Args:
+        grid (dict): A dict mapping "p", "d", "q", "P", "D", and "Q" to lists
+            of the values to try
+        season_length (int): An int representing num of periods in a season
+
+    Returns:
+        (list): A list of tuples (order, seasonal order)
+    """
+    return [([p, d, q], [seasonal_p, seasonal_d, seasonal_q, season_length])
+            for p, d, q, seasonal_p, seasonal_d, seasonal_q
+            in product(grid["p"], grid["d"], grid["q"], grid["P"], grid["D"],
+                       grid["Q"])]
+
+def score_fitted_model(fitted_model: object, criterion: str) -> float:
+    """Gets AIC or BIC of fitted model; inf if the fit diverged
+
+    Args:
+        fitted_model (obj): An object representing the fitted ARIMA model
+        criterion (str): A string representing the criterion, "aic" or "bic"
+
+    Returns:
+        (float): A float representing the score; lower is better
+    """
+    converged = fitted_model.mle_retvals.get("converged", True)
+    score = float(getattr(fitted_model, criterion))
+    if not converged or not np.all(np.isfinite(fitted_model.params)):
+        return math.inf
+    return score if math.isfinite(score) else math.inf
+
+def evaluate_candidate(series: pd.Series, order: List[int],
+                       seasonal_order: List[int], criterion: str,
+                       holdout_periods: int, maxiter: int) -> float:
+    """Fits candidate model to series and scores it by criterion
+
+    Args:
+        series (pd.Series): A pd.Series representing past monthly sales
+        order (list): A list representing hyperparameters for the ARIMA model
+        seasonal_order (list): A list repres. hyperparam. of seasonal component
+        criterion (str): A string representing the criterion: "aic", "bic",
+            or "holdout"
+        holdout_periods (int): An int representing num of last periods that
+            are forecasted to calculate the holdout error
+        maxiter (int): An int representing max num of optimizer iterations
+
+    Returns:
+        (float): A float representing the score; lower is better; inf if the
+            model can't be fitted or the fit diverged
+    """
+    fit_series = series
+    if criterion == "holdout":
+        fit_series = series.iloc[:-holdout_periods]
+    try:
+        # Warnings about non-convergence are expected for many candidates.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fitted_model = define_and_fit_model(fit_series, False, order,
+                                                seasonal_order, maxiter)
+            if criterion != "holdout":
+                return score_fitted_model(fitted_model, "aic"
+                                          if criterion == "aic" else "bic")
+            # Fits that diverged aren't worth forecasting with.
+            if not math.isfinite(score_fitted_model(fitted_model, "aic")):
+                return math.inf
+            predicted = fitted_model.forecast(steps=holdout_periods)
+    # Fitting fails if e.g. there are too few periods for the orders.
+    except (ValueError, IndexError, np.linalg.LinAlgError):
+        return math.inf
+    errors = (np.asarray(predicted, dtype=np.float64)
+              - series.iloc[-holdout_periods:].to_numpy(dtype=np.float64))
+    rmse = float(np.sqrt(np.mean(errors ** 2)))
+    return rmse if math.isfinite(rmse) else math.inf
+
+def tune_hyperparameters(executor: Executor,
+                         series_by_beer: Dict[str, pd.Series],
+                         candidates: List[Tuple[List[int], List[int]]],
+                         criterion: str = "aic", holdout_periods: int = 6,
+                         maxiter: int = 50) -> Dict[str, Dict[str, Any]]:
+    """Finds the best candidate hyperparameters for each beer type
+
+    All candidates of all beer types are evaluated in parallel by executor.
+
+    Args:
+        executor (Executor): The pool of worker processes, e.g. the one of
+            the forecast engine, so that no extra pool is started
+        series_by_beer (dict): A dict mapping beer types to pd.Series
+            representing past monthly sales
+        candidates (list): A list of tuples (order, seasonal order)
+        criterion (str): A string representing the criterion: "aic", "bic",
+            or "holdout"
+        holdout_periods (int): An int representing num of last periods that
+            are forecasted to calculate the holdout error
+        maxiter (int): An int representing max num of optimizer iterations
+
+    Returns:
+        (dict): A dict mapping beer types to a dict with the winning "order",
+            "seasonal_order", "criterion", and "score"; beer types for which
+            no candidate could be fitted are left out
+
+    Raises:
+        ValueError: If criterion is unknown or holdout_periods is below 1
+    """
+    if criterion not in CRITERIA:
+        raise ValueError("Unknown tuning criterion: {}".format(criterion))
+    if criterion == "holdout" and holdout_periods < 1:
+        raise ValueError("At least one holdout period is needed")
+    futures = {}
+    for beer_type, series in series_by_beer.items():
+        for index, (order, seasonal_order) in enumerate(candidates):
+            futures[(beer_type, index)] = executor.submit(
+                evaluate_candidate, series, order, seasonal_order,
+                criterion, holdout_periods, maxiter)
+    try:
+        scores = {job: future.result() for job, future in futures.items()}
+    finally:
+        # The pool is shared, so left candidates mustn't keep it busy.
+        for future in futures.values():
+            future.cancel()
+    winners = {}
+    for beer_type in series_by_beer:
+        # Ties are won by the candidate that comes first, i.e. the simpler.
+        score, index = min((scores[(beer_type, index)], index)
+                           for index in range(len(candidates)))
+        if not math.isfinite(score):
+            logging.warning("No hyperparameters could be fitted for %s",
+                            beer_type)
+            continue
+        order, seasonal_order = candidates[index]
+        winners[beer_type] = {"order": list(order),
+                              "seasonal_order": list(seasonal_order),
+                              "criterion": criterion, "score": score}
+    return winners
+
+def save_tuned_hyperparameters(file_path: str,
+                               winners: Dict[str, Dict[str, Any]]) -> None:
+    """Writes the winning hyperparameters of each beer type to a JSON file
+
+    Args:
+        file_path (str): A string representing the path to the JSON file
+        winners (dict): A dict mapping beer types to their hyperparameters
+
+    Returns:
+        No returns
+    """
+    data = json.dumps(winners, indent=2, sort_keys=True).encode("utf-8")
+    write_file_atomically(file_path, data)
+
+def load_tuned_hyperparameters(file_path: str) -> Dict[str, Dict[str, Any]]:
+    """Reads the winning hyperparameters of each beer type from a JSON file
+
+    Args:
+        file_path (str): A string representing the path to the JSON file
+
+    Returns:
+        (dict): A dict mapping beer types to their hyperparameters; empty if
+            the file doesn't exist or can't be read
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        logging.error("Tuned hyperparameters could not be read: %s", error)
+        return {}
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Provides an append-only journal to persist the state of the brewing process.
+Every change to batches, orders, and the inventory is written as one record to
+the journal when it happens, so saving costs O(change) instead of pickling the
+entire program state. The journal is compacted into a snapshot (the pickle
+file of the program state) from time to time; on startup, the snapshot is
+loaded and all journal records that are newer than the snapshot are replayed.
+Each record is pickled, flushed, and synced to disk on its own, so a crash
+loses at most the record that was being written. Snapshots can be written by a
+background worker from a copy of the state, and are written to a temporary
+file that atomically replaces the previous snapshot.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+import copy
+import glob
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+
+# Instance variables of Batch that change when the batch's phase is changed.
+BATCH_PHASE_FIELDS = ["phase_current", "phase_current_tank",
+                      "phase_last_completed", "time_start_phase1",
+                      "time_start_phase2", "time_start_phase3",
+                      "time_start_phase4", "time_end_phase1",
+                      "time_end_phase2", "time_end_phase3", "time_end_phase4",
+                      "bottles_put_in_inventory", "num_bottles_to_inv"]
+
+def get_batch_phase_state(batch: object) -> Dict[str, Any]:
+    """Gets all instance variables of batch that change with batch's phase
+
+    Args:
+        batch (Batch): An instance of class Batch
+
+    Returns:
+        (dict): A dict representing the batch's phase-dependent variables
+    """
+    return {field: getattr(batch, field) for field in BATCH_PHASE_FIELDS}
+
+def set_batch_phase_state(batch: object, phase_state: Dict[str, Any]) -> None:
+    """Sets the phase-dependent instance variables of batch
+
+    Args:
+        batch (Batch): An instance of class Batch
+        phase_state (dict): A dict repres. the batch's phase-dependent vars
+
+    Returns:
+        No returns
+    """
+    for field, value in phase_state.items():
+        setattr(batch, field, value)
+
+def write_file_atomically(file_path: str, data: bytes) -> None:
+    """Writes data to temporary file, syncs it, and renames it to file_path
+
+    Args:
+        file_path (str): A string representing the path of the file to write
+        data (bytes): The bytes to write
+
+    Returns:
+        No returns
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    # Temporary file is created in the same directory, so the rename is atomic
+    # and the existing file stays intact if the program crashes while writing.
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory,
+                                                  suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    # Syncs the directory so that the rename itself survives a crash; not
+    # every operating system supports opening directories.
+    try:
+        directory_descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory_descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(directory_descriptor)
+
+def copy_program_state(program_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Copies program state so that it can be pickled while it is changed
+
+    Args:
+        program_state (dict): A dict representing the state of the program
+
+    Returns:
+        (dict): A dict representing a consistent copy of the program state
+    """
+    # Batches and orders are copied one level deep, which is cheap compared to
+    # pickling them; the handles of the batches aren't pickled anyway.
+    return {"batches": {batch_id: copy.copy(batch) for batch_id, batch
+                        in program_state["batches"].items()},
+            "orders": {invoice_number: dict(order) for invoice_number, order
+                       in program_state["orders"].items()},
+            "inventory": copy.deepcopy(program_state["inventory"]),
+            "forecasts": dict(program_state["forecasts"]),
+            # Snapshots written before tanks could be reserved have none.
+            "reservations": {reservation_id: dict(reservation)
+                             for reservation_id, reservation
+                             in program_state.get("reservations",
+                                                  {}).items()},
+            "journal_seq": program_state.get("journal_seq", 0)}
+
+class SnapshotWorker:
+    """Pickles and writes snapshots of the program state in the background
+
+    Attributes:
+        executor (ThreadPoolExecutor): Single worker thread writing snapshots
+        jobs (dict): A dict mapping job IDs to the status of the snapshot job
+        max_jobs (int): An int representing number of job statuses to keep
+        lock (threading.Lock): Lock protecting the job statuses
+    """
+    def __init__(self, max_jobs: int = 100) -> None:
+        """Initialises all instance variables of SnapshotWorker
+
+        Args:
+            max_jobs (int): An int representing number of job statuses to keep
+
+        Returns:
+            No returns
+        """
+        # One worker, so snapshots are written one after the other.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.jobs = {}
+        self.max_jobs = max_jobs
+        self.lock = threading.Lock()
+
+    def submit(self, program_state: Dict[str, Any], file_path: str,
+               on_success: Optional[Callable[[], None]] = None) -> str:
+        """Queues a snapshot of an already copied program state
+
+        Args:
+            program_state (dict): A dict representing a copy of program state
+            file_path (str): A string representing the path to snapshot file
+            on_success (Callable): Function called after snapshot was written;
+                None if nothing has to be done afterwards
+
+        Returns:
+            job_id (str): A string representing the ID of the snapshot job
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {"status": "pending",
+                                 "submitted": datetime.now(),
+                                 "finished": "", "error": ""}
+            # Forgets the oldest job statuses (dicts keep insertion order).
+            while len(self.jobs) > self.max_jobs:
+                del self.jobs[next(iter(self.jobs))]
+        self.executor.submit(self.run, job_id, program_state, file_path,
+                             on_success)
+        return job_id
+
+    def run(self, job_id: str, program_state: Dict[str, Any], file_path: str,
+            on_success: Optional[Callable[[], None]]) -> None:
+        """Pickles program state and writes it atomically (in worker thread)
+
+        Args:
+            job_id (str): A string representing the ID of the snapshot job
+            program_state (dict): A dict representing a copy of program state
+            file_path (str): A string representing the path to snapshot file
+            on_success (Callable): Function called after snapshot was written
+
+        Returns:
+            No returns
+        """
+        self.set_status(job_id, status="running")
+        try:
+            data = pickle.dumps(program_state,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+            write_file_atomically(file_path, data)
+            if on_success is not None:
+                on_success()
+        # Any error must end up in the job status, else it stays "running".
+        except Exception as error: # pylint: disable=broad-except
+            logging.error("Snapshot %s failed: %s", job_id, error)
+            self.set_status(job_id, status="failed", error=str(error),
+                            finished=datetime.now())
+        else:
+            self.set_status(job_id, status="done", finished=datetime.now())
+
+    def set_status(self, job_id: str, **values: Any) -> None:
+        """Updates the status of a snapshot job
+
+        Args:
+            job_id (str): A string representing the ID of the snapshot job
+            values (Any): Keyword arguments representing the updated values
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(values)
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Gets the status of a snapshot job
+
+        Args:
+            job_id (str): A string representing the ID of the snapshot job
+
+        Returns:
+            (dict): A dict representing the job status or None if unknown
+        """
+        with self.lock:
+            job_status = self.jobs.get(job_id)
+            return None if job_status is None else dict(job_status)
+
+class StateJournal:
+    """Appends state changes to a journal file and reads them back
+
+    The records of the current journal file are numbered with increasing
+    sequence numbers. On compaction, the current file is rotated (renamed to
+    the file name plus the last sequence number in it) so that new records can
+    be appended while the snapshot is written; rotated files are deleted once
+    a snapshot that contains their records exists.
+
+    Attributes:
+        file_path (str): A string representing the path to the journal file
+        fsync (bool): Bool where True syncs every record to disk
+        last_seq (int): An int representing the last written sequence number
+        num_records (int): An int repres. number of records since last rotation
+        file (file): The journal file opened for appending
+        lock (threading.Lock): Lock so that records are written one by one
+    """
+    def __init__(self, file_path: str, fsync: bool = True) -> None:
+        """Initialises all instance variables of StateJournal
+
+        Args:
+            file_path (str): A string representing the path to journal file
+            fsync (bool): Bool where True syncs every record to disk
+
+        Returns:
+            No returns
+        """
+        self.file_path = file_path
+        self.fsync = fsync
+        self.last_seq = 0
+        self.num_records = 0
+        self.lock = threading.Lock()
+        # Continues numbering after the records that are already on disk.
+        for seq, _, _ in self.read_records(0):
+            self.last_seq = seq
+        self.file = None
+        self.open_current_file()
+
+    def get_rotated_file_paths(self) -> List[Tuple[int, str]]:
+        """Gets the rotated journal files sorted by their last sequence number
+
+        Args:
+            No arguments
+
+        Returns:
+            (list): A list of tuples (last sequence number, file path)
+        """
+        rotated_files = []
+        for file_path in glob.glob(glob.escape(self.file_path) + ".*"):
+            suffix = file_path[len(self.file_path) + 1:]
+            if suffix.isdigit():
+                rotated_files.append((int(suffix), file_path))
+        return sorted(rotated_files)
+
+    def open_current_file(self) -> None:
+        """Opens current journal file and cuts off a partly written record
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        valid_length = 0
+        self.num_records = 0
+        # Finds the end of the last complete record in the current file.
+        try:
+            with open(self.file_path, "rb") as file:
+                for _ in self.read_file(file):
+                    valid_length = file.tell()
+                    self.num_records += 1
+        except FileNotFoundError:
+            pass
+        # ab to append binary to file; creates the file if it doesn't exist.
+        self.file = open(self.file_path, "ab")
+        if self.file.tell() > valid_length:
+            logging.error("Journal %s ends with an incomplete record, which "
+                          "is discarded.", self.file_path)
+            self.file.truncate(valid_length)
+
+    @staticmethod
+    def read_file(file: Any) -> Iterator[Tuple[int, str, Any]]:
+        """Reads records from an opened journal file until an invalid record
+
+        Args:
+            file (file): A journal file opened for reading binary
+
+        Returns:
+            (Iterator): An iterator of (sequence number, kind, payload) tuples
+        """
+        while True:
+            try:
+                yield pickle.load(file)
+            # An incomplete record was written when the program crashed.
+            except (EOFError, pickle.UnpicklingError, ValueError):
+                return
+
+    def read_records(self, after_seq: int) -> Iterator[Tuple[int, str, Any]]:
+        """Reads all records (rotated and current) after a sequence number
+
+        Args:
+            after_seq (int): Records with this or a lower number are skipped
+
+        Returns:
+            (Iterator): An iterator of (sequence number, kind, payload) tuples
+        """
+        file_paths = [file_path for last_seq, file_path
+                      in self.get_rotated_file_paths() if last_seq > after_seq]
+        file_paths.append(self.file_path)
+        for file_path in file_paths:
+            try:
+                with open(file_path, "rb") as file:
+                    for seq, kind, payload in self.read_file(file):
+                        if seq > after_seq:
+                            yield seq, kind, payload
+            except FileNotFoundError:
+                continue
+
+    def append(self, kind: str, payload: Any) -> int:
+        """Appends one record to the journal and syncs it to disk
+
+        Args:
+            kind (str): A string representing the kind of change
+            payload (Any): The data needed to replay the change
+
+        Returns:
+            (int): An int representing the sequence number of the record
+        """
+        with self.lock:
+            self.last_seq += 1
+            pickle.dump((self.last_seq, kind, payload), self.file)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.num_records += 1
+            return self.last_seq
+
+    def rotate(self) -> int:
+        """Closes current journal file and starts a new one for compaction
+
+        Args:
+            No arguments
+
+        Returns:
+            (int): An int representing the last sequence number before rotation
+        """
+        with self.lock:
+            self.file.close()
+            # Empty journal files don't need to be kept.
+            if self.num_records > 0:
+                os.replace(self.file_path,
+                           "{}.{}".format(self.file_path, self.last_seq))
+            self.file = open(self.file_path, "ab")
+            self.num_records = 0
+            return self.last_seq
+
+    def discard_upto(self, seq: int) -> None:
+        """Deletes rotated journal files that a snapshot already contains
+
+        Args:
+            seq (int): An int representing last sequence number of snapshot
+
+        Returns:
+            No returns
+        """
+        for last_seq, file_path in self.get_rotated_file_paths():
+            if last_seq <= seq:
+                os.remove(file_path)
+
+    def close(self) -> None:
+        """Closes the journal file
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a scheduler that keeps the end times of the current phases of all
+batches in a min-heap, so the next phase deadline is known in O(1) and a batch
+is (re)scheduled in O(log n) without scanning the batches. A background thread
+waits on a condition until the earliest deadline instead of polling, and is
+woken early whenever an earlier deadline is scheduled. When a batch's phase
+changes, a new heap entry is pushed and the old one is left in the heap; it is
+recognised as outdated and skipped when it's popped (lazy invalidation). Each
+reached deadline is passed to a callback, which can e.g. advance the batch to
+its next phase; batches that can't advance yet, because no tank is free, wait
+until the scheduler is told that tanks were released.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import heapq
+import itertools
+import logging
+import threading
+
+# Production phases in the order a batch goes through them.
+PHASE_ORDER = ["hot brewing", "ferm", "cond", "bottling", "finished"]
+# Instance variables of Batch holding the end datetime of each phase.
+PHASE_END_FIELDS = {"hot brewing": "time_end_phase1",
+                    "ferm": "time_end_phase2",
+                    "cond": "time_end_phase3",
+                    "bottling": "time_end_phase4"}
+
+def get_next_phase(phase: str) -> str:
+    """Gets the phase that follows phase
+
+    Args:
+        phase (str): A string representing the production phase
+
+    Returns:
+        (str): A string representing the next phase; "" if there is none
+    """
+    if phase not in PHASE_ORDER[:-1]:
+        return ""
+    return PHASE_ORDER[PHASE_ORDER.index(phase) + 1]
+
+def get_phase_end(batch: object) -> Optional[datetime]:
+    """Gets the end datetime of the batch's current phase
+
+    Args:
+        batch (Batch): An instance of class Batch
+
+    Returns:
+        (datetime): The end of the current phase; None if the batch isn't in
+            a phase with an end, e.g. if it's finished
+    """
+    field = PHASE_END_FIELDS.get(batch.phase_current)
+    phase_end = getattr(batch, field, "") if field is not None else ""
+    # End datetimes are initialised as "" until the phase is started.
+    return phase_end if isinstance(phase_end, datetime) else None
+
+class PhaseDeadlineScheduler:
+    """Calls back when the current phase of a batch reaches its end time
+
+    Attributes:
+        on_deadline (Callable): Function called with batch ID and phase when
+            the phase ends; returns False if the batch has to wait for a tank
+        clock (Callable): Function returning the current datetime
+        max_wait_seconds (float): A float representing the longest time the
+            thread waits at once, so that changes of the clock are noticed
+        heap (list): A list representing a min-heap of (deadline, sequence
+            number, batch ID, phase); may contain outdated entries
+        deadlines (dict): A dict mapping batch IDs to their valid deadline
+            and phase
+        waiting (OrderedDict): An OrderedDict mapping IDs of batches whose
+            deadline has passed but that couldn't advance to their phase,
+            in the order their deadlines were reached
+        sequence (itertools.count): Numbers heap entries, so that entries
+            with equal deadlines are popped in order of scheduling
+        condition (threading.Condition): Condition the thread waits on
+        retry_requested (bool): A bool stating if waiting batches should
+            retry to advance
+        thread (threading.Thread): The scheduler thread; None if not started
+        stopped (bool): A bool stating if the thread was asked to stop
+    """
+    def __init__(self, on_deadline: Callable[[str, str], bool],
+                 clock: Callable[[], datetime] = datetime.now,
+                 max_wait_seconds: float = 3600) -> None:
+        """Initialises all instance variables of PhaseDeadlineScheduler
+
+        Args:
+            on_deadline (Callable): Function called with batch ID and phase
+                when the phase ends; returns False if the batch has to wait
+            clock (Callable): Function returning the current datetime
+            max_wait_seconds (float): A float representing the longest time
+                the thread waits at once
+
+        Returns:
+            No returns
+        """
+        self.on_deadline = on_deadline
+        self.clock = clock
+        self.max_wait_seconds = max_wait_seconds
+        self.heap = []
+        self.deadlines = {}
+        self.waiting = OrderedDict()
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.retry_requested = False
+        self.thread = None
+        self.stopped = False
+
+    def schedule(self, batch: object) -> None:
+        """Schedules the end of the batch's current phase
+
+        Replaces the batch's previous deadline, e.g. after its phase changed.
+
+        Args:
+            batch (Batch): An instance of class Batch
+
+        Returns:
+            No returns
+        """
+        phase_end = get_phase_end(batch)
+        with self.condition:
+            self.waiting.pop(batch.id, None)
+            if phase_end is None:
+                self.deadlines.pop(batch.id, None)
+                return
+            self.deadlines[batch.id] = (phase_end, batch.phase_current)
+            # Previous entry of batch stays in heap and is skipped when popped.
+            heapq.heappush(self.heap, (phase_end, next(self.sequence),
+                                       batch.id, batch.phase_current))
+            self.compact()
+            # Wakes thread only if it waits for a later deadline.
+            if self.heap[0][2] == batch.id:
+                self.condition.notify()
+
+    def unschedule(self, batch_id: str) -> None:
+        """Removes the deadline of a batch, e.g. when the batch is deleted
+
+        Args:
+            batch_id (str): A string representing the batch ID
+
+        Returns:
+            No returns
+        """
+        with self.condition:
+            # Heap entry becomes outdated; it's skipped when popped.
+            self.deadlines.pop(batch_id, None)
+            self.waiting.pop(batch_id, None)
+
+    def rebuild(self, batches: Dict[str, object]) -> None:
+        """Rebuilds heap from batches, e.g. after loading the program state
+
+        Args:
+            batches (dict): A dictionary representing all batches
+
+        Returns:
+            No returns
+        """
+        with self.condition:
+            self.deadlines = {}
+            self.waiting = OrderedDict()
+            for batch in batches.values():
+                phase_end = get_phase_end(batch)
+                if phase_end is not None:
+                    self.deadlines[batch.id] = (phase_end,
+                                                batch.phase_current)
+            self.heap = [(deadline, next(self.sequence), batch_id, phase)
+                         for batch_id, (deadline, phase)
+                         in self.deadlines.items()]
+            # Building the heap at once is O(n) instead of O(n log n).
+            heapq.heapify(self.heap)
+            self.condition.notify()
+
+    def compact(self) -> None:
+        """Drops outdated heap entries once they outnumber the valid ones
+
+        Is called with the condition held.
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [entry for entry in self.heap
+                         if self.deadlines.get(entry[2]) == (entry[0],
+                                                             entry[3])]
+            heapq.heapify(self.heap)
+
+    def get_next_deadline(self) -> Optional[datetime]:
+        """Gets the earliest valid deadline, dropping outdated heap entries
+
+        Is called with the condition held.
+
+        Args:
+            No arguments
+
+        Returns:
+            (datetime): The earliest deadline; None if nothing is scheduled
+        """
+        while self.heap:
+            deadline, _, batch_id, phase = self.heap[0]
+            if self.deadlines.get(batch_id) == (deadline, phase):
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self) -> List[Tuple[str, str]]:
+        """Removes and returns all deadlines that were reached
+
+        Is called with the condition held.
+
+        Args:
+            No arguments
+
+        Returns:
+            (list): A list of tuples (batch ID, phase), earliest first
+        """
+        now = self.clock()
+        due = []
+        while True:
+            deadline = self.get_next_deadline()
+            if deadline is None or deadline > now:
+                return due
+            _, _, batch_id, phase = heapq.heappop(self.heap)
+            del self.deadlines[batch_id]
+            due.append((batch_id, phase))
+
+    def release_waiting(self) -> None:
+        """Lets waiting batches retry to advance, e.g. after a tank was freed
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        with self.condition:
+            if self.waiting:
+                self.retry_requested = True
+                self.condition.notify()
+
+    def run_pending(self, retry_waiting: bool = True) -> int:
+        """Calls back for all reached deadlines and, optionally, waiting ones
+
+        Args:
+            retry_waiting (bool): Bool where True also retries batches that
+                are waiting for a tank
+
+        Returns:
+            (int): An int representing the number of batches called back for
+        """
+        with self.condition:
+            due = list(self.waiting.items()) if retry_waiting else []
+            self.waiting = OrderedDict() if retry_waiting else self.waiting
+            due.extend(self.pop_due())
+        # Callback runs without the condition held, as it may reschedule.
+        for batch_id, phase in due:
+            try:
+                advanced = self.on_deadline(batch_id, phase)
+            # An error must not stop the scheduler thread.
+            except Exception as error: # pylint: disable=broad-except
+                logging.error("Deadline of batch %s failed: %s", batch_id,
+                              error)
+                continue
+            if not advanced:
+                with self.condition:
+                    # Batch may have been rescheduled by a manual change.
+                    if batch_id not in self.deadlines:
+                        self.waiting[batch_id] = phase
+        return len(due)
+
+    def run(self) -> None:
+        """Waits for each deadline and calls back (in scheduler thread)
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                deadline = self.get_next_deadline()
+                timeout = self.max_wait_seconds
+                if deadline is not None:
+                    timeout = min(timeout, (deadline
+                                            - self.clock()).total_seconds())
+                # Sleeps until the deadline, an earlier deadline is scheduled,
+                # a tank is released, or the thread is stopped.
+                if timeout > 0 and not self.retry_requested:
+                    self.condition.wait(timeout)
+                if self.stopped:
+                    return
+                retry_waiting = self.retry_requested
+                self.retry_requested = False
+            self.run_pending(retry_waiting)
+
+    def start(self) -> threading.Thread:
+        """Starts the scheduler thread
+
+        Args:
+            No arguments
+
+        Returns:
+            (threading.Thread): The started scheduler thread
+        """
+        with self.condition:
+            self.stopped = False
+        self.thread = threading.Thread(target=self.run,
+                                       name="phase-scheduler", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self) -> None:
+        """Stops the scheduler thread and waits for it to finish
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
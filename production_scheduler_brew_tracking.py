@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a rolling-horizon production scheduler that plans many future batches
+at once, instead of only recommending the next beer type and tank. Every
+planned batch is assigned a fermenter, a conditioner (the same tank if it can
+condition), and a slot on the single bottling line, with the phase durations of
+Batch and the capabilities and volumes of Tanks. Batches are planned greedily:
+the beer type whose forecast shortfall starts earliest (and is largest) is
+planned next, on the fermenter that lets the batch finish first. Beer types
+are kept in a heap ordered by their shortfall; fermenters are kept in a heap
+ordered by the time they become free, so the search for the fermenter stops
+as soon as no later fermenter can finish the batch earlier. A tank's heap
+entry that became outdated, because the tank was planned meanwhile, is
+skipped when popped. Tanks that are reserved in the TankCalendar aren't planned
+while they are reserved. The plan is recomputed from the current state whenever
+it's requested, so it always starts from the batches that are in production.
+"""
+from bisect import bisect_right
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import heapq
+import numpy as np
+from data_structure_brew_tracking import COND_HOURS
+from data_structure_brew_tracking import FERM_HOURS
+from data_structure_brew_tracking import HOT_BREWING_HOURS
+from data_structure_brew_tracking import PhaseRegistry
+from data_structure_brew_tracking import TankCalendar
+from data_structure_brew_tracking import Tanks
+from data_structure_brew_tracking import get_bottling_hours
+from completion_projection_brew_tracking import IN_FLIGHT_PHASES
+from completion_projection_brew_tracking import collect_in_flight_batches
+from completion_projection_brew_tracking import get_month_starts
+
+def find_in_flight_tank(tanks: Tanks,
+                        tank_free_at: Dict[str, Optional[datetime]],
+                        capability: str, volume: float,
+                        not_before: datetime
+                        ) -> Tuple[Optional[str], datetime]:
+    """Finds tank that can take a batch in production first
+
+    Args:
+        tanks (Tanks): An instance of class Tanks representing the tanks
+        tank_free_at (dict): A dict mapping tank names to the datetime they
+            become free; None if it isn't known yet
+        capability (str): A string representing the phase, "ferm" or "cond"
+        volume (float): A float representing the volume of batch in litres
+        not_before (datetime): The datetime the batch needs the tank from
+
+    Returns:
+        (tuple): A string representing the tank name (None if no tank can
+            take the batch) and the datetime the batch moves into the tank
+    """
+    # Smallest tank is taken if several tanks are free at the same time.
+    candidates = [
+        (max(free_at, not_before), tanks.get_tank_value(tank_name)["volume"],
+         tank_name)
+        for tank_name, free_at in tank_free_at.items()
+        if free_at is not None
+        and capability in tanks.get_tank_value(tank_name)["capability"]
+        and tanks.get_tank_value(tank_name)["volume"] >= volume]
+    if not candidates:
+        return None, not_before
+    start, _, tank_name = min(candidates)
+    return tank_name, start
+
+def get_in_flight_schedule(phases: PhaseRegistry, tanks: Tanks,
+                           now: datetime) -> Dict[str, Any]:
+    """Estimates when batches in production free their tanks and finish
+
+    Assumes that every batch goes to its next phase as soon as a tank is
+    free, with the batch's own phase durations; phases that should have
+    ended already are assumed to end now. Batches in hot brewing are given
+    the fermenter, and batches in a tank that can't condition the
+    conditioner, that is free first; tanks are handed out in the order in
+    which the batches need them.
+
+    Args:
+        phases (PhaseRegistry): An instance of class PhaseRegistry
+        tanks (Tanks): An instance of class Tanks representing the tanks
+        now (datetime): The current datetime
+
+    Returns:
+        (dict): A dict with "tank_free_at" (dict mapping tanks used by
+            batches in production to the datetime they become free),
+            "bottling_free_at" (datetime the bottling line becomes free), and
+            "finishing" (list of tuples (datetime, beer type, bottles) of all
+            unfinished batches)
+    """
+    in_flight = collect_in_flight_batches(phases)
+    batches = in_flight["batches"]
+    phase_index = in_flight["phase"].tolist()
+    phase_end = np.maximum(in_flight["phase_end"],
+                           np.datetime64(now, "us")).tolist()
+    bottling = in_flight["bottling"].tolist()
+    # Tanks that no batch in production holds are free from now on.
+    tank_free_at = {tank_name: now for tank_name in tanks.get_tank_names()}
+    used_tanks = set()
+    # Tank each batch is in while it waits for its next tank.
+    holding = {}
+    # Datetime each batch's conditioning ends; None for batches in bottling.
+    cond_end = [None] * len(batches)
+    # Min-heap of (datetime, batch index, phase) of batches needing a tank.
+    requests = []
+    for index, batch in enumerate(batches):
+        phase = IN_FLIGHT_PHASES[phase_index[index]]
+        tank_name = batch.phase_current_tank
+        if phase == "bottling":
+            continue
+        if phase == "hot brewing":
+            heapq.heappush(requests, (phase_end[index], index, "ferm"))
+            continue
+        if phase == "cond":
+            cond_end[index] = phase_end[index]
+        # Batch conditions in its tank if the tank can condition.
+        elif (tank_name not in tank_free_at or "cond"
+              in tanks.get_tank_value(tank_name)["capability"]):
+            cond_end[index] = (phase_end[index]
+                               + timedelta(hours=batch.duration_phase3))
+        # Else tank is freed once the batch got a conditioner.
+        else:
+            heapq.heappush(requests, (phase_end[index], index, "cond"))
+            holding[index] = tank_name
+            tank_free_at[tank_name] = None
+            used_tanks.add(tank_name)
+            continue
+        if tank_name in tank_free_at:
+            tank_free_at[tank_name] = cond_end[index]
+            used_tanks.add(tank_name)
+    while requests:
+        needed_at, index, phase = heapq.heappop(requests)
+        batch = batches[index]
+        tank_name, start = find_in_flight_tank(tanks, tank_free_at, phase,
+                                               batch.volume, needed_at)
+        if tank_name is not None:
+            used_tanks.add(tank_name)
+        if phase == "ferm":
+            ferm_end = start + timedelta(hours=batch.duration_phase2)
+            # Batch conditions in its fermenter if no tank or the fermenter
+            # can condition.
+            if tank_name is None or "cond" in tanks.get_tank_value(
+                    tank_name)["capability"]:
+                cond_end[index] = (ferm_end
+                                   + timedelta(hours=batch.duration_phase3))
+                if tank_name is not None:
+                    tank_free_at[tank_name] = cond_end[index]
+            else:
+                heapq.heappush(requests, (ferm_end, index, "cond"))
+                holding[index] = tank_name
+                tank_free_at[tank_name] = None
+            continue
+        # Without conditioner, the batch conditions in its fermenter.
+        fermenter = holding.pop(index)
+        cond_end[index] = start + timedelta(hours=batch.duration_phase3)
+        tank_free_at[fermenter] = cond_end[index]
+        if tank_name is not None:
+            tank_free_at[fermenter] = start
+            tank_free_at[tank_name] = cond_end[index]
+    # Batches are bottled one after the other in order of cond end; batches
+    # that are bottled already keep their bottling start.
+    bottling_order = sorted(
+        range(len(batches)),
+        key=lambda index: (phase_end[index] - bottling[index]
+                           if cond_end[index] is None else cond_end[index]))
+    bottling_free_at = now
+    finishing = []
+    for index in bottling_order:
+        if cond_end[index] is None:
+            bottling_end = phase_end[index]
+        else:
+            bottling_start = max(cond_end[index], bottling_free_at)
+            bottling_end = bottling_start + bottling[index]
+        bottling_free_at = max(bottling_free_at, bottling_end)
+        batch = batches[index]
+        finishing.append((bottling_end, batch.beer_type, batch.volume * 2))
+    return {"tank_free_at": {tank_name: tank_free_at[tank_name]
+                             for tank_name in used_tanks},
+            "bottling_free_at": bottling_free_at, "finishing": finishing}
+
+def get_shortfall(demand: List[float], supply: List[float]
+                  ) -> Tuple[Optional[int], float, List[float]]:
+    """Calculates the shortfall of supply against demand at each month end
+
+    Args:
+        demand (list): A list representing bottles sold in each month
+        supply (list): A list representing bottles finished in each month
+
+    Returns:
+        (tuple): An int representing the index of the first month with a
+            shortfall (None if there is none), a float representing the sum
+            of the shortfalls at all month ends, and a list representing the
+            shortfall at each month end
+    """
+    cumulative_demand = 0
+    cumulative_supply = 0
+    first_short_month = None
+    shortfalls = []
+    for month, (sold, finished) in enumerate(zip(demand, supply)):
+        cumulative_demand += sold
+        cumulative_supply += finished
+        shortfall = max(cumulative_demand - cumulative_supply, 0)
+        if shortfall > 0 and first_short_month is None:
+            first_short_month = month
+        shortfalls.append(shortfall)
+    return first_short_month, sum(shortfalls), shortfalls
+
+class ProductionScheduler:
+    """Plans future batches on fermenters, conditioners, and bottling line
+
+    Attributes:
+        tanks (Tanks): An instance of class Tanks representing the tanks
+        start (datetime): The datetime the plan starts at
+        end (datetime): The datetime the planning horizon ends at
+        month_starts (list): A list of datetimes representing the first days
+            of the months in the horizon
+        tank_free_at (dict): A dict mapping tank names to the datetime from
+            which they are free for the rest of the horizon
+        bottling_free_at (datetime): The datetime from which the bottling
+            line is free
+        fermenters (list): A list representing a min-heap of (free datetime,
+            negative volume, tank name) of all tanks that can ferment
+        conditioners (list): A list of names of tanks that can condition
+        calendar (TankCalendar): An instance of class TankCalendar holding
+            the tank reservations; None if no tank is reserved
+    """
+    def __init__(self, tanks: Tanks, start: datetime,
+                 horizon_weeks: int = 26,
+                 tank_free_at: Optional[Dict[str, datetime]] = None,
+                 bottling_free_at: Optional[datetime] = None,
+                 calendar: Optional[TankCalendar] = None) -> None:
+        """Initialises all instance variables of ProductionScheduler
+
+        Args:
+            tanks (Tanks): An instance of class Tanks representing the tanks
+            start (datetime): The datetime the plan starts at
+            horizon_weeks (int): An int representing num of weeks planned
+            tank_free_at (dict): A dict mapping occupied tanks to the datetime
+                they become free; tanks that aren't in it are free at start
+            bottling_free_at (datetime): The datetime the bottling line
+                becomes free; None if it is free at start
+            calendar (TankCalendar): An instance of class TankCalendar
+                holding the tank reservations; None if no tank is reserved
+
+        Returns:
+            No returns
+        """
+        self.tanks = tanks
+        self.start = start
+        self.end = start + timedelta(weeks=horizon_weeks)
+        # Number of calendar months from start's to end's month.
+        num_months = ((self.end.year - start.year) * 12
+                      + self.end.month - start.month + 1)
+        self.month_starts = get_month_starts(start, num_months)
+        self.tank_free_at = {tank_name: start for tank_name
+                             in tanks.get_tank_names()}
+        for tank_name, free_at in (tank_free_at or {}).items():
+            if tank_name in self.tank_free_at:
+                self.tank_free_at[tank_name] = max(free_at, start)
+        self.bottling_free_at = max(bottling_free_at or start, start)
+        self.calendar = calendar
+        # Larger fermenters are preferred if they are free at the same time.
+        self.fermenters = [
+            (free_at, -tanks.get_tank_value(tank_name)["volume"], tank_name)
+            for tank_name, free_at in self.tank_free_at.items()
+            if "ferm" in tanks.get_tank_value(tank_name)["capability"]]
+        heapq.heapify(self.fermenters)
+        self.conditioners = [tank_name for tank_name in self.tank_free_at
+                             if "cond" in tanks.get_tank_value(tank_name)[
+                                 "capability"]]
+
+    def get_month_index(self, when: datetime) -> int:
+        """Gets index of the month in the horizon that when falls into
+
+        Args:
+            when (datetime): A datetime in the horizon
+
+        Returns:
+            (int): An int representing the index of the month
+        """
+        return max(bisect_right(self.month_starts, when) - 1, 0)
+
+    def get_supply(self, inventory: Dict[str, int],
+                   finishing: List[Tuple[datetime, str, int]],
+                   beer_types: List[str]) -> Dict[str, List[float]]:
+        """Bins inventory and bottles of batches in production into months
+
+        Args:
+            inventory (dict): A dict mapping beer types to bottles in stock
+            finishing (list): A list of tuples (datetime, beer type, bottles)
+                of batches that are in production
+            beer_types (list): A list representing the beer types to plan
+
+        Returns:
+            (dict): A dict mapping beer types to lists of bottles finished
+                in each month; stock counts for the first month
+        """
+        supply = {beer_type: [0.0] * len(self.month_starts)
+                  for beer_type in beer_types}
+        for beer_type in beer_types:
+            supply[beer_type][0] += inventory.get(beer_type, 0)
+        for finish, beer_type, bottles in finishing:
+            if beer_type in supply and finish < self.end:
+                supply[beer_type][self.get_month_index(finish)] += bottles
+        return supply
+
+    def get_free_slot(self, tank_name: str, hours: float,
+                      not_before: datetime) -> datetime:
+        """Gets earliest start of a period in which tank isn't reserved
+
+        Args:
+            tank_name (str): A string representing the tank name
+            hours (float): A float representing the duration of the period
+            not_before (datetime): The earliest possible start
+
+        Returns:
+            (datetime): The earliest start of a period without reservation
+        """
+        if self.calendar is None:
+            return not_before
+        return self.calendar.get_earliest_free_slot(
+            tank_name, timedelta(hours=hours), not_before)
+
+    def get_reserved_until(self, planned_batch: Dict[str, Any]
+                           ) -> Optional[datetime]:
+        """Gets end of the last reservation that overlaps the batch's tanks
+
+        Args:
+            planned_batch (dict): A dict representing the planned batch
+
+        Returns:
+            (datetime): The end of the last overlapping reservation; None if
+                the tanks aren't reserved while the batch is in them
+        """
+        if self.calendar is None:
+            return None
+        fermenter = planned_batch["fermenter"]
+        conditioner = planned_batch["conditioner"]
+        # Batch is in its fermenter until it moves to its conditioner, and
+        # in its conditioner until it's bottled.
+        stays = [(conditioner, planned_batch["cond_start"],
+                  planned_batch["bottling_start"])]
+        if fermenter == conditioner:
+            stays = [(fermenter, planned_batch["ferm_start"],
+                      planned_batch["bottling_start"])]
+        else:
+            stays.append((fermenter, planned_batch["ferm_start"],
+                          planned_batch["cond_start"]))
+        reserved_until = None
+        for tank_name, stay_start, stay_end in stays:
+            for reservation in self.calendar.get_conflicts(
+                    tank_name, stay_start, stay_end):
+                if reserved_until is None or (reservation["end"]
+                                              > reserved_until):
+                    reserved_until = reservation["end"]
+        return reserved_until
+
+    def plan_batch(self, fermenter: str, free_at: datetime
+                   ) -> Optional[Dict[str, Any]]:
+        """Plans the phases of a batch that ferments in fermenter
+
+        If a reservation overlaps the batch's stay in its tanks, the batch
+        is planned again to start after the reservation; as the start only
+        moves forward, this ends after at most one try per reservation.
+
+        Args:
+            fermenter (str): A string representing the name of the fermenter
+            free_at (datetime): The datetime the fermenter becomes free
+
+        Returns:
+            (dict): A dict representing the planned batch; None if no
+                conditioner can take the batch
+        """
+        # Hot brewing finishes when the fermenter is free, but not before
+        # it could be done from the start of the plan.
+        ferm_start = max(free_at, self.start
+                         + timedelta(hours=HOT_BREWING_HOURS))
+        while True:
+            planned_batch = self.plan_phases(fermenter, ferm_start)
+            if planned_batch is None or planned_batch["finish"] >= self.end:
+                return planned_batch
+            reserved_until = self.get_reserved_until(planned_batch)
+            if reserved_until is None:
+                return planned_batch
+            ferm_start = max(ferm_start, reserved_until)
+
+    def plan_phases(self, fermenter: str, ferm_start: datetime
+                    ) -> Optional[Dict[str, Any]]:
+        """Plans the phases of a batch that ferments from ferm_start on
+
+        Args:
+            fermenter (str): A string representing the name of the fermenter
+            ferm_start (datetime): The earliest start of fermentation
+
+        Returns:
+            (dict): A dict representing the planned batch; None if no
+                conditioner can take the batch
+        """
+        volume = self.tanks.get_tank_value(fermenter)["volume"]
+        ferm_start = self.get_free_slot(fermenter, FERM_HOURS, ferm_start)
+        ferm_end = ferm_start + timedelta(hours=FERM_HOURS)
+        conditioner = fermenter
+        cond_start = ferm_end
+        # Batch moves to the conditioner that is free first, if its
+        # fermenter can't condition; it waits in the fermenter meanwhile.
+        if fermenter not in self.conditioners:
+            candidates = [
+                (self.get_free_slot(tank_name, COND_HOURS,
+                                    max(self.tank_free_at[tank_name],
+                                        ferm_end)), tank_name)
+                for tank_name in self.conditioners
+                if self.tanks.get_tank_value(tank_name)["volume"] >= volume]
+            if not candidates:
+                return None
+            cond_start, conditioner = min(candidates)
+        cond_end = cond_start + timedelta(hours=COND_HOURS)
+        # Batch waits in its conditioner until the bottling line is free.
+        bottling_start = max(cond_end, self.bottling_free_at)
+        finish = bottling_start + timedelta(hours=get_bottling_hours(volume))
+        return {"volume": volume, "bottles": volume * 2,
+                "brew_start": ferm_start
+                              - timedelta(hours=HOT_BREWING_HOURS),
+                "fermenter": fermenter, "ferm_start": ferm_start,
+                "conditioner": conditioner, "cond_start": cond_start,
+                "bottling_start": bottling_start, "finish": finish}
+
+    def find_earliest_batch(self) -> Optional[Dict[str, Any]]:
+        """Finds the fermenter on which a new batch would finish first
+
+        Fermenters are popped from the heap in order of the time they become
+        free; the search stops once a fermenter becomes free so late that it
+        can't finish a batch earlier than the best one found.
+
+        Args:
+            No arguments
+
+        Returns:
+            (dict): A dict representing the planned batch; None if no batch
+                can finish within the horizon
+        """
+        best = None
+        popped = []
+        min_duration = timedelta(hours=FERM_HOURS + COND_HOURS)
+        while self.fermenters:
+            entry = heapq.heappop(self.fermenters)
+            free_at, _, tank_name = entry
+            # Entry is outdated if the tank was planned since it was pushed;
+            # the tank's valid entry was pushed when it was planned.
+            if free_at != self.tank_free_at[tank_name]:
+                continue
+            popped.append(entry)
+            if best is not None and free_at + min_duration >= best["finish"]:
+                break
+            planned_batch = self.plan_batch(tank_name, free_at)
+            if planned_batch is not None and (
+                    best is None or planned_batch["finish"] < best["finish"]):
+                best = planned_batch
+        for entry in popped:
+            heapq.heappush(self.fermenters, entry)
+        if best is None or best["finish"] >= self.end:
+            return None
+        return best
+
+    def commit_batch(self, planned_batch: Dict[str, Any]) -> None:
+        """Reserves the tanks and bottling line for a planned batch
+
+        Args:
+            planned_batch (dict): A dict representing the planned batch
+
+        Returns:
+            No returns
+        """
+        fermenter = planned_batch["fermenter"]
+        conditioner = planned_batch["conditioner"]
+        # Fermenter is free once the batch moved to its conditioner; the
+        # conditioner once the batch is bottled.
+        self.tank_free_at[fermenter] = planned_batch["cond_start"]
+        self.tank_free_at[conditioner] = planned_batch["bottling_start"]
+        self.bottling_free_at = planned_batch["finish"]
+        # Previous entries of both tanks become outdated and are skipped.
+        for tank_name in {fermenter, conditioner}:
+            if "ferm" in self.tanks.get_tank_value(tank_name)["capability"]:
+                heapq.heappush(self.fermenters, (
+                    self.tank_free_at[tank_name],
+                    -self.tanks.get_tank_value(tank_name)["volume"],
+                    tank_name))
+
+    def plan(self, demand: Dict[str, List[float]],
+             supply: Dict[str, List[float]]) -> Dict[str, Any]:
+        """Plans batches until no shortfall can be reduced within the horizon
+
+        Args:
+            demand (dict): A dict mapping beer types to lists of bottles sold
+                in each month of the horizon
+            supply (dict): A dict mapping beer types to lists of bottles
+                finished in each month without new batches; is updated
+
+        Returns:
+            (dict): A dict with "batches" (list of dicts representing the
+                planned batches in order of brew start), "shortfall_before"
+                and "shortfall_after" (dicts mapping beer types to lists of
+                the shortfall at each month end)
+        """
+        shortfall_before = {beer_type: get_shortfall(demand[beer_type],
+                                                     supply[beer_type])[2]
+                            for beer_type in demand}
+        # Beer types whose shortfall starts first are planned first.
+        beer_heap = []
+        for beer_type in demand:
+            first_month, total, _ = get_shortfall(demand[beer_type],
+                                                  supply[beer_type])
+            if first_month is not None:
+                beer_heap.append((first_month, -total, beer_type))
+        heapq.heapify(beer_heap)
+        batches = []
+        while beer_heap:
+            planned_batch = self.find_earliest_batch()
+            # No batch can finish within the horizon anymore.
+            if planned_batch is None:
+                break
+            _, _, beer_type = heapq.heappop(beer_heap)
+            finish_month = self.get_month_index(planned_batch["finish"])
+            shortfalls = get_shortfall(demand[beer_type],
+                                       supply[beer_type])[2]
+            # Batch is useless for this beer if it finishes after the last
+            # month with a shortfall.
+            if not any(shortfalls[finish_month:]):
+                continue
+            self.commit_batch(planned_batch)
+            planned_batch["beer_type"] = beer_type
+            batches.append(planned_batch)
+            supply[beer_type][finish_month] += planned_batch["bottles"]
+            first_month, total, _ = get_shortfall(demand[beer_type],
+                                                  supply[beer_type])
+            if first_month is not None:
+                heapq.heappush(beer_heap, (first_month, -total, beer_type))
+        shortfall_after = {beer_type: get_shortfall(demand[beer_type],
+                                                    supply[beer_type])[2]
+                           for beer_type in demand}
+        batches.sort(key=lambda planned_batch: planned_batch["brew_start"])
+        return {"batches": batches, "shortfall_before": shortfall_before,
+                "shortfall_after": shortfall_after}
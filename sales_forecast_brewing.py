@@ -16,13 +16,18 @@ https://people.duke.edu/~rnau/411arim.htm
 https://people.duke.edu/~rnau/411sdif.htm
 https://www.statsmodels.org/dev/examples/ and search for SARIMAX.
 """
+from io import BytesIO
 from typing import List
 from typing import Dict
 from typing import Tuple
+from typing import Optional
 import logging
+import numpy as np
 import pandas as pd
 from statsmodels.tsa.statespace.sarimax import SARIMAX
-import matplotlib.pyplot as pyplot
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 def load_csv_clean_to_dataframe(file_path: str) -> pd.DataFrame:
     """Loads a CSV file, removes missing values, and puts data into a dataframe
@@ -68,39 +73,119 @@ def convert_to_time_series(dataframe: pd.DataFrame) -> pd.DataFrame:
     dataframe.set_index("Date Required", inplace=True)
     return dataframe
 
-def average_data(dataframe: pd.DataFrame, column_to_avg: str,
-                 average_by: str) -> pd.Series:
-    """Calculates weekly or monthly averages of data in a dataframe
+def get_daily_partials(dataframe: pd.DataFrame, column: str,
+                       group_by: str = "Recipe") -> pd.DataFrame:
+    """Calculates daily sums and counts of a column for every group in one pass
+
+    Sums and counts can be added up for any longer period, so weekly and
+    monthly means and sums are calculated from them without rescanning rows.
 
     Args:
-        dataframe (pd.DataFrame): Pandas dataframe with data to be averaged
-        column_to_avg (str): A string representing the column to average
-        average_by (str): Represen. whether monthly or weekly avg is calculated
+        dataframe (pd.DataFrame): Pandas dataframe with dates as index
+        column (str): A string representing the column to aggregate
+        group_by (str): A string representing the column to group by
 
     Returns:
-        averaged_data (pd.Series): A pd.Series representing averaged data
+        (pd.DataFrame): A dataframe with columns "sum" and "count", indexed
+            by day and group
     """
-    averaged_data = dataframe[column_to_avg].resample(average_by).mean()
-    return averaged_data
+    grouped = dataframe[column].groupby([dataframe.index.floor("D"),
+                                         dataframe[group_by]])
+    partials = grouped.agg(["sum", "count"])
+    partials.index.names = ["date", group_by]
+    return partials
 
-def sum_data(dataframe: pd.DataFrame, column_to_sum: str,
-             sum_by: str) -> pd.Series:
-    """Calculates weekly or monthly sums of data in a dataframe
+def aggregate_daily_partials(partials: pd.DataFrame) -> Dict[str, object]:
+    """Calculates weekly and monthly means and monthly sums of every group
 
     Args:
-        dataframe (pd.DataFrame): Pandas dataframe with data to be summed
-        column_to_sum (str): A string representing the column to sum
-        sum_by (str): Representing whether monthly or weekly sum is calculated
+        partials (pd.DataFrame): A dataframe representing daily sums and
+            counts by group, as returned by get_daily_partials
 
     Returns:
-        summed_data (pd.Series): A pd.Series representing summed data
+        (dict): A dict with the pd.Series "weekly_means" and "monthly_means"
+            over all groups and the dict "monthly_sums" mapping every group
+            to a pd.Series of its monthly sums
     """
-    summed_data = dataframe[column_to_sum].resample(sum_by).sum()
-    return summed_data
+    # Sums and counts of all groups per day; groups are the 2nd index level.
+    daily = partials.groupby(level=0).sum()
+    daily.index = pd.DatetimeIndex(daily.index)
+    aggregates = {}
+    for period, key in (("W", "weekly_means"), ("MS", "monthly_means")):
+        period_totals = daily.resample(period).sum()
+        # Periods without any rows have count 0 and thus a NaN mean.
+        aggregates[key] = (period_totals["sum"]
+                           / period_totals["count"].replace(0, float("nan")))
+    # Columns are groups, rows are days; NaN means no rows of group on day.
+    daily_sums = partials["sum"].unstack(level=1)
+    daily_sums.index = pd.DatetimeIndex(daily_sums.index)
+    monthly_sums = daily_sums.resample("MS").sum(min_count=1)
+    aggregates["monthly_sums"] = {}
+    for group in monthly_sums.columns:
+        group_sums = monthly_sums[group]
+        # Series of a group only ranges from its first to its last month
+        # with rows; months without rows in between have a sum of 0.
+        group_sums = group_sums.loc[group_sums.first_valid_index():
+                                    group_sums.last_valid_index()]
+        group_sums = group_sums.fillna(0).rename(None)
+        group_sums.index.name = None
+        aggregates["monthly_sums"][group] = group_sums
+    return aggregates
+
+def load_csv_daily_partials(file_path: str, column: str,
+                            group_by: str = "Recipe",
+                            chunk_rows: int = 100000) -> pd.DataFrame:
+    """Loads CSV file in chunks and folds them into daily sums and counts
+
+    Only one chunk of rows is in memory at a time, so memory use is bounded
+    by chunk_rows and the number of days and groups, not by the file size.
+
+    Args:
+        file_path (str): A string representing the file path to the CSV file
+        column (str): A string representing the column to aggregate
+        group_by (str): A string representing the column to group by
+        chunk_rows (int): An int representing number of rows read at once
+
+    Returns:
+        partials (pd.DataFrame): A dataframe with columns "sum" and "count",
+            indexed by day and group, like get_daily_partials returns
+
+    Raises:
+        FileNotFoundError: If the CSV file doesn't exist
+        KeyError: If the column "Date Required" is missing in the data
+        ValueError: If the CSV file contains no rows
+    """
+    partials = None
+    number_rows_missing_data = 0
+    try:
+        chunks = pd.read_csv(file_path, sep=",", chunksize=chunk_rows)
+    # Raised if the file is empty, i.e. has not even a header.
+    except pd.errors.EmptyDataError as error:
+        raise ValueError("CSV file contains no rows") from error
+    for chunk in chunks:
+        # Counts missing data and removes rows with missing data.
+        number_rows_missing_data += chunk.isnull().values.ravel().sum()
+        chunk = convert_to_time_series(chunk.dropna())
+        chunk_partials = get_daily_partials(chunk, column, group_by)
+        # Adds up sums and counts of days that are in several chunks.
+        if partials is None:
+            partials = chunk_partials
+        else:
+            partials = pd.concat([partials, chunk_partials]).groupby(
+                level=[0, 1]).sum()
+    # True if the CSV file only contains a header (depending on the pandas
+    # version, it gives no chunk or an empty one) or only incomplete rows.
+    if partials is None or partials.empty:
+        raise ValueError("CSV file contains no rows")
+    data_drop_info = ("After loading the CSV file, {} row(s) were removed "
+                      + "due to missing "
+                      + "values!").format(number_rows_missing_data)
+    logging.info(data_drop_info)
+    return partials
 
 def define_and_fit_model(avgs_dataframe: pd.Series, display_fitting: bool,
-                         order: List[int],
-                         seas_ord: List[int]) -> object:
+                         order: List[int], seas_ord: List[int],
+                         maxiter: Optional[int] = None) -> object:
     """Defines and fits seasonal ARIMA model (time series model)
 
     Args:
@@ -108,6 +193,9 @@ def define_and_fit_model(avgs_dataframe: pd.Series, display_fitting: bool,
         display_fitting (bool): Bool where True displays model fitting process
         order (list): A list representing hyperparameters for the ARIMA model
         seas_ord (list): A list representing hpyerparam. for seasonal component
+        maxiter (int): An int representing max num of optimizer iterations,
+            after which fitting stops even if it hasn't converged; None uses
+            the default of statsmodels
 
     Returns:
         fitted_model (obj): An object respresenting the fitted ARIMA model.
@@ -115,41 +203,86 @@ def define_and_fit_model(avgs_dataframe: pd.Series, display_fitting: bool,
     # Defines model as seasonal ARIMA (time series with seasonal component).
     model = SARIMAX(avgs_dataframe, order=order, seasonal_order=seas_ord)
     # Fits model; False disables information about model fitting iterations.
-    fitted_model = model.fit(disp=display_fitting)
+    if maxiter is None:
+        fitted_model = model.fit(disp=display_fitting)
+    else:
+        fitted_model = model.fit(disp=display_fitting, maxiter=maxiter)
     return fitted_model
 
-def plot_sales_forecast(sales_forecast: object, past: Dict[str, pd.Series],
-                        plot_size: Tuple[int], beer_type: str) -> None:
-    """Plots actual and predicted number of bottles sold and saves plot
+def define_and_filter_model(avgs_dataframe: pd.Series, order: List[int],
+                            seas_ord: List[int],
+                            params: np.ndarray) -> object:
+    """Defines seasonal ARIMA model and applies already fitted parameters
+
+    Runs the Kalman filter once with the given parameters instead of
+    estimating them, which is much faster than fitting the model.
+
+    Args:
+        avgs_dataframe (pd.Series): A pd.Series representing averages
+        order (list): A list representing hyperparameters for the ARIMA model
+        seas_ord (list): A list representing hpyerparam. for seasonal component
+        params (np.ndarray): An array representing fitted model parameters
+
+    Returns:
+        fitted_model (obj): An object respresenting the fitted ARIMA model.
+    """
+    model = SARIMAX(avgs_dataframe, order=order, seasonal_order=seas_ord)
+    fitted_model = model.filter(params)
+    return fitted_model
+
+def plot_sales_forecast(sales_forecast: object, past: pd.Series,
+                        plot: Axes, beer_type: str) -> None:
+    """Plots actual and predicted number of bottles sold into axes
 
     Args:
         sales_forecast (obj): An object representing the sales forecast
-        past (dict): A dict representing acutal/past number of bottles sold
-        plot_size (tuple): A tuple representing the plot size
+        past (pd.Series): A pd.Series repres. actual/past num of bottles sold
+        plot (Axes): The matplotlib axes to plot into
         beer_type (str): A str representing the beer type
 
     Returns:
         No returns
     """
-    # Clears pyplot figure so that not every plot is drawn in the same figure;
-    # dunkers is plotted first, indicating that a new figure must be plotted.
-    if beer_type == "dunkers":
-        pyplot.clf()
-    # Sets label and size of figure.
+    # Sets labels of the lines.
     label = "Actual " + beer_type
     label_forecast = "Forecast " + beer_type
-    plot = past.plot(label=label, figsize=plot_size)
-    # Gets predicted values from saels_forecast object and plots data.
-    sales_forecast.predicted_mean.plot(ax=plot, label=label_forecast)
+    plot.plot(past.index, past.to_numpy(), label=label)
+    # Gets predicted values from sales_forecast object and plots data.
+    predicted_mean = sales_forecast.predicted_mean
+    plot.plot(predicted_mean.index, predicted_mean.to_numpy(),
+              label=label_forecast)
+
+def render_sales_forecasts(forecasts: Dict[str, object],
+                           past_by_beer: Dict[str, pd.Series],
+                           plot_size: Tuple[int],
+                           image_format: str = "png") -> bytes:
+    """Plots actual and predicted bottles sold of all beer types into image
+
+    Every call uses its own figure that isn't registered with pyplot and is
+    rendered by the non-interactive Agg backend, so concurrent calls don't
+    interfere and no window is opened.
+
+    Args:
+        forecasts (dict): A dict mapping beer types to their sales forecasts
+        past_by_beer (dict): A dict mapping beer types to pd.Series
+            representing actual/past number of bottles sold
+        plot_size (tuple): A tuple representing the plot size in inches
+        image_format (str): A string representing the format, "png" or "svg"
+
+    Returns:
+        (bytes): The rendered image
+    """
+    figure = Figure(figsize=plot_size)
+    FigureCanvasAgg(figure)
+    plot = figure.add_subplot()
+    for beer_type, sales_forecast in forecasts.items():
+        plot_sales_forecast(sales_forecast, past_by_beer[beer_type], plot,
+                            beer_type)
     # Labels the axes.
     plot.set_xlabel("Date")
     plot.set_ylabel("Quantity ordered")
     # Sets legend.
-    pyplot.legend()
-    try:
-        # Saves plotted figure to folder in which this module is located.
-        filename = "monthly_forecast_and_past.png"
-        pyplot.savefig(filename)
-    except (FileNotFoundError, PermissionError):
-        error_message = "File {} could not be accessed/found.".format(filename)
-        logging.error(error_message)
+    plot.legend()
+    image = BytesIO()
+    figure.savefig(image, format=image_format)
+    return image.getvalue()
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a SQLite-backed store for the state of the brewing process. Batches,
+customer orders, inventory counts, and tank reservations are kept in indexed
+tables of a local SQLite database in write-ahead logging (WAL) mode, so that
+the state can be queried without loading everything and can be read by several
+processes.
+The store accepts the same change records as the journal in
+persistence_brew_tracking (e.g. "add_batch", "dispatch_order"), thus the Flask
+endpoints keep working on the in-memory dicts and each change is written
+through to the database.
+"""
+from datetime import datetime
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+import sqlite3
+import threading
+from data_structure_brew_tracking import Batch
+from data_structure_brew_tracking import Inventory
+from data_structure_brew_tracking import Tanks
+from persistence_brew_tracking import BATCH_PHASE_FIELDS
+from persistence_brew_tracking import set_batch_phase_state
+
+# Instance variables of Batch that hold datetimes (or "" if phase not reached).
+BATCH_DATETIME_FIELDS = [field for field in BATCH_PHASE_FIELDS
+                         if field.startswith("time_")]
+
+CREATE_TABLES = """
+    CREATE TABLE IF NOT EXISTS batches (
+        id TEXT PRIMARY KEY, beer_type TEXT, volume INTEGER,
+        phase_current TEXT, phase_current_tank TEXT,
+        phase_last_completed TEXT,
+        time_start_phase1 TEXT, time_start_phase2 TEXT,
+        time_start_phase3 TEXT, time_start_phase4 TEXT,
+        time_end_phase1 TEXT, time_end_phase2 TEXT,
+        time_end_phase3 TEXT, time_end_phase4 TEXT,
+        bottles_put_in_inventory INTEGER, num_bottles_to_inv);
+    CREATE INDEX IF NOT EXISTS batches_phase ON batches (phase_current);
+    CREATE INDEX IF NOT EXISTS batches_tank ON batches (phase_current_tank);
+    CREATE TABLE IF NOT EXISTS orders (
+        invoice_number TEXT PRIMARY KEY, customer TEXT,
+        date_required TEXT, recipe TEXT, gyle_number TEXT,
+        quantity_ordered TEXT, dispatched TEXT);
+    CREATE INDEX IF NOT EXISTS orders_recipe
+        ON orders (recipe, date_required);
+    CREATE INDEX IF NOT EXISTS orders_dispatched
+        ON orders (dispatched, date_required);
+    CREATE INDEX IF NOT EXISTS orders_date_required
+        ON orders (date_required);
+    CREATE TABLE IF NOT EXISTS inventory (
+        beer_type TEXT PRIMARY KEY, num INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS reservations (
+        id TEXT PRIMARY KEY, tank TEXT, start TEXT, end TEXT, label TEXT);
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+"""
+# Statements are fixed strings with placeholders, so sqlite3 compiles each
+# of them once per connection and reuses the prepared statement.
+INSERT_BATCH = ("INSERT OR REPLACE INTO batches VALUES "
+                + "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+UPDATE_BATCH_PHASE = ("UPDATE batches SET "
+                      + ", ".join(["{} = ?".format(field)
+                                   for field in BATCH_PHASE_FIELDS])
+                      + " WHERE id = ?")
+DELETE_BATCH = "DELETE FROM batches WHERE id = ?"
+INSERT_ORDER = "INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)"
+DISPATCH_ORDER = ("UPDATE orders SET dispatched = 'dispatched' "
+                  + "WHERE invoice_number = ?")
+DELETE_ORDER = "DELETE FROM orders WHERE invoice_number = ?"
+SET_INVENTORY = ("INSERT OR REPLACE INTO inventory (beer_type, num) "
+                 + "VALUES (?, ?)")
+INSERT_RESERVATION = ("INSERT OR REPLACE INTO reservations "
+                      + "(id, tank, start, end, label) VALUES (?, ?, ?, ?, ?)")
+DELETE_RESERVATION = "DELETE FROM reservations WHERE id = ?"
+SET_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+GET_META = "SELECT value FROM meta WHERE key = ?"
+
+def to_db_datetime(value: Any) -> Optional[str]:
+    """Converts datetime of a batch to ISO string; "" (not set) to NULL
+
+    Args:
+        value (datetime or str): A datetime or "" if phase wasn't reached
+
+    Returns:
+        (str): A string representing the datetime in ISO format or None
+    """
+    if value == "":
+        return None
+    return value.isoformat()
+
+def from_db_datetime(value: Optional[str]) -> Any:
+    """Converts ISO string from the database back to datetime; NULL to ""
+
+    Args:
+        value (str): A string representing a datetime in ISO format or None
+
+    Returns:
+        (datetime or str): A datetime or "" if phase wasn't reached
+    """
+    if value is None:
+        return ""
+    return datetime.fromisoformat(value)
+
+def to_db_date(date_required: str) -> str:
+    """Converts date required (DD/MM/YYYY) into sortable format YYYY-MM-DD
+
+    Args:
+        date_required (str): A string representing date in format DD/MM/YYYY
+
+    Returns:
+        (str): A string representing the date in format YYYY-MM-DD
+    """
+    return datetime.strptime(date_required, "%d/%m/%Y").strftime("%Y-%m-%d")
+
+def from_db_date(date_required: str) -> str:
+    """Converts date required (YYYY-MM-DD) back into format DD/MM/YYYY
+
+    Args:
+        date_required (str): A string representing date in format YYYY-MM-DD
+
+    Returns:
+        (str): A string representing the date in format DD/MM/YYYY
+    """
+    return datetime.strptime(date_required, "%Y-%m-%d").strftime("%d/%m/%Y")
+
+class SqliteStateStore:
+    """Writes state changes through to a SQLite database and loads them back
+
+    Provides the same methods as StateJournal (append, rotate, discard_upto,
+    read_records, close), so it can be used in place of the journal. As the
+    tables always hold the current state, nothing has to be replayed or
+    compacted.
+
+    Attributes:
+        file_path (str): A string representing the path to the database file
+        connection (sqlite3.Connection): Connection to the database
+        last_seq (int): An int representing the number of written changes
+        num_records (int): Always 0, the store never needs to be compacted
+        lock (threading.Lock): Lock so that changes are written one by one
+    """
+    def __init__(self, file_path: str) -> None:
+        """Initialises all instance variables and creates tables and indexes
+
+        Args:
+            file_path (str): A string representing the path to database file
+
+        Returns:
+            No returns
+        """
+        self.file_path = file_path
+        self.num_records = 0
+        self.lock = threading.Lock()
+        # Flask serves requests in several threads; access is locked instead.
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        # WAL lets readers in other processes read while a change is written.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(CREATE_TABLES)
+        row = self.connection.execute(GET_META, ("last_seq",)).fetchone()
+        self.last_seq = 0 if row is None else row[0]
+
+    def is_empty(self) -> bool:
+        """Checks whether no change has been written to the database yet
+
+        Args:
+            No arguments
+
+        Returns:
+            (bool): Bool where True means that the database holds no state
+        """
+        row = self.connection.execute(GET_META, ("last_seq",)).fetchone()
+        return row is None
+
+    def append(self, kind: str, payload: Any) -> int:
+        """Writes one change to the database in a single transaction
+
+        Args:
+            kind (str): A string representing the kind of change
+            payload (Any): The data describing the change
+
+        Returns:
+            (int): An int representing the sequence number of the change
+        """
+        with self.lock, self.connection:
+            connection = self.connection
+            if kind == "add_batch":
+                batch_row = [payload["id"], payload["beer_type"],
+                             payload["volume"], "", "", ""]
+                batch_row.extend([None] * len(BATCH_DATETIME_FIELDS))
+                batch_row.extend([0, ""])
+                connection.execute(INSERT_BATCH, batch_row)
+            elif kind == "delete_batch":
+                connection.execute(DELETE_BATCH, (payload,))
+            elif kind == "change_phase":
+                phase_state = payload["phase_state"]
+                values = [to_db_datetime(phase_state[field])
+                          if field in BATCH_DATETIME_FIELDS
+                          else phase_state[field]
+                          for field in BATCH_PHASE_FIELDS]
+                values.append(payload["id"])
+                connection.execute(UPDATE_BATCH_PHASE, values)
+            elif kind == "register_order":
+                connection.execute(INSERT_ORDER,
+                                   (payload["invoice number"],
+                                    payload["customer"],
+                                    to_db_date(payload["date required"]),
+                                    payload["recipe"], payload["gyle number"],
+                                    payload["quantity ordered"],
+                                    payload["dispatched"]))
+            elif kind == "dispatch_order":
+                connection.execute(DISPATCH_ORDER, (payload,))
+            elif kind == "delete_order":
+                connection.execute(DELETE_ORDER, (payload,))
+            elif kind == "inventory":
+                connection.execute(SET_INVENTORY,
+                                   (payload["beer_type"], payload["num"]))
+            elif kind == "reserve_tank":
+                connection.execute(INSERT_RESERVATION,
+                                   (payload["id"], payload["tank"],
+                                    to_db_datetime(payload["start"]),
+                                    to_db_datetime(payload["end"]),
+                                    payload["label"]))
+            elif kind == "cancel_reservation":
+                connection.execute(DELETE_RESERVATION, (payload,))
+            self.last_seq += 1
+            connection.execute(SET_META, ("last_seq", self.last_seq))
+            return self.last_seq
+
+    def import_program_state(self, program_state: Dict[str, Any]) -> None:
+        """Writes an entire program state, e.g. from an existing pickle file
+
+        Args:
+            program_state (dict): A dict representing the state of the program
+
+        Returns:
+            No returns
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM batches")
+            self.connection.execute("DELETE FROM orders")
+            self.connection.execute("DELETE FROM inventory")
+            self.connection.execute("DELETE FROM reservations")
+            for batch in program_state["batches"].values():
+                batch_row = [batch.id, batch.beer_type, batch.volume]
+                batch_row.extend([to_db_datetime(getattr(batch, field))
+                                  if field in BATCH_DATETIME_FIELDS
+                                  else getattr(batch, field)
+                                  for field in BATCH_PHASE_FIELDS])
+                self.connection.execute(INSERT_BATCH, batch_row)
+            for order in program_state["orders"].values():
+                self.connection.execute(
+                    INSERT_ORDER,
+                    (order["invoice number"], order["customer"],
+                     to_db_date(order["date required"]), order["recipe"],
+                     order["gyle number"], order["quantity ordered"],
+                     order["dispatched"]))
+            inventory = program_state["inventory"]
+            for beer_type in inventory.get_inv_items_names():
+                self.connection.execute(
+                    SET_INVENTORY,
+                    (beer_type,
+                     inventory.get_inv_items_quantity(beer_type)["num"]))
+            for reservation in program_state.get("reservations",
+                                                 {}).values():
+                self.connection.execute(
+                    INSERT_RESERVATION,
+                    (reservation["id"], reservation["tank"],
+                     to_db_datetime(reservation["start"]),
+                     to_db_datetime(reservation["end"]),
+                     reservation["label"]))
+            self.connection.execute(SET_META, ("last_seq", self.last_seq))
+
+    def load_program_state(self, tanks: Tanks) -> Dict[str, Any]:
+        """Loads batches, orders, inventory, and reservations from database
+
+        Args:
+            tanks (Tanks): An instance of class Tanks for the batches' handle
+
+        Returns:
+            program_state (dict): A dict representing the state of program;
+                forecasts are not stored in the database and are empty
+        """
+        inventory = Inventory()
+        with self.lock:
+            for beer_type, num in self.connection.execute(
+                    "SELECT beer_type, num FROM inventory"):
+                inventory.get_inv_items_quantity(beer_type)["num"] = num
+            handle = {"inventory": inventory, "tanks": tanks}
+            batches = {}
+            columns = ["id", "beer_type", "volume"] + BATCH_PHASE_FIELDS
+            for row in self.connection.execute(
+                    "SELECT {} FROM batches".format(", ".join(columns))):
+                batch_values = dict(zip(columns, row))
+                batch = Batch(batch_values.pop("id"),
+                              batch_values.pop("beer_type"),
+                              batch_values.pop("volume"), handle)
+                for field in BATCH_DATETIME_FIELDS:
+                    batch_values[field] = from_db_datetime(
+                        batch_values[field])
+                batch_values["bottles_put_in_inventory"] = bool(
+                    batch_values["bottles_put_in_inventory"])
+                set_batch_phase_state(batch, batch_values)
+                batches[batch.id] = batch
+            orders = {order["invoice number"]: order
+                      for order in self.iter_orders("SELECT * FROM orders")}
+            reservations = {}
+            for reservation_id, tank, start, end, label in (
+                    self.connection.execute(
+                        "SELECT id, tank, start, end, label "
+                        "FROM reservations")):
+                reservations[reservation_id] = {
+                    "id": reservation_id, "tank": tank,
+                    "start": from_db_datetime(start),
+                    "end": from_db_datetime(end), "label": label}
+        program_state = {"batches": batches, "orders": orders,
+                         "inventory": inventory, "forecasts": {},
+                         "reservations": reservations}
+        return program_state
+
+    def iter_orders(self, sql: str,
+                    parameters: Tuple[Any, ...] = ()) -> Iterator[
+                        Dict[str, str]]:
+        """Runs an order query and converts rows into order dicts
+
+        Args:
+            sql (str): A string representing SELECT * query on orders table
+            parameters (tuple): A tuple representing the query parameters
+
+        Returns:
+            (Iterator): An iterator of dicts representing customer orders
+        """
+        for row in self.connection.execute(sql, parameters):
+            yield {"invoice number": row[0], "customer": row[1],
+                   "date required": from_db_date(row[2]), "recipe": row[3],
+                   "gyle number": row[4], "quantity ordered": row[5],
+                   "dispatched": row[6]}
+
+    def query_orders(self, recipe: Optional[str] = None,
+                     dispatched: Optional[str] = None,
+                     date_from: Optional[datetime] = None,
+                     date_to: Optional[datetime] = None, offset: int = 0,
+                     limit: int = 50, descending: bool = False
+                     ) -> Tuple[List[Dict[str, str]], int]:
+        """Gets one page of orders sorted by date required via the indexes
+
+        Args:
+            recipe (str): A string representing recipe; None for any recipe
+            dispatched (str): "dispatched", "" (not dispatched) or None (any)
+            date_from (datetime): Earliest date required; None for no bound
+            date_to (datetime): Latest date required; None for no bound
+            offset (int): An int representing the number of orders to skip
+            limit (int): An int representing the maximum number of orders
+            descending (bool): Bool where True sorts from latest to earliest
+
+        Returns:
+            (tuple):
+                orders (list): A list of dicts repres. the orders on the page
+                total (int): An int representing the number of matching orders
+        """
+        conditions = []
+        parameters = []
+        if recipe is not None:
+            conditions.append("recipe = ?")
+            parameters.append(recipe)
+        if dispatched is not None:
+            conditions.append("dispatched = ?")
+            parameters.append(dispatched)
+        if date_from is not None:
+            conditions.append("date_required >= ?")
+            parameters.append(date_from.strftime("%Y-%m-%d"))
+        if date_to is not None:
+            conditions.append("date_required <= ?")
+            parameters.append(date_to.strftime("%Y-%m-%d"))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        direction = " DESC" if descending else ""
+        sql = ("SELECT * FROM orders" + where + " ORDER BY date_required"
+               + direction + ", invoice_number" + direction
+               + " LIMIT ? OFFSET ?")
+        with self.lock:
+            total = self.connection.execute(
+                "SELECT COUNT(*) FROM orders" + where,
+                tuple(parameters)).fetchone()[0]
+            orders = list(self.iter_orders(
+                sql, tuple(parameters + [limit, offset])))
+        return orders, total
+
+    def get_used_tanks(self) -> List[str]:
+        """Gets names of all tanks that are in use by a batch via tank index
+
+        Args:
+            No arguments
+
+        Returns:
+            (list): A list representing the names of all used tanks
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT phase_current_tank FROM batches "
+                + "WHERE phase_current_tank NOT IN ('', 'not applicable')")
+            return [row[0] for row in rows]
+
+    def count_batches_by_phase(self) -> Dict[str, int]:
+        """Counts batches per production phase via the phase index
+
+        Args:
+            No arguments
+
+        Returns:
+            (dict): A dict mapping phases to their number of batches
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT phase_current, COUNT(*) FROM batches "
+                + "GROUP BY phase_current")
+            return dict(rows.fetchall())
+
+    def rotate(self) -> int:
+        """Returns number of written changes; the tables need no rotation
+
+        Args:
+            No arguments
+
+        Returns:
+            (int): An int representing the last sequence number
+        """
+        return self.last_seq
+
+    def discard_upto(self, seq: int) -> None:
+        """Does nothing, as no journal files are kept next to the database
+
+        Args:
+            seq (int): An int representing last sequence number of snapshot
+
+        Returns:
+            No returns
+        """
+
+    def read_records(self, after_seq: int) -> Iterator[Tuple[int, str, Any]]:
+        """Yields no records, as the tables already hold the current state
+
+        Args:
+            after_seq (int): Ignored
+
+        Returns:
+            (Iterator): An empty iterator
+        """
+        return iter([])
+
+    def close(self) -> None:
+        """Closes the database connection
+
+        Args:
+            No arguments
+
+        Returns:
+            No returns
+        """
+        with self.lock:
+            self.connection.close()